@@ -0,0 +1,392 @@
+'''Benchmark the request hot paths of the web app.
+
+Seeds a throwaway SQLite database with N users x M days of results, then drives
+/game, /guess, /get-game-result, /get-user-stats and /leaderboard and reports
+p50/p95/p99 latency, throughput, allocations and database queries per route.
+
+By default requests go through Flask's test client in this process. With
+--gunicorn a local gunicorn is started on the same database and hit over HTTP
+instead (allocations and query counts are only measured in-process).
+
+Logins are skipped: requests carry an X-Bench-User header and a fake user
+loader turns it into a user. Results are written as JSON, and --baseline
+compares them against an earlier run so regressions show up.
+
+    python benchmarks/bench_app.py --users 200 --days 30 --requests 500
+    python benchmarks/bench_app.py --baseline benchmarks/baseline.json
+
+webapp/data/words.txt has to exist, same as for running the app.'''
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+WEBAPP_DIR = os.path.join(os.path.dirname(BENCH_DIR), "webapp")
+
+BENCH_USER_HEADER = "X-Bench-User"
+ROUTES = ["/game", "/guess", "/get-game-result", "/get-user-stats", "/leaderboard"]
+# routes that add guesses to today's boards. Only one can run per benchmark, they'd fight over the rows
+WRITE_ROUTES = ["/guess", "/update-game-result"]
+# measured per route when comparing against a baseline
+COMPARED_METRICS = ["p50_ms", "p95_ms", "p99_ms", "queries_per_request", "allocated_kb_per_request"]
+# wrong guesses per user in the plan for a write route, one less than the game allows
+GUESSES_PER_USER = 5
+
+
+def install_bench_login(app):
+    '''Replace Google sign-in with a fake user loader that trusts the X-Bench-User header'''
+    from flask import request
+    from models import User
+
+    login_manager = app.login_manager
+
+    @login_manager.request_loader
+    def load_bench_user(req=None):
+        user_id = request.headers.get(BENCH_USER_HEADER)
+        if not user_id:
+            return None
+        return User.from_identity((user_id, user_id, f"{user_id}@bench.invalid"))
+
+
+def configure_environment(db_path):
+    '''Settings for the app under test. Has to run before the app is imported'''
+    os.environ["DATABASE_URL"] = "sqlite:///" + db_path
+    os.environ["LOG_FILE"] = ""
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("FLASK_SECRET_KEY", "bench")
+
+
+def seed_database(n_users, n_days, seed=42):
+    '''Create users and finished games for the days before today. Returns the user ids'''
+    from database import db_session, engine
+    from models import DailyStats, Result, User, UserStats, get_language
+    from scoring import pack_board, score_board
+
+    rng = random.Random(seed)
+    language = get_language()
+    words = list(language.word_index)
+    todays_idx = language.todays_idx
+
+    user_ids = [f"bench-{i:05d}" for i in range(n_users)]
+    # looked up before the transaction, the first lookup may save the word schedule
+    answers = {todays_idx - day: language.get_daily_word(todays_idx - day) for day in range(1, n_days + 1)}
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), [
+            {"user_id": user_id, "name": user_id, "email": f"{user_id}@bench.invalid"} for user_id in user_ids
+        ])
+        for day in range(1, n_days + 1):
+            game_date_idx = todays_idx - day
+            answer = answers[game_date_idx]
+            rows = []
+            for user_id in user_ids:
+                n_guesses = rng.randint(1, Result.MAX_ATTEMPTS)
+                won = rng.random() < 0.8
+                guesses = [rng.choice(words) for _ in range(n_guesses - 1 if won else n_guesses)]
+                if won:
+                    guesses.append(answer)
+                states, game_won = score_board(guesses, answer)
+                game_lost = not game_won and len(guesses) >= Result.MAX_ATTEMPTS
+                rows.append({
+                    "user_id": user_id,
+                    "game_date_idx": game_date_idx,
+                    "language_code": language.language_code,
+                    "word_length": language.word_length,
+                    "num_attempts": len(guesses),
+                    "guesses": "".join(guesses),
+                    "states": pack_board(states, language.word_length),
+                    "game_over": game_won or game_lost,
+                    "game_lost": game_lost,
+                    "game_won": game_won,
+                })
+            conn.execute(Result.__table__.insert(), rows)
+    UserStats.backfill()
+    DailyStats.backfill()
+    db_session.remove()
+    return user_ids
+
+
+def request_plan(route, user_ids, n_requests, words, answer):
+    '''(method, path, user_id, json body) for each request to a route'''
+    plan = []
+    if route in WRITE_ROUTES:
+        # each user gets at most 5 wrong guesses so every request adds a row
+        guesses = [word for word in words if word != answer]
+        rng = random.Random(7)
+        for row in range(GUESSES_PER_USER):
+            for user_id in user_ids:
+                if len(plan) == n_requests:
+                    return plan
+                body = {"guess": rng.choice(guesses)}
+                if route == "/guess":
+                    body.update(row=row, key=f"{user_id}-{row}")
+                plan.append(("POST", route, user_id, body))
+        return plan
+    for i in range(n_requests):
+        plan.append(("GET", route, user_ids[i % len(user_ids)], None))
+    return plan
+
+
+def percentile(values, pct):
+    '''Nearest-rank percentile of a list of numbers'''
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100 * len(ordered))))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(latencies, elapsed, statuses):
+    '''Latency percentiles and throughput for one route'''
+    latencies_ms = [latency * 1000 for latency in latencies]
+    return {
+        "requests": len(latencies),
+        "p50_ms": percentile(latencies_ms, 50),
+        "p95_ms": percentile(latencies_ms, 95),
+        "p99_ms": percentile(latencies_ms, 99),
+        "mean_ms": statistics.fmean(latencies_ms) if latencies_ms else None,
+        "throughput_rps": len(latencies) / elapsed if elapsed else None,
+        "statuses": statuses,
+    }
+
+
+class QueryCounter:
+    '''Counts statements sent to the database through SQLAlchemy engine events'''
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+
+def run_in_process(user_ids, n_requests, routes, alloc_sample):
+    '''Drive the routes through Flask's test client'''
+    from app import create_app
+    from database import engine
+    from models import get_language
+
+    app = create_app()
+    install_bench_login(app)
+    client = app.test_client()
+    queries = QueryCounter(engine)
+    language = get_language()
+    words = list(language.word_index)
+
+    results = {}
+    for route in routes:
+        plan = request_plan(route, user_ids, n_requests, words, language.daily_word)
+        # every guess has to add a new row, so the allocation sample can't replay timed guesses
+        if route in WRITE_ROUTES:
+            timed, extra = plan[:max(1, len(plan) - alloc_sample)], plan[max(1, len(plan) - alloc_sample):]
+        else:
+            timed, extra = plan, plan[:alloc_sample]
+
+        def send(method, path, user_id, body):
+            headers = {BENCH_USER_HEADER: user_id}
+            if method == "POST":
+                return client.post(path, json=body, headers=headers, base_url="http://localhost")
+            return client.get(path, headers=headers, base_url="http://localhost")
+
+        statuses = {}
+        latencies = []
+        queries.count = 0
+        started = time.perf_counter()
+        for method, path, user_id, body in timed:
+            t0 = time.perf_counter()
+            response = send(method, path, user_id, body)
+            latencies.append(time.perf_counter() - t0)
+            statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+        elapsed = time.perf_counter() - started
+        summary = summarize(latencies, elapsed, statuses)
+        summary["queries_per_request"] = queries.count / len(timed)
+
+        # allocations are measured separately, tracemalloc slows everything down
+        allocated = []
+        tracemalloc.start()
+        for method, path, user_id, body in extra:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            send(method, path, user_id, body)
+            allocated.append(tracemalloc.get_traced_memory()[1] - before)
+        tracemalloc.stop()
+        summary["allocated_kb_per_request"] = statistics.fmean(allocated) / 1024 if allocated else None
+
+        results[route] = summary
+    return results
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def run_gunicorn(user_ids, n_requests, routes, workers, concurrency):
+    '''Start a local gunicorn on the bench database and drive the routes over HTTP'''
+    import requests
+    from models import get_language
+
+    if shutil.which("gunicorn") is None:
+        sys.exit("gunicorn is not installed")
+
+    port = _free_port()
+    server = subprocess.Popen(
+        [
+            "gunicorn", "--chdir", WEBAPP_DIR, "--pythonpath", BENCH_DIR,
+            "--bind", f"127.0.0.1:{port}", "--workers", str(workers), "bench_wsgi:app",
+        ],
+        env=os.environ.copy(),
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(100):
+            try:
+                requests.get(base_url + "/", timeout=5)
+                break
+            except requests.RequestException:
+                time.sleep(0.1)
+
+        language = get_language()
+        words = list(language.word_index)
+        session = requests.Session()
+        session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=concurrency))
+
+        def send(item):
+            method, path, user_id, body = item
+            t0 = time.perf_counter()
+            response = session.request(method, base_url + path, json=body, headers={BENCH_USER_HEADER: user_id})
+            return time.perf_counter() - t0, response.status_code
+
+        results = {}
+        for route in routes:
+            plan = request_plan(route, user_ids, n_requests, words, language.daily_word)
+            started = time.perf_counter()
+            with ThreadPoolExecutor(concurrency) as pool:
+                timings = list(pool.map(send, plan))
+            elapsed = time.perf_counter() - started
+            statuses = {}
+            for _, status in timings:
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+            summary = summarize([latency for latency, _ in timings], elapsed, statuses)
+            summary["queries_per_request"] = None
+            summary["allocated_kb_per_request"] = None
+            results[route] = summary
+        return results
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+def compare(results, baseline, threshold):
+    '''Metrics that got worse than the baseline by more than `threshold` (1.2 = 20%)'''
+    regressions = []
+    for route, summary in results["routes"].items():
+        old = baseline.get("routes", {}).get(route)
+        if not old:
+            continue
+        for metric in COMPARED_METRICS:
+            new_value, old_value = summary.get(metric), old.get(metric)
+            if new_value is None or not old_value:
+                continue
+            if new_value > old_value * threshold:
+                regressions.append(f"{route} {metric}: {old_value:.3f} -> {new_value:.3f}")
+    return regressions
+
+
+def print_table(results):
+    print(f"{'route':<22}{'req':>6}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}{'queries':>9}{'alloc KB':>10}")
+    for route, summary in results["routes"].items():
+        def fmt(value, width, digits=2):
+            return f"{value:>{width}.{digits}f}" if value is not None else f"{'-':>{width}}"
+        print(
+            f"{route:<22}{summary['requests']:>6}{fmt(summary['p50_ms'], 9)}{fmt(summary['p95_ms'], 9)}"
+            f"{fmt(summary['p99_ms'], 9)}{fmt(summary['throughput_rps'], 9, 1)}"
+            f"{fmt(summary['queries_per_request'], 9)}{fmt(summary['allocated_kb_per_request'], 10, 1)}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=200, help="users to seed (default 200)")
+    parser.add_argument("--days", type=int, default=30, help="days of results per user (default 30)")
+    parser.add_argument("--requests", type=int, default=500, help="requests per route (default 500)")
+    parser.add_argument("--routes", nargs="+", default=ROUTES, choices=ROUTES + ["/update-game-result"])
+    parser.add_argument("--alloc-sample", type=int, default=50, help="requests per route measured for allocations")
+    parser.add_argument("--gunicorn", action="store_true", help="benchmark a local gunicorn instead of the test client")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent HTTP requests with --gunicorn")
+    parser.add_argument("--output", default=os.path.join(BENCH_DIR, "latest.json"), help="where to write the results")
+    parser.add_argument("--baseline", help="earlier results to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2, help="slowdown that counts as a regression (default 1.2)")
+    args = parser.parse_args(argv)
+    if len(set(args.routes) & set(WRITE_ROUTES)) > 1:
+        parser.error("pick one of " + ", ".join(WRITE_ROUTES))
+    # the app expects to run from webapp/, so make paths absolute before changing directory
+    args.output = os.path.abspath(args.output)
+    if args.baseline:
+        args.baseline = os.path.abspath(args.baseline)
+
+    tmp_dir = tempfile.mkdtemp(prefix="wordle-bench-")
+    configure_environment(os.path.join(tmp_dir, "bench.db"))
+    os.chdir(WEBAPP_DIR)
+    sys.path.insert(0, WEBAPP_DIR)
+    try:
+        from database import init_db
+        init_db()
+        seed_started = time.perf_counter()
+        user_ids = seed_database(args.users, args.days)
+        seed_seconds = time.perf_counter() - seed_started
+
+        if args.gunicorn:
+            routes = run_gunicorn(user_ids, args.requests, args.routes, args.workers, args.concurrency)
+        else:
+            routes = run_in_process(user_ids, args.requests, args.routes, args.alloc_sample)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    results = {
+        "meta": {
+            "mode": "gunicorn" if args.gunicorn else "test_client",
+            "users": args.users,
+            "days": args.days,
+            "requests_per_route": args.requests,
+            "seed_seconds": seed_seconds,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        },
+        "routes": routes,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print_table(results)
+    print(f"\nWrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("\nRegressions against " + args.baseline + ":")
+            for regression in regressions:
+                print("  " + regression)
+            return 1
+        print("\nNo regressions against " + args.baseline)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
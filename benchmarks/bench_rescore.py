@@ -0,0 +1,150 @@
+'''Benchmark re-scoring every board of a day, as `flask rescore-day` does.
+
+Seeds a throwaway SQLite database with N boards for one day, some of them
+saved with the wrong outcome, and times:
+
+- scoring the boards one at a time, each guess scored again for every board
+- scoring them batched the way Result.rescore_day() does, each distinct guess
+  scored once for the whole day
+- Result.rescore_day() itself, reading the boards and checking them
+- Result.rescore_day(fix=True), which also saves the corrected boards
+
+The seeded guesses are drawn evenly from the whole word list, which gives a
+day more distinct guesses than real players do and is the worst case for
+batching. Even then the scoring is a fraction of reading the boards, so a
+vectorized scorer wouldn't make rescore_day() much faster.
+
+    python benchmarks/bench_rescore.py --boards 100000'''
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from bench_app import WEBAPP_DIR, configure_environment, seed_database
+
+
+def timed(func, *args, **kwargs):
+    '''(result, seconds)'''
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def corrupt_boards(game_date_idx, fraction, seed=42):
+    '''Flip the outcome of a fraction of a day's boards. Returns how many'''
+    from sqlalchemy import select, update
+
+    from database import db_session
+    from models import Result
+
+    rng = random.Random(seed)
+    rows = db_session.execute(select(Result.result_id, Result.game_won).where(Result.game_date_idx == game_date_idx))
+    changes = [
+        {"result_id": row.result_id, "game_won": not row.game_won}
+        for row in rows if rng.random() < fraction
+    ]
+    if changes:
+        db_session.execute(update(Result), changes)
+        db_session.commit()
+    db_session.remove()
+    return len(changes)
+
+
+def run(n_boards, fraction):
+    from sqlalchemy import select
+
+    from database import db_session
+    from models import Result, get_language
+    from scoring import score_board
+
+    language = get_language()
+    game_date_idx = language.todays_idx - 1
+    answer = language.get_daily_word(game_date_idx)
+    corrupted = corrupt_boards(game_date_idx, fraction)
+
+    width = language.word_length
+    boards = [
+        [row.guesses[i:i + width] for i in range(0, len(row.guesses), width)]
+        for row in db_session.execute(select(Result.guesses).where(Result.game_date_idx == game_date_idx))
+    ]
+    db_session.remove()
+    distinct = len({guess for guesses in boards for guess in guesses})
+
+    _, one_at_a_time = timed(lambda: [score_board(guesses, answer) for guesses in boards])
+    scored = {}
+    _, batched = timed(lambda: [score_board(guesses, answer, scored) for guesses in boards])
+    summary, check = timed(Result.rescore_day, game_date_idx, answer)
+    db_session.remove()
+    fixed, fix = timed(Result.rescore_day, game_date_idx, answer, fix=True)
+    db_session.remove()
+
+    return {
+        "boards": len(boards),
+        "distinct_guesses": distinct,
+        "corrupted": corrupted,
+        "mismatched": summary["mismatched"],
+        "fixed": fixed["mismatched"],
+        "seconds": {
+            "score_one_at_a_time": one_at_a_time,
+            "score_batched": batched,
+            "rescore_day": check,
+            "rescore_day_fix": fix,
+        },
+        "boards_per_second": {
+            "score_one_at_a_time": len(boards) / one_at_a_time,
+            "score_batched": len(boards) / batched,
+            "rescore_day": len(boards) / check,
+            "rescore_day_fix": len(boards) / fix,
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--boards", type=int, default=100000, help="boards to seed for the day (default 100000)")
+    parser.add_argument("--wrong", type=float, default=0.01,
+                        help="fraction of boards saved with the wrong outcome (default 0.01)")
+    parser.add_argument("--output", help="where to write the results as JSON")
+    args = parser.parse_args(argv)
+    if args.output:
+        args.output = os.path.abspath(args.output)
+
+    tmp_dir = tempfile.mkdtemp(prefix="wordle-bench-")
+    configure_environment(os.path.join(tmp_dir, "bench.db"))
+    os.chdir(WEBAPP_DIR)
+    sys.path.insert(0, WEBAPP_DIR)
+    try:
+        from database import init_db
+        init_db()
+        seed_database(args.boards, 1)
+        results = run(args.boards, args.wrong)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    results["meta"] = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+
+    print(f"{results['boards']} boards, {results['distinct_guesses']} distinct guesses, "
+          f"{results['corrupted']} saved wrong")
+    print(f"{'':<22}{'seconds':>10}{'boards/s':>14}")
+    for name, seconds in results["seconds"].items():
+        print(f"{name:<22}{seconds:>10.3f}{results['boards_per_second'][name]:>14,.0f}")
+    if results["mismatched"] != results["corrupted"] or results["fixed"] != results["corrupted"]:
+        print("rescore_day didn't find every board that was saved wrong")
+        return 1
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nWrote {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,6 @@
+'''gunicorn entry point for bench_app.py --gunicorn: the real app with the fake bench login'''
+from bench_app import install_bench_login
+
+from wsgi import app
+
+install_bench_login(app)
@@ -0,0 +1,112 @@
+'''Shared fixtures.
+
+config.py and database.py read their settings when they're imported, so the
+environment is set up here before anything from webapp/ is. Every test that
+asks for `db` gets a database of its own, and the default game plays the
+words in WORDS instead of data/words.txt.'''
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+TMP_DIR = tempfile.mkdtemp(prefix="word-challenge-tests-")
+DB_PATH = os.path.join(TMP_DIR, "test.db")
+WEBAPP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "webapp")
+
+os.environ.update({
+    "DATABASE_URL": "sqlite:///" + DB_PATH,
+    "FLASK_SECRET_KEY": "tests",
+    "LOG_FILE": "",
+    "LANGUAGES": "",
+    "HINTS_ENABLED": "False",
+    "METRICS_ENABLED": "False",
+    "WRITE_QUEUE_ENABLED": "False",
+    "SOLVER_CACHE_DIR": os.path.join(TMP_DIR, "cache"),
+    "WORD_FILE_DIR": os.path.join(TMP_DIR, "cache"),
+})
+sys.path.insert(0, WEBAPP_DIR)
+
+# the default game's words. load_words() shuffles them into the daily word order
+WORDS = (
+    "audit", "crane", "slate", "mourn", "pious", "fluky", "eerie", "llama",
+    "proxy", "token", "vault", "guard", "cyber", "patch", "phish", "spoof",
+)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def data_dir():
+    '''Data directory of the default game, with WORDS as its words.txt'''
+    import models
+    import utils
+
+    path = os.path.join(TMP_DIR, "data")
+    os.makedirs(path, exist_ok=True)
+    for name in ("characters.txt", "keyboard.json", "language_config.json"):
+        shutil.copy(os.path.join(WEBAPP_DIR, "data", name), path)
+    with open(os.path.join(path, "words.txt"), "w", encoding="utf-8") as f:
+        f.write("\n".join(WORDS) + "\n")
+    # Language can't be built without one
+    open(os.path.join(path, "words_supplement.txt"), "w").close()
+    original = utils.DATA_DIR
+    utils.DATA_DIR = models.DATA_DIR = path
+    yield path
+    utils.DATA_DIR = models.DATA_DIR = original
+    shutil.rmtree(TMP_DIR, ignore_errors=True)
+
+
+@pytest.fixture
+def empty_db():
+    '''An empty database file, and empty caches in front of it. Yields the engine'''
+    import leaderboard
+    import models
+    from database import db_session, engine
+
+    db_session.remove()
+    engine.dispose()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(DB_PATH + suffix):
+            os.remove(DB_PATH + suffix)
+    models._word_schedules.clear()
+    models.user_cache.entries.clear()
+    leaderboard.snapshot_cache.clear()
+    yield engine
+    db_session.remove()
+
+
+@pytest.fixture
+def db(empty_db):
+    '''A new database with every table created'''
+    from database import db_session, init_db
+
+    init_db()
+    return db_session
+
+
+@pytest.fixture
+def language(db):
+    '''The default game's Language'''
+    from models import get_language
+    return get_language()
+
+
+@pytest.fixture
+def app(db):
+    from app import create_app
+    return create_app({"TESTING": True})
+
+
+@pytest.fixture
+def login(app):
+    '''login(user_id) -> a test client signed in as a new user'''
+    from models import User
+
+    def login(user_id):
+        User.create_user(user_id, user_id.title(), f"{user_id}@example.com")
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session["_user_id"] = user_id
+            session["_fresh"] = True
+        return client
+    return login
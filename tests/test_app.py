@@ -0,0 +1,49 @@
+'''What importing the app and create_app() cost, and `flask init-db`'''
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import WEBAPP_DIR
+
+
+def imported_modules(code, **env):
+    '''Modules `python -X importtime -c code` imports, run in webapp/ with env added'''
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=WEBAPP_DIR, env={**os.environ, **env}, capture_output=True, text=True, check=True,
+    )
+    # lines look like "import time:       123 |        456 |   package.module"
+    return {
+        line.rsplit("|", 1)[1].strip()
+        for line in process.stderr.splitlines() if line.startswith("import time:") and "|" in line
+    }
+
+
+def test_create_app_leaves_the_database_alone(tmp_path):
+    db_path = tmp_path / "untouched.db"
+    modules = imported_modules("import app; app.create_app()", DATABASE_URL=f"sqlite:///{db_path}")
+    assert "app" in modules
+    # Google sign-in's libraries wait for someone to sign in
+    assert "requests" not in modules and "oauthlib" not in modules
+    assert not db_path.exists()
+
+
+def test_no_numpy_without_hints():
+    modules = imported_modules("import app; app.create_app()", HINTS_ENABLED="False")
+    assert "app" in modules
+    assert "solver" not in modules and "numpy" not in modules
+
+
+def test_init_db_command(empty_db):
+    from app import create_app
+    from database import check_db
+    from models import DailyWord
+
+    with pytest.raises(RuntimeError, match="init-db"):
+        check_db()
+    result = create_app({"TESTING": True}).test_cli_runner().invoke(args=["init-db"])
+    assert result.exit_code == 0, result.output
+    check_db()
+    assert DailyWord.query.count() > 0
@@ -0,0 +1,80 @@
+'''The saved daily word schedule and playing earlier days' games'''
+import random
+
+from utils import get_todays_idx
+
+
+def test_word_list_is_shuffled_as_before(language):
+    from conftest import WORDS
+
+    # the order the global random.seed(42) used to give
+    words = list(WORDS)
+    random.seed(42)
+    random.shuffle(words)
+    assert list(language.word_list) == words
+
+
+def test_schedule_keeps_the_words_it_saved(language):
+    from models import DailyWord, get_word_schedule
+
+    word_schedule = get_word_schedule(language.key)
+    today = get_todays_idx()
+    words = language.word_list
+    assert language.get_daily_word(today) == words[today % len(words)]
+    assert DailyWord.query.count() == today + word_schedule.days_ahead + 1
+
+    # a new word list only changes days that weren't scheduled yet
+    reversed_words = words[::-1]
+    assert word_schedule.get_word(today, reversed_words) == words[today % len(words)]
+    far = today + word_schedule.days_ahead + 10
+    assert word_schedule.get_word(far, reversed_words) == reversed_words[far % len(words)]
+
+    # and another worker starting up reads the same schedule
+    word_schedule.words = {}
+    word_schedule.ensure(reversed_words)
+    assert word_schedule.get_word(today, reversed_words) == words[today % len(words)]
+
+
+def test_archive_lists_earlier_games(app, login, language, monkeypatch):
+    monkeypatch.setitem(app.config, "ARCHIVE_PAGE_SIZE", 3)
+    today = get_todays_idx()
+    client = login("alice")
+    answer = language.get_daily_word(today - 2)
+    client.post("/update-game-result", json={"guess": answer, "game_date_idx": today - 2})
+
+    page = client.get("/archive").get_json()
+    assert [game["game_date_idx"] for game in page["games"]] == [today - 1, today - 2, today - 3]
+    assert page["games"][1]["game_won"] and page["games"][1]["num_attempts"] == 1
+    assert not page["games"][0]["game_over"]
+    assert page["games"][1]["url"] == f"/game/{today - 2}"
+    assert page["next_before"] == today - 3
+    assert client.get("/archive?before=nope").status_code == 400
+    assert client.get(f"/archive?before={today + 1}").status_code == 400
+
+
+def test_archived_game_pages(login):
+    today = get_todays_idx()
+    client = login("alice")
+    assert client.get(f"/game/{today - 1}").status_code == 200
+    assert client.get(f"/game/{today}").headers["Location"].endswith("/game")
+    assert client.get(f"/game/{today + 1}").status_code == 404
+
+
+def test_archive_games_are_played_against_their_own_word(login, language):
+    from models import DailyStats, UserStats
+
+    today = get_todays_idx()
+    client = login("alice")
+    day = next(idx for idx in range(today - 1, 0, -1)
+               if language.get_daily_word(idx) != language.get_daily_word(today))
+    body = client.post("/update-game-result", json={
+        "guess": language.get_daily_word(day), "game_date_idx": day,
+    }).get_json()
+    assert body["game_won"]
+    assert client.get(f"/get-game-result?game_date_idx={day}").get_json()["game_won"]
+    assert not client.get("/get-game-result").get_json()["game_over"]
+    assert client.post("/update-game-result", json={"guess": "crane", "game_date_idx": today + 1}).status_code == 400
+
+    # and don't count towards stats
+    assert UserStats.get_stats("alice").to_dict()["games"] == 0
+    assert DailyStats.get_stats(day).to_dict()["games"] == 0
@@ -0,0 +1,139 @@
+'''The word list asset and the cached game page: fingerprints, encodings and cache headers'''
+import gzip
+import json
+
+import pytest
+
+import compression
+from assets import CompressedAsset, WordListAsset
+
+WORDS = ("slate", "crane", "audit")
+
+
+def test_fingerprint_follows_the_words():
+    asset = WordListAsset(WORDS)
+    assert json.loads(asset.body) == sorted(WORDS)
+    assert asset.filename == f"words.{asset.fingerprint}.json"
+    assert WordListAsset(reversed(WORDS)).filename == asset.filename
+    assert WordListAsset(WORDS + ("pious",)).filename != asset.filename
+    assert gzip.decompress(asset.gzip_body) == asset.body
+
+
+@pytest.fixture
+def asset():
+    return CompressedAsset(b"x" * 1000, "text/plain")
+
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    (None, None),
+    ("", None),
+    ("gzip", "gzip"),
+    ("gzip, deflate", "gzip"),
+    ("gzip;q=0, identity", None),
+    ("identity", None),
+    ("*", "gzip"),
+    ("*;q=0", None),
+])
+def test_encoding_follows_quality(asset, accept_encoding, expected):
+    asset.brotli_body = None  # the same with or without brotli installed
+    body, encoding, _ = asset.encoded_body(accept_encoding)
+    assert encoding == expected
+    if encoding == "gzip":
+        assert gzip.decompress(body) == asset.body
+    else:
+        assert body == asset.body
+
+
+def test_brotli_only_when_preferred(asset):
+    asset.brotli_body = b"brotli"
+    assert asset.encoded_body("gzip, br")[1] == ("br" if compression.brotli else "gzip")
+    assert asset.encoded_body("gzip, br;q=0")[1] == "gzip"
+    assert asset.encoded_body("br;q=0.5, gzip")[1] == "gzip"
+
+
+def test_each_encoding_has_its_own_etag(asset):
+    asset.brotli_body = None
+    _, _, identity_etag = asset.encoded_body("identity")
+    _, _, gzip_etag = asset.encoded_body("gzip")
+    assert identity_etag != gzip_etag
+    assert identity_etag == asset.etag
+
+
+def test_game_page_honours_refused_gzip(login, language):
+    client = login("alice")
+    response = client.get("/game", headers={"Accept-Encoding": "gzip;q=0, identity"})
+    assert response.status_code == 200
+    assert "Content-Encoding" not in response.headers
+    assert b"<html" in response.data.lower()
+
+    gzipped = client.get("/game", headers={"Accept-Encoding": "gzip"})
+    assert gzipped.headers["Content-Encoding"] == "gzip"
+    assert gzipped.headers["ETag"] != response.headers["ETag"]
+
+    # a cached gzip copy isn't a match for a client that can't read gzip
+    revalidated = client.get("/game", headers={
+        "Accept-Encoding": "identity",
+        "If-None-Match": gzipped.headers["ETag"],
+    })
+    assert revalidated.status_code == 200
+    again = client.get("/game", headers={"Accept-Encoding": "gzip", "If-None-Match": gzipped.headers["ETag"]})
+    assert again.status_code == 304
+
+
+def test_word_list_is_served_for_a_year(login, language):
+    from conftest import WORDS as GAME_WORDS
+
+    client = login("alice")
+    asset = language.word_list_asset
+    url = f"/assets/{asset.filename}"
+    assert url.encode() in client.get("/game").data
+
+    response = client.get(url)
+    assert response.get_json() == sorted(GAME_WORDS)
+    cache_control = response.cache_control
+    assert cache_control.public and cache_control.immutable and cache_control.max_age == 31536000
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert client.get(url, headers={"If-None-Match": response.headers["ETag"]}).status_code == 304
+
+    gzipped = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert gzipped.headers["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(gzipped.data)) == sorted(GAME_WORDS)
+    # an old fingerprint
+    assert client.get("/assets/words.0123456789abcdef.json").status_code == 404
+
+
+def test_game_page_is_rendered_once_for_everyone(app, login, language, monkeypatch):
+    import app as webapp
+
+    monkeypatch.setattr(webapp, "game_page_cache", webapp.PageCache())
+    alice, bob = login("alice"), login("bob")
+    guess = next(word for word in ("crane", "slate") if word != language.daily_word)
+    alice.post("/update-game-result", json={"guess": guess})
+
+    page = alice.get("/game")
+    assert page.status_code == 200
+    # the board is loaded afterwards, so alice's guess isn't on the page
+    assert guess.encode() not in page.data
+    assert bob.get("/game").headers["ETag"] == page.headers["ETag"]
+    assert webapp.game_page_cache.stats == {"hits": 1, "renders": 1}
+    assert page.cache_control.private and 0 < page.cache_control.max_age <= 300
+    assert bob.get("/game", headers={"If-None-Match": page.headers["ETag"]}).status_code == 304
+    # an archived game is a page of its own
+    assert alice.get(f"/game/{language.todays_idx - 1}").headers["ETag"] != page.headers["ETag"]
+
+    monkeypatch.setitem(app.config, "GAME_PAGE_PUBLIC", True)
+    assert alice.get("/game").cache_control.public
+
+
+def test_page_cache_renders_again_for_a_new_version():
+    from assets import PageCache
+
+    cache = PageCache(max_size=2)
+    v1, v2 = object(), object()
+    assert cache.get("a", v1, lambda: "one").body == b"one"
+    assert cache.get("a", v1, lambda: "two").body == b"one"
+    assert cache.get("a", v2, lambda: "two").body == b"two"
+    cache.get("b", v1, lambda: "b")
+    cache.get("c", v1, lambda: "c")
+    assert list(cache.entries) == ["b", "c"]
+    assert cache.stats == {"hits": 1, "renders": 4}
@@ -0,0 +1,52 @@
+'''benchmarks/: bench_app.py's numbers, the baseline gate and short in-process runs'''
+import os
+import sys
+
+from conftest import WEBAPP_DIR
+
+sys.path.insert(0, os.path.join(os.path.dirname(WEBAPP_DIR), "benchmarks"))
+
+import bench_app  # noqa: E402
+import bench_rescore  # noqa: E402
+from bench_app import ROUTES, compare, percentile  # noqa: E402
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([3, 1, 2], 100) == 3
+    assert percentile([5], 1) == 5
+    assert percentile([], 50) is None
+
+
+def test_compare_reports_slower_routes_only():
+    baseline = {"routes": {
+        "/game": {"p50_ms": 1.0, "p95_ms": 2.0, "queries_per_request": 0},
+        "/get-user-stats": {"p50_ms": 1.0},
+    }}
+    results = {"routes": {
+        "/game": {"p50_ms": 1.1, "p95_ms": 3.0, "queries_per_request": 4},
+        "/get-user-stats": {"p50_ms": None},
+        "/get-game-result": {"p50_ms": 100.0},
+    }}
+    assert compare(results, baseline, 1.2) == ["/game p95_ms: 2.000 -> 3.000"]
+    assert compare(results, baseline, 2.0) == []
+
+
+def test_in_process_run(app):
+    user_ids = bench_app.seed_database(n_users=3, n_days=2)
+    assert len(user_ids) == 3
+    results = bench_app.run_in_process(user_ids, n_requests=4, routes=ROUTES, alloc_sample=2)
+    assert list(results) == ROUTES
+    for route, summary in results.items():
+        assert summary["statuses"] == {"200": summary["requests"]}, route
+        assert summary["p50_ms"] <= summary["p99_ms"]
+        assert summary["queries_per_request"] >= 0
+
+
+def test_rescore_run_finds_the_boards_saved_wrong(app):
+    bench_app.seed_database(n_users=20, n_days=1)
+    results = bench_rescore.run(20, 0.5)
+    assert results["boards"] == 20 and results["corrupted"] > 0
+    assert results["mismatched"] == results["fixed"] == results["corrupted"]
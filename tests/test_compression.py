@@ -0,0 +1,142 @@
+'''CompressionMiddleware: gzip negotiation, ETags, 304s and Vary'''
+import gzip
+
+import pytest
+from flask import Flask, jsonify
+
+import compression
+from compression import CompressionMiddleware
+
+BIG = {"words": ["crane"] * 200}
+SMALL = {"word": "crane"}
+
+
+@pytest.fixture
+def client():
+    '''A bare app behind the middleware, compressing anything from 100 bytes'''
+    app = Flask(__name__)
+
+    @app.route("/big")
+    def big():
+        return BIG
+
+    @app.route("/small")
+    def small():
+        return SMALL
+
+    @app.route("/tagged")
+    def tagged():
+        response = jsonify(BIG)
+        response.set_etag("v1")
+        return response
+
+    @app.route("/cookie")
+    def cookie():
+        response = jsonify(BIG)
+        response.set_cookie("session", "new")
+        response.headers["Vary"] = "Cookie"
+        return response
+
+    @app.route("/post", methods=["POST"])
+    def post():
+        return BIG
+
+    app.wsgi_app = CompressionMiddleware(app.wsgi_app, min_size=100)
+    return app.test_client()
+
+
+def get(client, path, encoding=None, etag=None):
+    headers = {}
+    if encoding is not None:
+        headers["Accept-Encoding"] = encoding
+    if etag is not None:
+        headers["If-None-Match"] = etag
+    return client.get(path, headers=headers)
+
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    (None, None),
+    ("", None),
+    ("identity", None),
+    ("gzip", "gzip"),
+    ("deflate, gzip;q=0.5", "gzip"),
+    ("gzip;q=0", None),
+    ("*", "gzip"),
+    ("br", None),
+])
+def test_encoding_without_brotli(client, monkeypatch, accept_encoding, expected):
+    monkeypatch.setattr(compression, "brotli", None)
+    assert get(client, "/big", accept_encoding).headers.get("Content-Encoding") == expected
+
+
+def test_gzip_when_accepted(client):
+    response = get(client, "/big", "gzip")
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert int(response.headers["Content-Length"]) == len(response.data)
+    assert gzip.decompress(response.data) == get(client, "/big").data
+
+
+def test_identity_when_gzip_is_not_accepted(client):
+    response = get(client, "/big", "gzip;q=0")
+    assert "Content-Encoding" not in response.headers
+    assert response.get_json() == BIG
+
+
+def test_small_responses_are_not_compressed(client):
+    response = get(client, "/small", "gzip")
+    assert "Content-Encoding" not in response.headers
+    assert "Vary" not in response.headers
+
+
+def test_etag_is_the_same_for_every_encoding(client):
+    plain = get(client, "/big")
+    gzipped = get(client, "/big", "gzip")
+    assert plain.headers["ETag"].startswith('W/"')
+    assert gzipped.headers["ETag"] == plain.headers["ETag"]
+    assert plain.headers["Cache-Control"] == "private, no-cache"
+    assert get(client, "/small").headers["ETag"] != plain.headers["ETag"]
+
+
+def test_strong_etag_of_the_view_is_weakened_when_compressed(client):
+    assert get(client, "/tagged").headers["ETag"] == '"v1"'
+    assert get(client, "/tagged", "gzip").headers["ETag"] == 'W/"v1"'
+
+
+@pytest.mark.parametrize("encoding", [None, "gzip"])
+def test_not_modified(client, encoding):
+    etag = get(client, "/big", encoding).headers["ETag"]
+    response = get(client, "/big", encoding, etag)
+    assert response.status_code == 304
+    assert response.data == b""
+    assert response.headers["ETag"] == etag
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert "Content-Type" not in response.headers and "Content-Encoding" not in response.headers
+
+    assert get(client, "/big", encoding, 'W/"something-else"').status_code == 200
+
+
+def test_vary_is_added_to(client):
+    assert get(client, "/cookie", "gzip").headers["Vary"] == "Cookie, Accept-Encoding"
+
+
+def test_responses_setting_cookies_get_etags_too(client):
+    response = get(client, "/cookie")
+    etag = response.headers["ETag"]
+    not_modified = get(client, "/cookie", etag=etag)
+    assert not_modified.status_code == 304
+    # the cookie isn't lost with the body
+    assert not_modified.headers["Set-Cookie"].startswith("session=new")
+
+
+def test_only_gets_get_etags(client):
+    response = client.post("/post", headers={"Accept-Encoding": "gzip"})
+    assert "ETag" not in response.headers
+    assert response.headers["Content-Encoding"] == "gzip"
+
+
+def test_first_saved_board_gets_an_etag(login):
+    client = login("alice")
+    # signing in changed the session, so this one sets a cookie
+    first = client.get("/get-game-result")
+    assert "Set-Cookie" in first.headers and "ETag" in first.headers
+    assert client.get("/get-game-result", headers={"If-None-Match": first.headers["ETag"]}).status_code == 304
@@ -0,0 +1,124 @@
+'''BoardConstraints, hard mode and counting the words that still fit with ConstraintIndex'''
+import pytest
+
+from constraints import BoardConstraints, ConstraintIndex
+from scoring import ABSENT, CORRECT, PRESENT, score_guess
+from utils import get_todays_idx
+
+A, P, C = ABSENT, PRESENT, CORRECT
+# plenty of repeated letters
+WORDS = (
+    "geese", "speed", "steel", "sheep", "eerie", "emcee", "elder", "theme", "llama", "label",
+    "sassy", "asses", "essay", "crane", "slate", "audit", "adult", "mourn", "fluky", "eaten",
+)
+
+
+def board(answer, *guesses):
+    return BoardConstraints((guess, score_guess(guess, answer)) for guess in guesses)
+
+
+def fitting(rows):
+    '''The words that score every row the same, worked out the slow way'''
+    return [word for word in WORDS if all(score_guess(guess, word) == states for guess, states in rows)]
+
+
+def test_repeated_letters():
+    # two E's in the answer, the third E of the guess is grey
+    constraints = board("speed", "geese")
+    assert score_guess("geese", "speed") == (A, P, C, P, A)
+    assert constraints.correct == {2: "e"}
+    assert constraints.min_counts == {"e": 2, "s": 1}
+    assert constraints.max_counts == {"g": 0, "e": 2}
+
+
+def test_grey_letters_that_are_yellow_or_green_elsewhere():
+    # both E's are grey, so the answer has none
+    constraints = board("adult", "eaten")
+    assert score_guess("eaten", "adult") == (A, P, P, A, A)
+    assert constraints.max_counts["e"] == 0
+    constraints = board("steel", "eerie")
+    assert score_guess("eerie", "steel") == (P, P, A, A, A)
+    # two E's are yellow, the grey third caps the answer at two
+    assert constraints.min_counts["e"] == constraints.max_counts["e"] == 2
+    assert (4, "e") in constraints.not_at
+    constraints = board("theme", "geese")
+    assert score_guess("geese", "theme") == (A, A, C, A, C)
+    # the grey E caps the answer at the two green ones
+    assert constraints.correct == {2: "e", 4: "e"}
+    assert constraints.min_counts["e"] == constraints.max_counts["e"] == 2
+    assert (1, "e") in constraints.not_at
+
+
+@pytest.mark.parametrize("answer", ["speed", "steel", "eerie", "llama", "sassy", "adult"])
+def test_count_after_each_guess(answer):
+    index = ConstraintIndex(WORDS)
+    rows = []
+    assert index.count(BoardConstraints(rows)) == len(WORDS)
+    for guess in ("geese", "label", "essay", "slate"):
+        rows.append((guess, score_guess(guess, answer)))
+        expected = fitting(rows)
+        assert answer in expected
+        matching = index.matching(BoardConstraints(rows))
+        assert [word for i, word in enumerate(WORDS) if matching >> i & 1] == expected
+        assert index.count(BoardConstraints(rows)) == len(expected)
+
+
+def test_no_word_fits():
+    index = ConstraintIndex(WORDS)
+    assert index.count(BoardConstraints([("crane", (C,) * 5), ("slate", (C,) * 5)])) == 0
+
+
+def test_letters_the_index_has_never_seen():
+    index = ConstraintIndex(WORDS)
+    assert index.count(BoardConstraints([("zzzzz", (A,) * 5)])) == len(WORDS)
+    assert index.count(BoardConstraints([("zzzzz", (P, A, A, A, A))])) == 0
+
+
+@pytest.mark.parametrize("answer, guesses, guess, error", [
+    ("speed", ["geese"], "steel", None),
+    ("speed", ["geese"], "shelf", "Guess must contain E 2 times"),
+    ("speed", ["geese"], "spied", "3rd letter must be E"),
+    ("steel", ["eerie"], "ethos", "Guess must contain E 2 times"),
+    ("steel", ["eerie"], "elder", None),
+    # grey letters may be used again in hard mode
+    ("adult", ["eaten"], "eaten", None),
+    ("sassy", ["asses"], "sassy", None),
+    ("sassy", ["asses"], "essay", "Guess must contain S 3 times"),
+    ("sassy", ["crane", "slate"], "spiky", "Guess must contain A"),
+    ("sassy", ["sheep"], "tasks", "1st letter must be S"),
+])
+def test_hard_mode_error(answer, guesses, guess, error):
+    assert board(answer, *guesses).hard_mode_error(guess) == error
+
+
+def test_hard_mode_error_names_the_position():
+    constraints = BoardConstraints([("a" * 12, (A,) * 10 + (C, C))])
+    assert constraints.hard_mode_error("b" * 12) == "11th letter must be A"
+    assert constraints.hard_mode_error("b" * 11) == "11th letter must be A"
+    assert BoardConstraints([("ab", (A, C))]).hard_mode_error("ac") == "2nd letter must be B"
+
+
+def test_remaining_after_each_guess(login, language):
+    from conftest import WORDS as GAME_WORDS
+
+    client = login("alice")
+    answer = language.get_daily_word(get_todays_idx())
+    rows = []
+    for row, guess in enumerate(word for word in ("eerie", "llama", "crane") if word != answer):
+        body = client.post("/guess", json={"guess": guess, "row": row, "key": f"k{row}"}).get_json()
+        rows.append((guess, score_guess(guess, answer)))
+        expected = [word for word in GAME_WORDS if all(score_guess(g, word) == s for g, s in rows)]
+        assert body["remaining"] == len(expected)
+    assert client.get("/get-game-result").get_json()["remaining"] == len(expected)
+
+
+def test_hard_mode_is_checked_by_guess(login, language):
+    client = login("alice")
+    answer = language.get_daily_word(get_todays_idx())
+    first = next(word for word in ("crane", "slate") if word != answer and set(word) & set(answer))
+    client.post("/guess", json={"guess": first, "row": 0, "key": "k0"})
+    constraints = BoardConstraints([(first, score_guess(first, answer))])
+    breaking = next(word for word in ("fluky", "mourn", "pious", "proxy") if constraints.hard_mode_error(word))
+    response = client.post("/guess", json={"guess": breaking, "row": 1, "key": "k1", "hard_mode": True})
+    assert response.status_code == 400
+    assert response.get_json()["error"] == constraints.hard_mode_error(breaking)
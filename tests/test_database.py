@@ -0,0 +1,28 @@
+'''The engine database.py builds from DATABASE_URL and the tuning settings'''
+import pytest
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+
+import config
+import database
+
+
+def test_sqlite_connections_are_tuned(db):
+    with database.engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        # NORMAL
+        assert conn.execute(text("PRAGMA synchronous")).scalar() == 1
+        assert conn.execute(text("PRAGMA busy_timeout")).scalar() == config.SQLITE_BUSY_TIMEOUT_MS
+        assert conn.execute(text("PRAGMA cache_size")).scalar() == config.SQLITE_CACHE_SIZE
+
+
+def test_unknown_journal_mode_is_refused(empty_db, monkeypatch):
+    monkeypatch.setattr(config, "SQLITE_JOURNAL_MODE", "sideways")
+    with pytest.raises(ValueError, match="SQLITE_JOURNAL_MODE"):
+        empty_db.connect()
+
+
+def test_server_databases_get_a_pool():
+    options = database._engine_options(make_url("postgresql://wordle@localhost/wordle"))
+    assert options["pool_size"] == config.DB_POOL_SIZE and options["pool_pre_ping"]
+    assert "pool_size" not in database._engine_options(make_url("sqlite:///other.db"))
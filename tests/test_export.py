@@ -0,0 +1,149 @@
+'''Exporting results: the export-results command and /export/results'''
+import csv
+import io
+import json
+
+import pytest
+
+from scoring import pack_board, score_board
+from utils import get_date_of_idx, get_todays_idx
+
+TODAY = get_todays_idx()
+# a user_id the CSV has to quote and the JSON has to escape
+AWKWARD_ID = 'o"brien, jr\nthe 2nd'
+
+
+@pytest.fixture
+def boards(db):
+    '''Boards for the last three days, the oldest saved first'''
+    from models import Result, User
+
+    def add_board(user_id, game_date_idx, guesses, answer):
+        User.create_user(user_id, "Player", f"{len(user_id)}@example.com")
+        result = Result.create_result(user_id, game_date_idx)
+        states, game_won = score_board(guesses, answer)
+        result.num_attempts = len(guesses)
+        result.guesses = "".join(guesses)
+        result.states = pack_board(states, 5)
+        result.game_over = result.game_won = game_won
+        db.commit()
+
+    add_board("alice", TODAY - 2, ["crane", "audit"], "audit")
+    add_board(AWKWARD_ID, TODAY - 2, ["slate"], "audit")
+    add_board("alice", TODAY - 1, ["crane"], "audit")
+    add_board("bob", TODAY, [], "audit")
+
+
+def export(fmt="ndjson", **filters):
+    from export import export_results
+    return "".join(export_results(fmt, **filters))
+
+
+def ndjson_rows(text):
+    return [json.loads(line) for line in text.splitlines()]
+
+
+def test_ndjson_rows(boards):
+    rows = ndjson_rows(export())
+    assert [(row["user_id"], row["game_date_idx"]) for row in rows] == [
+        ("alice", TODAY - 2), (AWKWARD_ID, TODAY - 2), ("alice", TODAY - 1), ("bob", TODAY),
+    ]
+    first = rows[0]
+    assert first["date"] == get_date_of_idx(TODAY - 2).isoformat()
+    assert first["guesses"] == ["crane", "audit"]
+    assert first["states"] == ["11211", "33333"]
+    assert first["game_won"] is True and first["game_over"] is True and first["finished_at"] is None
+    assert (rows[-1]["guesses"], rows[-1]["states"]) == ([], [])
+
+
+def test_csv_columns_and_escaping(boards):
+    from export import CSV_COLUMNS
+
+    rows = list(csv.reader(io.StringIO(export("csv"))))
+    header = rows[0]
+    assert header == CSV_COLUMNS
+    assert header[:4] == ["result_id", "user_id", "game_date_idx", "date"]
+    assert header[-12:] == [f"guess_{i}" for i in range(1, 7)] + [f"states_{i}" for i in range(1, 7)]
+    assert all(len(row) == len(header) for row in rows)
+
+    alice = dict(zip(header, rows[1]))
+    assert (alice["guess_1"], alice["guess_2"], alice["guess_3"]) == ("crane", "audit", "")
+    assert (alice["states_1"], alice["states_2"]) == ("11211", "33333")
+    # the quotes, comma and newline all come back as they went in
+    assert dict(zip(header, rows[2]))["user_id"] == AWKWARD_ID
+
+
+@pytest.mark.parametrize("filters, expected", [
+    ({"first_idx": TODAY - 1}, [("alice", TODAY - 1), ("bob", TODAY)]),
+    ({"last_idx": TODAY - 2}, [("alice", TODAY - 2), (AWKWARD_ID, TODAY - 2)]),
+    ({"first_idx": TODAY - 1, "last_idx": TODAY - 1}, [("alice", TODAY - 1)]),
+    ({"user_id": "alice"}, [("alice", TODAY - 2), ("alice", TODAY - 1)]),
+])
+def test_filters(boards, filters, expected):
+    rows = ndjson_rows(export(**filters))
+    assert [(row["user_id"], row["game_date_idx"]) for row in rows] == expected
+
+
+def test_rows_are_read_in_batches(boards, monkeypatch):
+    from database import db_session
+    from export import iter_results
+
+    statements = []
+    execute = db_session.execute
+
+    def spy(stmt, *args, **kwargs):
+        statements.append(stmt)
+        return execute(stmt, *args, **kwargs)
+
+    monkeypatch.setattr(db_session, "execute", spy)
+    rows = list(iter_results(batch_size=2))
+    assert len(rows) == 4
+    assert statements[0].get_execution_options()["yield_per"] == 2
+
+
+def test_command(app, boards, tmp_path):
+    output = tmp_path / "results.csv"
+    date = get_date_of_idx(TODAY - 1).isoformat()
+    result = app.test_cli_runner().invoke(args=[
+        "export-results", "--format", "csv", "--from", date, "--batch-size", "1", "-o", str(output),
+    ])
+    assert result.exit_code == 0, result.output
+    rows = list(csv.DictReader(io.StringIO(output.read_text())))
+    assert [(row["user_id"], row["date"]) for row in rows] == [
+        ("alice", date), ("bob", get_date_of_idx(TODAY).isoformat()),
+    ]
+
+    result = app.test_cli_runner().invoke(args=["export-results", "--to", "yesterday"])
+    assert result.exit_code != 0 and "--from and --to" in result.output
+
+
+@pytest.fixture
+def export_client(boards):
+    from app import create_app
+    return create_app({"TESTING": True, "EXPORT_TOKEN": "s3cret"}).test_client()
+
+
+def get_export(client, token="s3cret", **params):
+    return client.get("/export/results", query_string=params, headers={"Authorization": f"Bearer {token}"})
+
+
+def test_route(export_client):
+    response = get_export(export_client, **{"from": TODAY - 2, "to": get_date_of_idx(TODAY - 1).isoformat()})
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    assert response.headers["Content-Disposition"] == "attachment; filename=results.ndjson"
+    assert [row["game_date_idx"] for row in ndjson_rows(response.get_data(as_text=True))] == [
+        TODAY - 2, TODAY - 2, TODAY - 1,
+    ]
+
+    response = get_export(export_client, format="csv", user_id="bob")
+    assert response.mimetype == "text/csv"
+    assert [row["user_id"] for row in csv.DictReader(io.StringIO(response.get_data(as_text=True)))] == ["bob"]
+
+
+def test_route_errors(app, export_client):
+    assert get_export(export_client, token="wrong").status_code == 401
+    assert get_export(export_client, format="xml").status_code == 400
+    assert get_export(export_client, **{"from": "last week"}).status_code == 400
+    # not served at all without an EXPORT_TOKEN
+    assert get_export(app.test_client()).status_code == 404
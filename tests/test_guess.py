@@ -0,0 +1,150 @@
+'''/guess: appending to the board, retries with the same key, and boards that moved on'''
+import os
+import shutil
+
+import pytest
+
+from utils import get_todays_idx
+
+
+@pytest.fixture
+def client(login, language):
+    return login("alice")
+
+
+@pytest.fixture
+def answer(language):
+    return language.get_daily_word(get_todays_idx())
+
+
+def other_words(answer, n):
+    from conftest import WORDS
+    return [word for word in WORDS if word != answer][:n]
+
+
+def guess(client, word, row, key, **data):
+    response = client.post("/guess", json={"guess": word, "row": row, "key": key, **data})
+    return response.status_code, response.get_json()
+
+
+def saved_board(client):
+    return client.get("/get-game-result").get_json()
+
+
+def test_guess_is_appended(client, answer):
+    first, second = other_words(answer, 2)
+    status, body = guess(client, first, 0, "k0")
+    assert status == 200
+    assert body["guesses"] == [first] and body["num_attempts"] == 1
+    assert len(body["states"]) == 5 and not body["game_over"]
+    status, body = guess(client, second, 1, "k1")
+    assert status == 200 and body["guesses"] == [first, second]
+    assert saved_board(client)["guesses"] == [first, second]
+
+
+def test_retry_with_the_same_key_is_not_added_twice(client, answer):
+    word = other_words(answer, 1)[0]
+    status, first = guess(client, word, 0, "retry-me")
+    status_again, again = guess(client, word, 0, "retry-me")
+    assert status == status_again == 200
+    assert again["guesses"] == [word] and again["states"] == first["states"]
+    assert saved_board(client)["num_attempts"] == 1
+
+
+def test_stale_row_is_a_conflict(client, answer):
+    first, second = other_words(answer, 2)
+    guess(client, first, 0, "tab-1")
+    # another tab still thinks the board is empty
+    status, body = guess(client, second, 0, "tab-2")
+    assert status == 409
+    assert body["error"] == "Your board changed, please try again"
+    assert body["guesses"] == [first]
+    # and one that's ahead of the board
+    status, body = guess(client, second, 3, "tab-3")
+    assert status == 409 and body["guesses"] == [first]
+    assert saved_board(client)["guesses"] == [first]
+
+
+def test_finished_game_takes_no_more_guesses(client, answer):
+    status, body = guess(client, answer, 0, "win")
+    assert status == 200 and body["game_won"] and body["answer"] == answer
+    status, body = guess(client, other_words(answer, 1)[0], 1, "after")
+    assert status == 409 and body["error"] == "Game is already over"
+    # the winning guess can still be retried
+    status, body = guess(client, answer, 0, "win")
+    assert status == 200 and body["game_won"]
+    stats = client.get("/get-user-stats").get_json()
+    assert stats["wins"] == 1 and stats["games"] == 1
+
+
+def test_saved_board_has_the_answer_once_over(client, answer):
+    guess(client, other_words(answer, 1)[0], 0, "miss")
+    assert "answer" not in saved_board(client)
+    guess(client, answer, 1, "win")
+    assert saved_board(client)["answer"] == answer
+
+
+def test_saved_board_needs_a_login(app):
+    assert app.test_client().get("/get-game-result").status_code == 401
+
+
+def test_six_misses_lose(client, answer):
+    misses = other_words(answer, 6)
+    for row, word in enumerate(misses):
+        status, body = guess(client, word, row, f"k{row}")
+        assert status == 200
+    assert body["game_lost"] and body["answer"] == answer
+
+
+@pytest.mark.parametrize("data, error", [
+    ({"guess": "zzzzz", "row": 0}, "Word is not valid"),
+    ({"guess": "abc", "row": 0}, "Please enter a full word"),
+    ({"guess": "crane", "row": 6}, "'row' must be the number of guesses already on the board"),
+    ({"guess": "crane", "row": True}, "'row' must be the number of guesses already on the board"),
+    ({"guess": "crane", "row": 0, "key": "k" * 65}, "'key' must be a string of at most 64 characters"),
+])
+def test_bad_requests(client, data, error):
+    response = client.post("/guess", json=data)
+    assert response.status_code == 400
+    assert response.get_json()["error"] == error
+    assert saved_board(client)["num_attempts"] == 0
+
+
+def test_easy_mode_takes_any_letters(client):
+    status, body = guess(client, "zzzzz", 0, "easy", allow_any_word=True)
+    assert status == 200 and body["guesses"] == ["zzzzz"]
+
+
+LONG_WORDS = ("cryptography", "surveillance", "exploitation", "verification", "confidential", "intelligence")
+
+
+@pytest.fixture
+def long_game(data_dir, language, monkeypatch):
+    '''A hosted 12 letter game, the longest words a game can have'''
+    from models import MAX_WORD_LENGTH, get_language, language_registry
+
+    path = os.path.join(data_dir, "xx")
+    os.makedirs(path, exist_ok=True)
+    shutil.copy(os.path.join(data_dir, "characters.txt"), path)
+    with open(os.path.join(path, "words.txt"), "w", encoding="utf-8") as f:
+        f.write("\n".join(LONG_WORDS) + "\n")
+    monkeypatch.setattr(language_registry, "keys", language_registry.keys + (("xx", MAX_WORD_LENGTH),))
+    return get_language("xx", MAX_WORD_LENGTH)
+
+
+def test_longest_words_fill_a_board(client, long_game):
+    answer = long_game.get_daily_word(get_todays_idx())
+    misses = [word for word in LONG_WORDS if word != answer]
+    game = {"language": "xx", "word_length": 12}
+    for row, word in enumerate(misses[:5]):
+        status, body = guess(client, word, row, f"k{row}", **game)
+        assert status == 200 and len(body["states"]) == 12
+    status, body = guess(client, answer, 5, "k5", **game)
+    assert status == 200 and body["game_won"]
+
+    board = client.get("/get-game-result", query_string=game).get_json()
+    assert board["guesses"] == misses[:5] + [answer]
+    assert board["guess_states"][-1] == "3" * 12
+    assert len(board["guess_states"]) == 6 and all(len(states) == 12 for states in board["guess_states"])
+    # the default game's board is a different one
+    assert saved_board(client)["num_attempts"] == 0
@@ -0,0 +1,104 @@
+'''The shared Language, built once per worker and rebuilt when its data files
+change, and hosting several languages and word lengths'''
+import os
+import shutil
+import time
+
+import pytest
+
+from conftest import WORDS
+from utils import get_todays_idx
+
+FOUR_LETTER_WORDS = ("pike", "lake", "fern", "moss", "reed", "tarn")
+
+
+def test_language_is_built_once(language):
+    from models import get_language
+
+    assert get_language() is language
+    assert sorted(language.word_list) == sorted(WORDS)
+    assert isinstance(language.word_list, tuple) and isinstance(language.keyboard, tuple)
+
+
+def test_language_is_rebuilt_when_a_data_file_changes(data_dir, language, monkeypatch):
+    import models
+
+    words_txt = os.path.join(data_dir, "words.txt")
+    later = time.time() + 10
+    os.utime(words_txt, (later, later))
+    # the files aren't looked at again within LANGUAGE_CHECK_INTERVAL
+    assert models.get_language() is language
+
+    monkeypatch.setattr(models, "LANGUAGE_CHECK_INTERVAL", 0)
+    loads = models.language_stats["loads"]
+    rebuilt = models.get_language()
+    assert rebuilt is not language and sorted(rebuilt.word_list) == sorted(WORDS)
+    assert models.language_stats["loads"] == loads + 1
+    assert models.get_language() is rebuilt
+
+
+def test_language_stats_route(login):
+    client = login("alice")
+    stats = client.get("/language-stats").get_json()
+    assert stats["loads"] >= 1 and stats["checks"] >= stats["loads"]
+
+
+def test_parse_languages():
+    from models import MAX_WORD_LENGTH, parse_languages
+
+    assert parse_languages("", "en") == (("en", 5),)
+    assert parse_languages(" DE, de:4,en,de ", "en") == (("en", 5), ("de", 5), ("de", 4))
+    with pytest.raises(ValueError, match="Word lengths"):
+        parse_languages(f"de:{MAX_WORD_LENGTH + 1}", "en")
+    with pytest.raises(ValueError, match="Bad language code"):
+        parse_languages("../etc", "en")
+
+
+@pytest.fixture
+def game(data_dir, language, monkeypatch):
+    '''A hosted 4 letter game in data/xx'''
+    from models import get_language, language_registry
+
+    path = os.path.join(data_dir, "xx")
+    os.makedirs(path, exist_ok=True)
+    for name in os.listdir(data_dir):
+        if name != "words.txt" and os.path.isfile(os.path.join(data_dir, name)):
+            shutil.copy(os.path.join(data_dir, name), path)
+    with open(os.path.join(path, "words.txt"), "w", encoding="utf-8") as f:
+        f.write("\n".join(FOUR_LETTER_WORDS + ("toolong",)) + "\n")
+    monkeypatch.setattr(language_registry, "keys", language_registry.keys + (("xx", 4),))
+    yield get_language("xx", 4)
+    language_registry.entries.pop(("xx", 4), None)
+    shutil.rmtree(path)
+
+
+def test_each_game_has_its_own_words_and_board(login, game):
+    assert sorted(game.word_list) == sorted(FOUR_LETTER_WORDS)
+    answer = game.get_daily_word(get_todays_idx())
+    client = login("alice")
+    response = client.post("/guess", json={
+        "guess": answer, "row": 0, "key": "k0", "language": "xx", "word_length": 4,
+    })
+    assert response.status_code == 200 and response.get_json()["game_won"]
+    board = client.get("/get-game-result", query_string={"language": "xx", "word_length": 4}).get_json()
+    assert board["guesses"] == [answer]
+    assert client.get("/get-game-result").get_json()["num_attempts"] == 0
+    # only the main game counts towards stats
+    assert client.get("/get-user-stats").get_json()["games"] == 0
+
+    assert client.get("/game/xx/4").status_code == 200
+    assert client.get("/game/xx").status_code == 200
+    assert client.get("/game/en").headers["Location"].endswith("/game")
+    assert client.get("/game/zz").status_code == 404
+    unknown = client.post("/guess", json={"guess": "crane", "row": 0, "language": "zz"})
+    assert unknown.status_code == 400
+
+
+def test_default_game_is_never_dropped(game, monkeypatch):
+    from models import language_registry
+
+    monkeypatch.setattr(language_registry, "max_size", 1)
+    language_registry.entries.pop(("xx", 4))
+    # loaded again, and dropped again straight away rather than the default game
+    assert language_registry.get(("xx", 4)).key == ("xx", 4)
+    assert list(language_registry.entries) == [language_registry.default_key]
@@ -0,0 +1,61 @@
+'''setup_logging() and when whole word lists are logged'''
+import logging
+
+import pytest
+
+import config
+import utils
+
+
+@pytest.fixture
+def restore_logging():
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    yield
+    if utils._log_listener is not None:
+        utils._log_listener.stop()
+        utils._log_listener = None
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+
+
+def test_records_go_through_the_queue_to_the_file(restore_logging, tmp_path):
+    log_file = tmp_path / "app.log"
+    utils.setup_logging("warning", str(log_file), max_bytes=1000, backup_count=1)
+    root = logging.getLogger()
+    assert [type(handler) for handler in root.handlers] == [logging.handlers.QueueHandler]
+    assert root.level == logging.WARNING
+
+    utils.logger.info("not this one")
+    for i in range(20):
+        utils.logger.warning("line %d of the test", i)
+    # stopping the listener writes out what's still queued
+    utils._log_listener.stop()
+    utils._log_listener = None
+    written = (tmp_path / "app.log.1").read_text() + log_file.read_text()
+    assert "not this one" not in written
+    assert "WARNING in test_logging: line 19 of the test" in written
+    assert not (tmp_path / "app.log.2").exists()
+
+
+def test_setting_up_again_replaces_the_handlers(restore_logging, tmp_path):
+    utils.setup_logging("INFO", str(tmp_path / "first.log"))
+    first = utils._log_listener
+    utils.setup_logging("INFO", None)
+    assert utils._log_listener is not first
+    assert len(logging.getLogger().handlers) == 1
+    assert [type(handler) for handler in utils._log_listener.handlers] == [logging.StreamHandler]
+
+
+@pytest.mark.parametrize("level, payloads, expected", [
+    ("DEBUG", False, False),
+    ("INFO", True, False),
+    ("DEBUG", True, True),
+])
+def test_word_lists_are_only_logged_when_asked_for(restore_logging, monkeypatch, level, payloads, expected):
+    monkeypatch.setattr(config, "LOG_PAYLOADS", payloads)
+    utils.setup_logging(level, None)
+    assert utils.log_payloads() is expected
@@ -0,0 +1,76 @@
+'''Google sign-in against oauth_stub.py, the in-process stand-in for Google'''
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+import requests
+
+import utils
+from oauth_stub import DISCOVERY_DOCUMENT, STUB_BASE_URL, OAuthStubAdapter
+
+
+@pytest.fixture
+def google(monkeypatch):
+    '''The OAuthStubAdapter answering the app's calls to Google'''
+    adapter = OAuthStubAdapter()
+    session = requests.Session()
+    session.mount(STUB_BASE_URL, adapter)
+    monkeypatch.setattr(utils, "_http_session", session)
+    monkeypatch.setattr(utils, "google_provider_cfg_cache",
+                        utils.ProviderConfigCache(STUB_BASE_URL + "/.well-known/openid-configuration"))
+    # the test client talks plain http
+    monkeypatch.setenv("OAUTHLIB_INSECURE_TRANSPORT", "1")
+    return adapter
+
+
+@pytest.fixture
+def client(db, google):
+    from app import create_app
+
+    app = create_app({
+        "TESTING": True,
+        "GOOGLE_CLIENT_ID": "client-id",
+        "GOOGLE_CLIENT_SECRET": "client-secret",
+        "ALLOWED_DOMAINS": ["example.com"],
+    })
+    return app.test_client()
+
+
+def test_login_redirects_to_the_authorization_endpoint(client):
+    response = client.get("/login")
+    assert response.status_code == 302
+    location = urlparse(response.headers["Location"])
+    assert f"{location.scheme}://{location.netloc}{location.path}" == DISCOVERY_DOCUMENT["authorization_endpoint"]
+    query = parse_qs(location.query)
+    assert query["client_id"] == ["client-id"]
+    assert query["redirect_uri"] == ["http://localhost/login/callback"]
+
+
+def test_callback_signs_in(client, google):
+    from models import User
+
+    assert client.get("/get-user-stats").status_code == 401
+    response = client.get("/login/callback?code=anything")
+    assert response.status_code == 302 and response.headers["Location"] == "/game"
+
+    user = User.get_user("stub-user")
+    assert (user.name, user.email) == ("Player", "player@example.com")
+    assert client.get("/get-user-stats").status_code == 200
+    # the discovery document is fetched once, then the code is swapped for a token
+    assert [(request.method, urlparse(request.url).path) for request in google.requests] == [
+        ("GET", "/.well-known/openid-configuration"),
+        ("POST", "/token"),
+        ("GET", "/userinfo"),
+    ]
+    assert "code=anything" in google.requests[1].body
+    assert google.requests[2].headers["Authorization"] == "Bearer stub-access-token"
+
+
+def test_other_domains_are_turned_away(client, google):
+    google.userinfo = {**google.userinfo, "email": "player@elsewhere.com"}
+    assert client.get("/login/callback?code=anything").status_code == 403
+    assert client.get("/get-user-stats").status_code == 401
+
+
+def test_unverified_email_is_turned_away(client, google):
+    google.userinfo = {**google.userinfo, "email_verified": False}
+    assert client.get("/login/callback?code=anything").status_code == 400
@@ -0,0 +1,120 @@
+'''/metrics, the numbers behind it and the sampling profiler'''
+import time
+
+import pytest
+from flask import Flask
+from sqlalchemy import create_engine, text
+
+from metrics import Histogram, Metrics
+
+
+@pytest.fixture
+def metrics_client(db):
+    from app import create_app
+    app = create_app({"TESTING": True, "METRICS_ENABLED": True, "METRICS_TOKEN": "s3cret"})
+    return app.test_client()
+
+
+def test_metrics_are_off_by_default(app):
+    assert app.test_client().get("/metrics").status_code == 404
+
+
+@pytest.mark.parametrize("authorization", [None, "", "Bearer", "Bearer wrong", "Bearer s3cret ", "s3cret", "Bearer s3crét"])
+def test_metrics_token_is_required(metrics_client, authorization):
+    headers = {"Authorization": authorization} if authorization is not None else {}
+    assert metrics_client.get("/metrics", headers=headers).status_code == 401
+
+
+def test_metrics_with_token(metrics_client):
+    response = metrics_client.get("/metrics", headers={"Authorization": "Bearer s3cret"})
+    assert response.status_code == 200
+    assert response.content_type.startswith("text/plain")
+    assert "wordle_user_cache_hits " in response.get_data(as_text=True)
+
+
+def test_queries_are_counted_once_per_app(metrics_client):
+    from app import create_app
+    from database import engine
+    from metrics import metrics
+
+    create_app({"TESTING": True, "METRICS_ENABLED": True})
+    with engine.connect() as conn:
+        before = metrics.queries_outside_requests
+        conn.exec_driver_sql("SELECT 1")
+        assert metrics.queries_outside_requests == before + 1
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram((1, 5))
+    for value in (0, 1, 3, 7):
+        histogram.observe(value)
+    assert list(histogram.lines("x", {"endpoint": "game"})) == [
+        'x_bucket{endpoint="game",le="1"} 2',
+        'x_bucket{endpoint="game",le="5"} 3',
+        'x_bucket{endpoint="game",le="+Inf"} 4',
+        'x_sum{endpoint="game"} 11.0',
+        'x_count{endpoint="game"} 4',
+    ]
+
+
+@pytest.fixture
+def instrumented(tmp_path):
+    '''A bare app and its own database, hooked up to a Metrics of their own'''
+    app = Flask(__name__)
+    app.config.update(METRICS_PROFILE_SAMPLE_RATE=1.0, METRICS_PROFILE_DIR=str(tmp_path), METRICS_PROFILE_KEEP=2)
+    engine = create_engine("sqlite://")
+    metrics = Metrics()
+    metrics.init_app(app, engine)
+
+    @app.route("/two-queries")
+    def two_queries():
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            conn.execute(text("SELECT 2"))
+        return "ok"
+
+    @app.route("/sleep/<int:ms>")
+    def sleep(ms):
+        time.sleep(ms / 1000)
+        return "ok"
+
+    @app.route("/broken")
+    def broken():
+        raise RuntimeError("boom")
+
+    yield app.test_client(), metrics, engine
+    engine.dispose()
+
+
+def test_requests_and_queries_are_counted(instrumented):
+    client, metrics, engine = instrumented
+    for _ in range(3):
+        assert client.get("/two-queries").status_code == 200
+    assert client.get("/broken").status_code == 500
+    assert client.get("/missing").status_code == 404
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 3"))
+
+    assert metrics.requests == {
+        ("GET", "two_queries", 200): 3,
+        ("GET", "broken", 500): 1,
+        ("GET", "unmatched", 404): 1,
+    }
+    assert metrics.in_flight == 0
+    assert metrics.queries["two_queries"].sum == 6
+    assert metrics.queries_outside_requests == 1
+    body = metrics.render({"wordle_cache": {"hits": 4, "enabled": True, "name": "users"}})
+    assert 'wordle_http_requests_total{method="GET",endpoint="two_queries",status="200"} 3' in body
+    assert 'wordle_db_queries_per_request_bucket{endpoint="two_queries",le="2"} 3' in body
+    assert "wordle_cache_hits 4" in body
+    assert "wordle_cache_enabled" not in body and "wordle_cache_name" not in body
+
+
+def test_only_the_slowest_profiles_are_kept(instrumented, tmp_path):
+    client, metrics, _ = instrumented
+    for ms in (4, 1, 3, 2):
+        client.get(f"/sleep/{ms}")
+    assert metrics.profiler.stats["profiled"] == 4
+    kept = sorted(float(path.name.split("ms-")[0]) for path in tmp_path.glob("*.prof"))
+    assert len(kept) == 2 and kept[0] >= 3
+    assert "wordle_profiler_profiled 4" in metrics.render()
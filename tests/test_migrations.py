@@ -0,0 +1,204 @@
+'''Upgrading a database made by the first version of the app, which kept every
+board as JSON lists of letters and CSS classes'''
+import json
+
+import pytest
+from sqlalchemy import Integer, LargeBinary, inspect, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+import migrations
+from database import check_db, init_db
+from scoring import ABSENT, CORRECT, PRESENT, pack_board
+from utils import get_todays_idx
+
+BASELINE_SCHEMA = (
+    """CREATE TABLE users (
+        user_id VARCHAR(50) NOT NULL PRIMARY KEY,
+        name VARCHAR(50),
+        email VARCHAR(120) UNIQUE
+    )""",
+    """CREATE TABLE results (
+        result_id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+        user_id VARCHAR(50) NOT NULL REFERENCES users (user_id) ON DELETE CASCADE,
+        game_date_idx INTEGER NOT NULL,
+        num_attempts INTEGER NOT NULL,
+        tiles VARCHAR(200) NOT NULL,
+        tile_classes VARCHAR(1200) NOT NULL,
+        game_over BOOLEAN NOT NULL,
+        game_lost BOOLEAN NOT NULL,
+        game_won BOOLEAN NOT NULL
+    )""",
+)
+EMPTY_CLASS = "border-2 border-neutral-300"
+CLASSES = {ABSENT: "bg-neutral-500 incorrect", PRESENT: "bg-yellow-500 semicorrect", CORRECT: "bg-green-500 correct"}
+
+
+def old_board(rows, typed=""):
+    '''(tiles, tile_classes) JSON of a board with the given (word, states) rows
+    submitted, and `typed` in the next row but not submitted'''
+    tiles = [[""] * 5 for _ in range(6)]
+    tile_classes = [[EMPTY_CLASS] * 5 for _ in range(6)]
+    for i, (word, states) in enumerate(rows):
+        tiles[i] = list(word)
+        tile_classes[i] = [CLASSES[state] for state in states]
+    if typed:
+        tiles[len(rows)][:len(typed)] = list(typed)
+    return json.dumps(tiles), json.dumps(tile_classes)
+
+
+def insert_result(conn, user_id, game_date_idx, rows, won=False, lost=False, typed=""):
+    tiles, tile_classes = old_board(rows, typed)
+    conn.execute(text(
+        "INSERT INTO results (user_id, game_date_idx, num_attempts, tiles, tile_classes, game_over, game_lost, game_won) "
+        "VALUES (:user_id, :game_date_idx, :num_attempts, :tiles, :tile_classes, :game_over, :game_lost, :game_won)"
+    ), {
+        "user_id": user_id, "game_date_idx": game_date_idx, "num_attempts": len(rows),
+        "tiles": tiles, "tile_classes": tile_classes,
+        "game_over": won or lost, "game_lost": lost, "game_won": won,
+    })
+
+
+CRANE = ("crane", (ABSENT, ABSENT, PRESENT, ABSENT, ABSENT))
+ADULT = ("adult", (CORRECT, PRESENT, PRESENT, ABSENT, PRESENT))
+AUDIT = ("audit", (CORRECT,) * 5)
+
+
+@pytest.fixture
+def baseline_db(empty_db):
+    '''A baseline database with a few players' boards in it'''
+    today = get_todays_idx()
+    with empty_db.begin() as conn:
+        for statement in BASELINE_SCHEMA:
+            conn.execute(text(statement))
+        for user_id in ("alice", "bob"):
+            conn.execute(text("INSERT INTO users VALUES (:user_id, :user_id, :email)"),
+                         {"user_id": user_id, "email": f"{user_id}@example.com"})
+        insert_result(conn, "alice", today - 2, [CRANE, AUDIT], won=True)
+        insert_result(conn, "alice", today - 1, [CRANE, ADULT, AUDIT], won=True)
+        # two concurrent first requests made a duplicate of today's board
+        insert_result(conn, "alice", today, [CRANE], typed="adu")
+        insert_result(conn, "alice", today, [])
+        insert_result(conn, "bob", today - 1, [CRANE] * 6, lost=True)
+    return empty_db
+
+
+def get_board(user_id, game_date_idx):
+    from models import Result
+    return Result.query.filter_by(user_id=user_id, game_date_idx=game_date_idx).one()
+
+
+def test_upgrade_from_baseline(baseline_db):
+    from models import DailyStats, Result, UserStats
+
+    today = get_todays_idx()
+    init_db()
+    check_db()
+
+    columns = {column["name"]: column for column in inspect(baseline_db).get_columns("results")}
+    assert "tiles" not in columns and "tile_classes" not in columns
+    # boards went through the old integer format on the way
+    assert isinstance(columns["states"]["type"], LargeBinary) and "state_bytes" not in columns
+    with baseline_db.connect() as conn:
+        assert migrations.get_version(conn) == migrations.latest_version()
+
+    # only the submitted rows were kept, with their colors
+    board = Result.get_result("alice")
+    assert board.guess_list == ["crane"]
+    assert board.state_rows == [CRANE[1]]
+    assert (board.language_code, board.word_length) == ("en", 5)
+    won = get_board("alice", today - 1)
+    assert won.guess_list == ["crane", "adult", "audit"]
+    assert won.state_rows == [CRANE[1], ADULT[1], AUDIT[1]]
+    assert won.game_won and won.finished_at is None
+    assert won.states == pack_board([CRANE[1], ADULT[1], AUDIT[1]], 5)
+    lost = get_board("bob", today - 1)
+    assert lost.guess_list == ["crane"] * 6 and lost.game_lost
+
+    # the duplicate was dropped, keeping the board with more guesses
+    with baseline_db.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM results WHERE user_id = 'alice'")).scalar() == 3
+    assert DailyStats.get_stats(today - 1).to_dict()["games"] == 2
+    assert DailyStats.get_stats(today - 2).to_dict()["wins"] == 1
+    alice = UserStats.get_stats("alice").to_dict(today)
+    assert (alice["wins"], alice["losses"], alice["current_streak"], alice["longest_streak"]) == (2, 0, 2, 2)
+    assert alice["guess_distribution"] == [0, 1, 1, 0, 0, 0]
+    bob = UserStats.get_stats("bob").to_dict(today)
+    assert (bob["wins"], bob["losses"], bob["total_attempts"]) == (0, 1, 6)
+
+
+def test_integer_states_become_bytes(baseline_db, monkeypatch):
+    from database import engine
+
+    today = get_todays_idx()
+    monkeypatch.setattr(migrations, "MIGRATIONS", [(v, func) for v, func in migrations.MIGRATIONS if v < 7])
+    init_db()
+    columns = {column["name"]: column for column in inspect(baseline_db).get_columns("results")}
+    assert isinstance(columns["states"]["type"], Integer)
+    monkeypatch.undo()
+
+    assert migrations.migrate(engine) == [7]
+    columns = {column["name"]: column for column in inspect(baseline_db).get_columns("results")}
+    assert isinstance(columns["states"]["type"], LargeBinary) and not columns["states"]["nullable"]
+    with baseline_db.begin() as conn:
+        states = dict(conn.execute(text(
+            "SELECT game_date_idx, states FROM results WHERE user_id = 'alice'"
+        )).all())
+        assert states == {
+            today - 2: pack_board([CRANE[1], AUDIT[1]], 5),
+            today - 1: pack_board([CRANE[1], ADULT[1], AUDIT[1]], 5),
+            today: pack_board([CRANE[1]], 5),
+        }
+        # boards inserted without states start out empty
+        conn.execute(text(
+            "INSERT INTO results (user_id, game_date_idx, language_code, word_length, "
+            "num_attempts, game_over, game_lost, game_won) VALUES ('bob', :today, 'en', 5, 0, 0, 0, 0)"
+        ), {"today": today})
+        assert conn.execute(text(
+            "SELECT states FROM results WHERE user_id = 'bob' AND game_date_idx = :today"
+        ), {"today": today}).scalar() == b""
+
+
+@pytest.mark.parametrize("dialect, expected", [
+    (sqlite.dialect(), "ALTER TABLE results ADD COLUMN states BLOB NOT NULL DEFAULT X''"),
+    (postgresql.dialect(), "ALTER TABLE results ADD COLUMN states BYTEA NOT NULL DEFAULT ''"),
+])
+def test_binary_column_on_each_backend(dialect, expected):
+    assert migrations._add_binary_column_sql(dialect, "results", "states") == expected
+
+
+def test_one_board_per_user_and_day(baseline_db):
+    init_db()
+    insert = text(
+        "INSERT INTO results (user_id, game_date_idx, language_code, word_length, "
+        "num_attempts, game_over, game_lost, game_won) "
+        "VALUES (:user_id, :today, 'en', 5, 0, 0, 0, 0)"
+    )
+    with baseline_db.begin() as conn:
+        conn.execute(insert, {"user_id": "bob", "today": get_todays_idx()})
+    with pytest.raises(IntegrityError, match="UNIQUE"):
+        with baseline_db.begin() as conn:
+            conn.execute(insert, {"user_id": "alice", "today": get_todays_idx()})
+
+
+def test_creating_a_board_twice_returns_the_first(db):
+    from models import Result, User
+
+    User.create_user("alice", "Alice", "alice@example.com")
+    first = Result.create_result("alice")
+    assert Result.create_result("alice").result_id == first.result_id
+    assert len(Result.get_user_results("alice")) == 1
+
+
+def test_migrating_again_does_nothing(baseline_db):
+    init_db()
+    assert migrations.migrate(baseline_db) == []
+    assert get_board("alice", get_todays_idx() - 2).guess_list == ["crane", "audit"]
+
+
+def test_new_database_starts_at_the_latest_version(db):
+    from database import engine
+
+    with engine.connect() as conn:
+        assert migrations.get_version(conn) == migrations.latest_version()
+    assert migrations.migrate(engine) == []
@@ -0,0 +1,161 @@
+'''Scoring guesses, on its own and behind /update-game-result'''
+from itertools import product
+
+import pytest
+
+from scoring import (
+    ABSENT,
+    CORRECT,
+    EMPTY,
+    PRESENT,
+    STATE_NAMES,
+    AnswerScorer,
+    encode_states,
+    pack_board,
+    packed_size,
+    score_board,
+    score_guess,
+    state_from_class,
+    unpack_board,
+)
+from utils import get_todays_idx
+
+A, P, C = ABSENT, PRESENT, CORRECT
+
+
+def brute_force_score(guess, answer):
+    '''The rules spelled out the slow way: correct tiles first, then the
+    answer's unused copies handed out left to right'''
+    states = [C if g == a else A for g, a in zip(guess, answer)]
+    unused = [a for g, a in zip(guess, answer) if g != a]
+    for i, letter in enumerate(guess):
+        if states[i] != C and letter in unused:
+            unused.remove(letter)
+            states[i] = P
+    return tuple(states)
+
+
+@pytest.mark.parametrize("guess, answer, expected", [
+    ("crane", "crane", (C, C, C, C, C)),
+    ("mourn", "crane", (A, A, A, P, P)),
+    # one E in the answer and it's taken by the correct tile, so the other E's are absent
+    ("eerie", "crane", (A, A, P, A, C)),
+    # one E in the answer: only the first E is present
+    ("eerie", "bleat", (P, A, A, A, A)),
+    ("eerie", "slate", (A, A, A, A, C)),
+    # the correct copy uses up the answer's only L
+    ("llama", "pleat", (A, C, P, A, A)),
+    # two E's in the answer, three in the guess
+    ("eeeee", "tepee", (A, C, A, C, C)),
+    ("speed", "abide", (A, A, P, A, P)),
+])
+def test_duplicate_letters(guess, answer, expected):
+    assert score_guess(guess, answer) == expected
+
+
+def test_matches_brute_force():
+    letters = "abe"
+    words = ["".join(word) for word in product(letters, repeat=4)]
+    for answer in words:
+        scorer = AnswerScorer(answer)
+        for guess in words:
+            assert scorer.score(guess) == brute_force_score(guess, answer), (guess, answer)
+
+
+def test_is_win():
+    scorer = AnswerScorer("audit")
+    assert scorer.is_win(scorer.score("audit"))
+    assert not scorer.is_win(scorer.score("adult"))
+    # a row too short for the answer isn't a win however it's colored
+    assert not scorer.is_win((C, C, C, C))
+
+
+def test_score_board_reuses_scored_guesses():
+    scored = {}
+    rows, won = score_board(["crane", "audit"], "audit", scored)
+    assert rows == [score_guess("crane", "audit"), (C, C, C, C, C)]
+    assert won
+    assert set(scored) == {"crane", "audit"}
+
+    scored["crane"] = (A, A, A, A, A)
+    rows, won = score_board(["crane"], "audit", scored)
+    assert rows == [(A, A, A, A, A)] and not won
+    assert score_board([], "audit") == ([], False)
+
+
+def test_pack_board():
+    # 2 bits per tile, little endian, row after row
+    assert pack_board([(A, P, C), (C, C, C)], 3) == bytes([0b11111001, 0b1111])
+    assert pack_board([], 5) == b""
+
+
+@pytest.mark.parametrize("width", [2, 5, 7, 12])
+def test_pack_round_trip(width):
+    rows = [tuple((i + j) % 3 + 1 for j in range(width)) for i in range(6)]
+    for n_rows in range(len(rows) + 1):
+        packed = pack_board(rows[:n_rows], width)
+        assert len(packed) == packed_size(n_rows, width)
+        assert unpack_board(packed, n_rows, width) == rows[:n_rows]
+
+
+def test_longest_board_fits_the_column():
+    rows = [(C,) * 12] * 6
+    assert len(pack_board(rows, 12)) == packed_size(6, 12) == 18
+
+
+def test_rows_can_be_added_one_at_a_time():
+    rows = [(A, P, C, A, A), (C, C, C, C, C)]
+    packed = b""
+    for n_rows in range(1, len(rows) + 1):
+        packed = pack_board(unpack_board(packed, n_rows - 1, 5) + [rows[n_rows - 1]], 5)
+    assert packed == pack_board(rows, 5)
+
+
+def test_encode_states():
+    assert encode_states((C, A, EMPTY, EMPTY, P)) == "31002"
+
+
+@pytest.mark.parametrize("css_class, state", [
+    ("bg-green-500 correct", CORRECT),
+    ("bg-yellow-500 semicorrect", PRESENT),
+    ("bg-neutral-500 incorrect", ABSENT),
+    ("border-2 border-neutral-300", EMPTY),
+])
+def test_state_from_class(css_class, state):
+    assert state_from_class(css_class) == state
+
+
+def test_guesses_are_scored_on_the_server(login, language):
+    client = login("alice")
+    answer = language.get_daily_word(get_todays_idx())
+    miss = next(word for word in ("crane", "slate") if word != answer)
+
+    body = client.post("/update-game-result", json={"guess": miss}).get_json()
+    assert body["states"] == [STATE_NAMES[state] for state in score_guess(miss, answer)]
+    assert not body["game_over"] and "answer" not in body
+    assert client.post("/update-game-result", json={"guess": "zzzzz"}).status_code == 400
+    assert client.post("/update-game-result", json={"guess": "cran"}).status_code == 400
+
+    body = client.post("/update-game-result", json={"guess": answer}).get_json()
+    assert body["states"] == [STATE_NAMES[C]] * 5
+    assert body["game_won"] and body["answer"] == answer
+    assert client.post("/update-game-result", json={"guess": miss}).status_code == 409
+
+
+def test_rescore_day(login, language):
+    from database import db_session
+    from models import Result
+
+    idx = get_todays_idx()
+    answer = language.get_daily_word(idx)
+    client = login("alice")
+    client.post("/update-game-result", json={"guess": answer})
+    # as if the day's answer had been another word
+    other = next(word for word in ("crane", "slate") if word != answer)
+    assert Result.rescore_day(idx, answer)["mismatched"] == 0
+    summary = Result.rescore_day(idx, other)
+    assert (summary["checked"], summary["mismatched"], summary["fixed"]) == (1, 1, False)
+    assert Result.rescore_day(idx, other, fix=True)["fixed"]
+    assert Result.rescore_day(idx, other)["mismatched"] == 0
+    db_session.remove()
+    assert not Result.get_result("alice").game_won
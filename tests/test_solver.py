@@ -0,0 +1,125 @@
+'''The pattern matrix and the entropy solver behind /hint'''
+import math
+import string
+from collections import Counter
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import config  # noqa: E402
+import solver  # noqa: E402
+from scoring import ABSENT, CORRECT, score_guess  # noqa: E402
+from solver import Solver, build_pattern_matrix, load_solver, pattern_of_states  # noqa: E402
+
+# repeated letters in the guess, the answer or both
+GUESSES = ("eerie", "geese", "speed", "llama", "sassy", "asses", "crane", "slate", "pious", "steel")
+ANSWERS = ("geese", "speed", "llama", "sassy", "crane", "steel")
+
+
+@pytest.fixture
+def small_solver():
+    matrix = build_pattern_matrix(GUESSES, ANSWERS, string.ascii_lowercase)
+    return Solver(GUESSES, ANSWERS, matrix)
+
+
+def test_pattern_of_states():
+    assert pattern_of_states((ABSENT,) * 5) == 0
+    assert pattern_of_states((CORRECT,) * 5) == 3 ** 5 - 1
+    # tile j is digit j
+    assert pattern_of_states((CORRECT, ABSENT, ABSENT, ABSENT, ABSENT)) == 2
+
+
+def test_matrix_agrees_with_score_guess(small_solver):
+    assert small_solver.matrix.dtype == np.uint8
+    for i, guess in enumerate(GUESSES):
+        for j, answer in enumerate(ANSWERS):
+            assert small_solver.matrix[i, j] == pattern_of_states(score_guess(guess, answer)), (guess, answer)
+
+
+def test_matrix_is_built_in_batches(monkeypatch):
+    whole = build_pattern_matrix(GUESSES, ANSWERS, string.ascii_lowercase)
+    monkeypatch.setattr(solver, "BUILD_BATCH_CELLS", len(ANSWERS) * 3)
+    assert (build_pattern_matrix(GUESSES, ANSWERS, string.ascii_lowercase) == whole).all()
+
+
+def entropy(guess, candidates):
+    '''Expected bits of a guess, worked out the slow way'''
+    counts = Counter(score_guess(guess, answer) for answer in candidates)
+    return -sum(n / len(candidates) * math.log2(n / len(candidates)) for n in counts.values())
+
+
+def test_expected_information(small_solver, monkeypatch):
+    candidates = np.arange(len(ANSWERS))
+    expected = [entropy(guess, ANSWERS) for guess in GUESSES]
+    assert np.allclose(small_solver.expected_information(candidates), expected)
+    # the same when counted a few guesses at a time
+    monkeypatch.setattr(solver, "COUNT_BATCH_CELLS", len(ANSWERS) * 3)
+    assert np.allclose(small_solver.expected_information(candidates), expected)
+
+
+def test_best_guess_ranks_by_entropy(small_solver):
+    candidates = np.arange(len(ANSWERS))
+    guess, bits = small_solver.best_guess(candidates)
+    best = max(entropy(word, ANSWERS) for word in GUESSES)
+    assert math.isclose(bits, best)
+    # of the guesses that tell as much, one that could be the answer
+    tied = [word for word in GUESSES if math.isclose(entropy(word, ANSWERS), best)]
+    assert guess == next((word for word in tied if word in ANSWERS), tied[0])
+
+
+def test_best_guess_of_two_candidates_is_one_of_them(small_solver):
+    candidates = np.array([ANSWERS.index("speed"), ANSWERS.index("steel")])
+    assert small_solver.best_guess(candidates) == ("speed", 1.0)
+
+
+def test_hint_narrows_down_the_answers(small_solver):
+    rows = [("crane", score_guess("crane", "steel"))]
+    fitting = [answer for answer in ANSWERS if score_guess("crane", answer) == rows[0][1]]
+    guess, bits, left = small_solver.hint(rows)
+    assert left == len(fitting)
+    assert [ANSWERS[j] for j in small_solver.candidates(rows)] == fitting
+    # a guess that isn't in the matrix, as easy mode allows
+    rows.append(("zzzzz", score_guess("zzzzz", "steel")))
+    assert len(small_solver.candidates(rows)) == len(fitting)
+    # no answer fits
+    assert small_solver.hint([("geese", (CORRECT,) * 5), ("steel", (CORRECT,) * 5)]) == (None, 0.0, 0)
+
+
+def test_difficulty(small_solver):
+    first, _ = small_solver.first_guess()
+    assert small_solver.difficulty(first)["solver_guesses"] == 1
+    for answer in ANSWERS:
+        assert 1 <= small_solver.difficulty(answer)["solver_guesses"] <= len(ANSWERS)
+    assert small_solver.difficulty("zzzzz") is None
+
+
+def test_matrix_is_saved_and_memory_mapped(language, tmp_path):
+    matrix = np.array(load_solver(language, str(tmp_path)).matrix)
+    [path] = tmp_path.glob("patterns-*.npy")
+    again = load_solver(language, str(tmp_path))
+    assert isinstance(again.matrix, np.memmap)
+    assert (again.matrix == matrix).all()
+
+    path.write_bytes(b"not a matrix")
+    rebuilt = load_solver(language, str(tmp_path))
+    assert (rebuilt.matrix == matrix).all()
+
+
+@pytest.fixture
+def hints(monkeypatch, tmp_path):
+    monkeypatch.setattr(config, "HINTS_ENABLED", True)
+    monkeypatch.setattr(config, "SOLVER_CACHE_DIR", str(tmp_path))
+
+
+def test_hint_route(hints, login):
+    from conftest import WORDS
+
+    client = login("alice")
+    body = client.get("/hint").get_json()
+    assert body["hint"] in WORDS and body["candidates"] == len(WORDS)
+    assert body["expected_bits"] > 0
+
+
+def test_no_hints_when_turned_off(login):
+    assert login("alice").get("/hint").status_code == 404
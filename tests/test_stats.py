@@ -0,0 +1,160 @@
+'''Players' and days' stats, kept up to date as games end and rebuilt from the boards'''
+import pytest
+
+from utils import get_idx_end_time, get_todays_idx
+
+
+def test_streaks_follow_the_days():
+    from models import UserStats
+
+    stats = UserStats("alice")
+    for game_date_idx, num_attempts, won in [(10, 3, True), (11, 4, True), (13, 2, True), (14, 6, False), (15, 1, True)]:
+        stats.add_game(game_date_idx, num_attempts, won)
+    counts = stats.to_dict(15)
+    assert (counts["wins"], counts["losses"], counts["total_attempts"]) == (4, 1, 16)
+    # day 12 was skipped, day 14 was lost
+    assert (counts["current_streak"], counts["longest_streak"]) == (1, 2)
+    assert counts["guess_distribution"] == [1, 1, 1, 1, 0, 0]
+    assert stats.to_dict(16)["current_streak"] == 1
+    # nobody won yesterday's or today's game
+    assert stats.to_dict(17)["current_streak"] == 0
+
+
+@pytest.fixture
+def add_board(db):
+    '''add_board(user_id, game_date_idx, num_attempts, won, finished_at) saves a finished board'''
+    from models import Result, User
+
+    def add_board(user_id, game_date_idx, num_attempts, won=True, finished_at=None):
+        User.create_user(user_id, user_id.title(), f"{user_id}@example.com")
+        result = Result.create_result(user_id, game_date_idx)
+        result.num_attempts = num_attempts
+        result.guesses = "crane" * num_attempts
+        result.game_over = True
+        result.game_won = won
+        result.game_lost = not won
+        result.finished_at = finished_at
+        db.commit()
+        return result
+    return add_board
+
+
+def test_fastest_solvers_fewest_attempts_then_earliest(add_board):
+    from models import DailyStats
+
+    day = get_todays_idx() - 1
+    end = get_idx_end_time(day)
+    add_board("late", day, 3, finished_at=end - 10)
+    add_board("early", day, 3, finished_at=end - 1000)
+    add_board("quick", day, 2, finished_at=end - 5)
+    add_board("lost", day, 6, won=False, finished_at=end - 2000)
+    add_board("yesterday", day - 1, 1, finished_at=end - 2000)
+    # won from the archive after the day was over
+    add_board("archive", day, 1, finished_at=end + 10)
+
+    solvers = DailyStats.fastest_solvers(day, 10)
+    assert [solver["name"] for solver in solvers] == ["Quick", "Early", "Late"]
+    assert solvers[0] == {"name": "Quick", "num_attempts": 2, "finished_at": end - 5}
+    assert len(DailyStats.fastest_solvers(day, 2)) == 2
+
+
+def test_fastest_solvers_rank_untimed_games_last(add_board):
+    from models import DailyStats
+
+    day = get_todays_idx() - 1
+    end = get_idx_end_time(day)
+    add_board("untimed", day, 3)
+    add_board("late", day, 3, finished_at=end - 10)
+    add_board("early", day, 3, finished_at=end - 1000)
+    add_board("quick", day, 2, finished_at=end - 5)
+    # won from the archive after the day was over
+    add_board("archive", day, 1, finished_at=end + 10)
+    add_board("lost", day, 6, won=False, finished_at=end - 2000)
+
+    names = [solver["name"] for solver in DailyStats.fastest_solvers(day, 10)]
+    assert names == ["Quick", "Early", "Late", "Untimed"]
+
+
+def play(client, language, game_date_idx, guesses):
+    '''Play guesses on a board through /guess, then the answer if it isn't one of them'''
+    answer = language.get_daily_word(game_date_idx)
+    for row, guess in enumerate(guesses):
+        response = client.post("/guess", json={
+            "guess": guess, "row": row, "key": f"{game_date_idx}-{row}",
+            "game_date_idx": game_date_idx, "allow_any_word": True,
+        })
+        assert response.status_code == 200, response.get_json()
+        if guess == answer:
+            break
+    return response.get_json()
+
+
+def stats_snapshot(user_ids, days):
+    from models import DailyStats, UserStats
+    return (
+        {user_id: UserStats.get_stats(user_id).to_dict() for user_id in user_ids},
+        {day: DailyStats.get_stats(day).to_dict() for day in days},
+    )
+
+
+def test_backfill_matches_live_counters(login, language):
+    from models import DailyStats, UserStats
+
+    today = get_todays_idx()
+    answer = language.get_daily_word(today)
+    alice, bob, carol = login("alice"), login("bob"), login("carol")
+    assert play(alice, language, today, ["crane", answer])["game_won"]
+    assert play(bob, language, today, ["zzzzz"] * 6)["game_lost"]
+    # archive games don't count towards anything, however they end
+    for day in (today - 3, today - 1):
+        assert play(carol, language, day, [language.get_daily_word(day)])["game_won"]
+    assert play(alice, language, today - 3, ["yyyyy"] * 6)["game_lost"]
+
+    users, days = ["alice", "bob", "carol"], [today - 3, today - 1, today]
+    live = stats_snapshot(users, days)
+    assert live[0]["carol"]["games"] == 0
+    assert live[0]["alice"]["games"] == 1
+    assert live[1][today]["games"] == 2 and live[1][today - 3]["games"] == 0
+
+    UserStats.backfill()
+    DailyStats.backfill()
+    assert stats_snapshot(users, days) == live
+
+
+def test_leaderboard_is_a_cached_snapshot(login, language):
+    import leaderboard
+
+    today = get_todays_idx()
+    alice = login("alice")
+    alice.post("/update-game-result", json={"guess": language.get_daily_word(today)})
+    board = alice.get("/leaderboard").get_json()
+    assert board["game_date_idx"] == today
+    assert board["today"]["wins"] == 1
+    assert [solver["name"] for solver in board["today"]["fastest_solvers"]] == ["Alice"]
+    assert [player["name"] for player in board["most_wins"]] == ["Alice"]
+
+    # bob's win shows up once the snapshot expires
+    login("bob").post("/update-game-result", json={"guess": language.get_daily_word(today)})
+    assert alice.get("/leaderboard").get_json() == board
+    leaderboard.snapshot_cache.clear()
+    assert alice.get("/leaderboard").get_json()["today"]["wins"] == 2
+
+    assert alice.get(f"/daily-stats/{today - 1}").get_json()["games"] == 0
+    assert alice.get(f"/daily-stats/{today + 1}").status_code == 404
+
+
+def test_expired_snapshots_are_rebuilt(monkeypatch):
+    import leaderboard
+    from leaderboard import SnapshotCache
+
+    now = 100.0
+    monkeypatch.setattr(leaderboard.time, "monotonic", lambda: now)
+    cache = SnapshotCache(ttl=10)
+    builds = []
+    build = lambda: builds.append(now) or len(builds)  # noqa: E731
+    assert cache.get("key", build) == 1
+    now += 9
+    assert cache.get("key", build) == 1
+    now += 1
+    assert cache.get("key", build) == 2
+    assert cache.stats == {"hits": 1, "refreshes": 2}
@@ -0,0 +1,67 @@
+'''UserCache and how the user_loader finds the signed in user'''
+import pytest
+
+import models
+from models import User, UserCache
+
+ALICE = ("alice", "Alice", "alice@example.com")
+
+
+def test_least_recently_used_is_evicted():
+    cache = UserCache(max_size=2, ttl=60)
+    cache.put("a", ("a", "A", "a@example.com"))
+    cache.put("b", ("b", "B", "b@example.com"))
+    assert cache.get("a") is not None
+    cache.put("c", ("c", "C", "c@example.com"))
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.get_stats() == {
+        "hits": 3, "misses": 1, "evictions": 1, "invalidations": 0, "size": 2, "max_size": 2,
+    }
+
+
+def test_entries_expire(monkeypatch):
+    cache = UserCache(max_size=2, ttl=60)
+    now = 1000.0
+    monkeypatch.setattr(models.time, "monotonic", lambda: now)
+    cache.put("a", ALICE)
+    now += 60
+    assert cache.get("a") == ALICE
+    now += 1
+    assert cache.get("a") is None
+
+
+def test_size_zero_caches_nothing():
+    cache = UserCache(max_size=0, ttl=60)
+    cache.put("a", ALICE)
+    assert cache.get("a") is None and cache.get_stats()["size"] == 0
+
+
+def test_load_user_goes_to_the_database_once(db):
+    User.create_user(*ALICE)
+    assert User.load_user("alice").identity == ALICE
+    assert User.load_user("alice").identity == ALICE
+    assert models.user_cache.get_stats()["hits"] >= 1
+    assert User.load_user("nobody") is None
+    assert models.user_cache.get("nobody") is None
+
+
+def test_creating_a_user_again_invalidates_it(db):
+    User.create_user(*ALICE)
+    User.load_user("alice")
+    User.create_user(*ALICE)
+    assert models.user_cache.get("alice") is None
+
+
+@pytest.mark.parametrize("session_identity", [False, True])
+def test_user_loader(app, monkeypatch, session_identity):
+    from app import load_user
+
+    monkeypatch.setitem(app.config, "SESSION_IDENTITY", session_identity)
+    User.create_user(*ALICE)
+    with app.test_request_context():
+        from flask import session
+        session["identity"] = ["alice", "Alice from the cookie", "alice@example.com"]
+        name = load_user("alice").name
+    # the cookie is only read when SESSION_IDENTITY is on
+    assert name == ("Alice from the cookie" if session_identity else "Alice")
@@ -0,0 +1,160 @@
+'''WordIndex and checking guesses against it, and word files: writing and
+mapping them, rejecting damaged ones, and noticing when the word lists they
+were compiled from changed'''
+import os
+import shutil
+import sys
+import time
+
+import pytest
+
+from assets import WordListAsset
+from constraints import BoardConstraints, ConstraintIndex
+from scoring import score_guess
+from word_index import WORD_FILE_HEADER, MappedWordIndex, WordIndex, write_word_file
+
+CHARACTERS = tuple("abcdefghijklmnopqrstuvwxyz")
+WORDS = ("geese", "speed", "steel", "crane", "slate", "llama", "sassy", "audit")
+DIGEST, STAMP = b"d" * 16, b"s" * 16
+
+
+@pytest.fixture
+def index():
+    return WordIndex(CHARACTERS, WORDS + ("crane", "toolong" * 3, "n0pe!"))
+
+
+def test_lookups(index):
+    assert len(index) == len(WORDS)
+    assert list(index) == sorted(WORDS)
+    assert "steel" in index and "crane" in index
+    assert "stool" not in index and "" not in index
+    # too long, or letters outside the character set
+    assert "toolong" * 3 not in index and "n0pe!" not in index
+
+
+def test_pack_round_trip(index):
+    for word in WORDS + ("a", "z" * WordIndex.MAX_WORD_LENGTH):
+        assert index.unpack(index.pack(word)) == word
+    assert index.pack("a" * (WordIndex.MAX_WORD_LENGTH + 1)) is None
+
+
+def test_check_word_routes(login):
+    client = login("alice")
+    assert client.get("/check-word", query_string={"word": " Crane "}).get_json() == {"word": "crane", "valid": True}
+    assert client.get("/check-word", query_string={"word": "zzzzz"}).get_json()["valid"] is False
+    body = client.post("/check-words", json={"words": ["slate", "qqqqq"]}).get_json()
+    assert body == {"results": {"slate": True, "qqqqq": False}}
+    assert client.post("/check-words", json={"words": "slate"}).status_code == 400
+    assert client.post("/check-words", json={"words": ["slate"] * 101}).status_code == 400
+
+
+@pytest.fixture
+def word_file(index, tmp_path):
+    words = tuple(index)
+    path = str(tmp_path / "words.bin")
+    write_word_file(path, index, ConstraintIndex(words), WordListAsset(words), DIGEST, STAMP)
+    return path
+
+
+def test_word_file_round_trip(index, word_file):
+    mapped = MappedWordIndex(word_file)
+    assert list(mapped) == list(index) == sorted(WORDS)
+    assert "steel" in mapped and "stool" not in mapped and "toolong" not in mapped
+    assert mapped.characters == CHARACTERS
+    assert (mapped.source_digest, mapped.source_stamp) == (DIGEST, STAMP)
+
+
+def test_compiled_bitsets_and_asset(index, word_file):
+    from assets import MappedWordListAsset
+    from constraints import MappedConstraintIndex
+
+    mapped = MappedWordIndex(word_file)
+    built = ConstraintIndex(tuple(index))
+    constraints = MappedConstraintIndex(mapped)
+    for answer in WORDS:
+        for guess in ("geese", "llama", "zesty"):
+            board = BoardConstraints([(guess, score_guess(guess, answer))])
+            assert constraints.matching(board) == built.matching(board)
+    assert constraints.position_bits(9, "a") == constraints.copies_bits("a", 9) == 0
+    assert constraints.position_bits(0, "?") == 0
+
+    asset, expected = MappedWordListAsset(mapped), WordListAsset(tuple(index))
+    assert asset.filename == expected.filename
+    assert asset.body == expected.body and asset.gzip_body == expected.gzip_body
+    assert asset.encoded_body("gzip") == expected.encoded_body("gzip")
+
+
+def damaged(path, change):
+    with open(path, "rb") as f:
+        data = bytearray(f.read())
+    with open(path, "wb") as f:
+        f.write(change(data))
+
+
+@pytest.mark.parametrize("change, error", [
+    (lambda data: b"NOTWORDS" + data[8:], "wrong magic number"),
+    (lambda data: data[:-20], "truncated"),
+    (lambda data: data[:WORD_FILE_HEADER.size - 10], "unpack"),
+    (lambda data: data[:-1] + bytes([data[-1] ^ 1]), "checksum mismatch"),
+    (lambda data: data[:WORD_FILE_HEADER.size + 40] + b"\xff" + data[WORD_FILE_HEADER.size + 41:], "checksum mismatch"),
+])
+def test_damaged_file_is_rejected(word_file, change, error):
+    damaged(word_file, change)
+    with pytest.raises(ValueError, match=error):
+        MappedWordIndex(word_file)
+
+
+def test_big_endian_machine_is_rejected(word_file, monkeypatch):
+    monkeypatch.setattr(sys, "byteorder", "big")
+    with pytest.raises(ValueError, match="little-endian"):
+        MappedWordIndex(word_file)
+
+
+@pytest.fixture
+def game(data_dir, monkeypatch):
+    '''A hosted game of its own, so its word lists can be changed. Yields its data directory'''
+    from models import language_registry
+
+    key = ("zz", 5)
+    path = os.path.join(data_dir, key[0])
+    os.makedirs(path, exist_ok=True)
+    shutil.copy(os.path.join(data_dir, "characters.txt"), path)
+    with open(os.path.join(path, "words.txt"), "w", encoding="utf-8") as f:
+        f.write("\n".join(WORDS) + "\n")
+    monkeypatch.setattr(language_registry, "keys", language_registry.keys + (key,))
+    yield path
+    shutil.rmtree(path)
+
+
+def load(path):
+    from models import Language
+    return Language("zz", 5, data_dir=path)
+
+
+def test_word_file_is_used_until_the_word_lists_change(game):
+    from models import compile_word_file
+
+    path, n_words = compile_word_file(("zz", 5))
+    assert n_words == len(WORDS)
+    language = load(game)
+    assert isinstance(language.word_index, MappedWordIndex)
+    assert language.constraint_index.count(BoardConstraints([])) == len(WORDS)
+
+    # touched but the same words: the stamp is stale, the digest isn't
+    words_txt = os.path.join(game, "words.txt")
+    later = time.time() + 10
+    os.utime(words_txt, (later, later))
+    assert isinstance(load(game).word_index, MappedWordIndex)
+
+    with open(words_txt, "a", encoding="utf-8") as f:
+        f.write("pious\n")
+    language = load(game)
+    assert not isinstance(language.word_index, MappedWordIndex)
+    assert "pious" in language.word_index
+    assert language.constraint_index.count(BoardConstraints([])) == len(WORDS) + 1
+
+    # until it's compiled again
+    compile_word_file(("zz", 5))
+    language = load(game)
+    assert isinstance(language.word_index, MappedWordIndex) and "pious" in language.word_index
+    os.remove(path)
@@ -0,0 +1,214 @@
+'''The write-behind queue: merging writes to a board, rejecting stale ones, and
+saving a batch where some writes conflict or fail'''
+import pytest
+from sqlalchemy import update
+
+from scoring import pack_board
+from utils import get_todays_idx
+from write_queue import WriteQueue, WriteQueueFull
+
+
+def paused_queue(apply, **options):
+    '''A WriteQueue whose writer thread doesn't start until drain()'''
+    queue = WriteQueue(apply, **options)
+    queue._start = lambda: None
+    return queue
+
+
+def drain(queue):
+    '''Save everything queued, on this thread'''
+    queue.close()
+    queue._run()
+
+
+def save_all(batches):
+    def apply(writes):
+        batches.append(list(writes))
+        for write in writes:
+            write.saved = True
+            for after in write.after:
+                after()
+    return apply
+
+
+def test_writes_to_a_row_are_merged():
+    batches, done = [], []
+    queue = paused_queue(save_all(batches))
+    first = queue.submit("board", {"num_attempts": 0}, {"num_attempts": 1, "guesses": "crane"}, lambda: done.append(1))
+    second = queue.submit("board", {"num_attempts": 1}, {"num_attempts": 2, "guesses": "craneaudit"}, lambda: done.append(2))
+    assert second is first
+    assert queue.pending_values("board") == {"num_attempts": 2, "guesses": "craneaudit"}
+
+    drain(queue)
+    assert [len(batch) for batch in batches] == [1]
+    assert first.wait(0) is True and done == [1, 2]
+    assert queue.pending_values("board") is None
+    assert (queue.stats["queued"], queue.stats["merged"], queue.stats["saved"]) == (1, 1, 1)
+
+
+def test_stale_write_is_rejected():
+    queue = paused_queue(save_all([]))
+    write = queue.submit("board", {"num_attempts": 0}, {"num_attempts": 1})
+    # a second tab that read the board before the first guess
+    assert queue.submit("board", {"num_attempts": 0}, {"num_attempts": 1}) is None
+    assert write.wait(0) is None
+    drain(queue)
+    assert write.wait(0) is True
+
+
+def test_full_queue_raises():
+    queue = paused_queue(save_all([]), max_size=1, timeout=0.01)
+    queue.submit("alice", {}, {"num_attempts": 1})
+    with pytest.raises(WriteQueueFull):
+        queue.submit("bob", {}, {"num_attempts": 1})
+    assert queue.stats["full"] == 1
+    # more for a row that's already queued still fits
+    assert queue.submit("alice", {"num_attempts": 1}, {"num_attempts": 2}) is not None
+
+
+def test_conflicts_and_failures_are_counted_apart():
+    def apply(writes):
+        for write in writes:
+            write.saved = write.key == "saved"
+            write.failed = write.key == "failed"
+
+    queue = paused_queue(apply)
+    writes = [queue.submit(key, {}, {"num_attempts": 1}) for key in ("saved", "conflict", "failed")]
+    drain(queue)
+    assert [write.wait(0) for write in writes] == [True, False, False]
+    assert (queue.stats["saved"], queue.stats["conflicts"], queue.stats["failed"]) == (1, 1, 1)
+
+
+def test_failed_transaction_fails_the_whole_batch():
+    def apply(writes):
+        raise RuntimeError("disk I/O error")
+
+    queue = paused_queue(apply)
+    writes = [queue.submit(key, {}, {"num_attempts": 1}) for key in ("alice", "bob")]
+    drain(queue)
+    assert all(write.wait(0) is False and write.failed for write in writes)
+    assert queue.stats["failed"] == 2 and queue.stats["conflicts"] == 0
+    assert queue.pending_values("alice") is None
+
+
+@pytest.fixture
+def boards(login, language):
+    '''alice's, bob's and carol's empty boards for today'''
+    from models import Result
+
+    keys = []
+    for user_id in ("alice", "bob", "carol"):
+        login(user_id)
+        keys.append(Result.get_result(user_id).board_key)
+    return keys
+
+
+def queued_write(key, after=None, num_attempts=0, guesses="", guess="crane"):
+    from write_queue import QueuedWrite
+    return QueuedWrite(key, {"num_attempts": num_attempts, "guesses": guesses, "game_over": False},
+                       {"num_attempts": num_attempts + 1, "guesses": guesses + guess, "states": pack_board([(1, 1, 2, 1, 1)], 5)}, after)
+
+
+def saved_attempts(user_id):
+    from database import db_session
+    from models import Result
+
+    db_session.remove()
+    return Result.get_result(user_id).num_attempts
+
+
+def test_one_failing_write_keeps_the_rest_of_the_batch(boards):
+    from models import Result
+
+    def fail():
+        raise RuntimeError("stats table is gone")
+
+    saved = []
+    writes = [
+        queued_write(boards[0], lambda: saved.append("alice")),
+        queued_write(boards[1], fail),
+        queued_write(boards[2], lambda: saved.append("carol")),
+    ]
+    Result.save_queued(writes)
+    assert [(write.saved, write.failed) for write in writes] == [(True, False), (False, True), (True, False)]
+    assert saved == ["alice", "carol"]
+    assert [saved_attempts(user_id) for user_id in ("alice", "bob", "carol")] == [1, 0, 1]
+
+
+def test_write_to_a_board_that_moved_on_is_not_saved(boards):
+    from models import Result
+
+    write = queued_write(boards[0], num_attempts=3)
+    Result.save_queued([write])
+    assert (write.saved, write.failed) == (False, False)
+    assert saved_attempts("alice") == 0
+
+
+def test_two_workers_guessing_the_same_row(boards):
+    from models import Result
+
+    # both workers read the empty board, each queues its own first guess
+    first, second = queued_write(boards[0], guess="crane"), queued_write(boards[0], guess="slate")
+    Result.save_queued([first])
+    Result.save_queued([second])
+    assert (first.saved, second.saved, second.failed) == (True, False, False)
+    assert saved_attempts("alice") == 1 and Result.get_result("alice").guesses == "crane"
+
+
+def test_queued_guess_checks_the_guesses_it_read(boards, monkeypatch):
+    import models
+    from database import db_session
+    from models import Result
+
+    idx = get_todays_idx()
+    Result.append_guess("alice", idx, 0, "crane", "steel", "k0")
+    queue = paused_queue(Result.save_queued)
+    monkeypatch.setattr(models, "result_writes", queue)
+    _, states = Result.queue_guess("alice", idx, 1, "audit", "steel", "k1")
+    assert states is not None
+    write = queue.pending[boards[0]]
+    assert write.conditions == {"num_attempts": 1, "guesses": "crane", "game_over": False}
+
+    # meanwhile another worker's first guess replaced this one, at the same row count
+    db_session.execute(update(Result).where(Result.user_id == "alice").values(guesses="slate"))
+    db_session.commit()
+    drain(queue)
+    assert write.wait(0) is False
+    assert saved_attempts("alice") == 1
+    assert Result.get_result("alice").guesses == "slate"
+
+
+@pytest.fixture
+def app(db):
+    '''The app with WRITE_QUEUE_ENABLED, and result_writes drained afterwards'''
+    from app import create_app
+    from models import result_writes
+
+    yield create_app({"TESTING": True, "WRITE_QUEUE_ENABLED": True})
+    result_writes.close()
+    result_writes._reset()
+
+
+def test_queued_guesses(login, language):
+    from models import UserStats, result_writes
+
+    client = login("alice")
+    answer = language.get_daily_word(get_todays_idx())
+    miss = next(word for word in ("crane", "slate") if word != answer)
+
+    response = client.post("/guess", json={"guess": miss, "row": 0, "key": "k0"})
+    assert response.status_code == 200
+    # the same worker sees the queued guess before it's committed
+    assert client.get("/get-game-result").get_json()["guesses"] == [miss]
+    again = client.post("/guess", json={"guess": miss, "row": 0, "key": "k0"})
+    assert again.status_code == 200 and again.get_json()["guesses"] == [miss]
+    stale = client.post("/guess", json={"guess": miss, "row": 0, "key": "other-tab"})
+    assert stale.status_code == 409
+
+    # the last guess waits for its commit
+    won = client.post("/guess", json={"guess": answer, "row": 1, "key": "k1"}).get_json()
+    assert won["game_won"] and won["guesses"] == [miss, answer]
+    result_writes.close()
+    assert saved_attempts("alice") == 2
+    assert UserStats.get_stats("alice").to_dict(get_todays_idx())["wins"] == 1
+    assert result_writes.stats["failed"] == 0
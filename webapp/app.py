@@ -1,17 +1,24 @@
 """Flask app logic"""
 # Python Standard Libraries
+import hmac
 import json
-import logging
-import random
+import time
 
 # Third-party libraries
+import click
 from flask import (
+    Blueprint,
     Flask,
+    Response,
+    abort,
+    current_app,
+    make_response,
     render_template,
     redirect,
     url_for,
-    # session,  # needed for Google sign-in
+    session,
     request,
+    stream_with_context,
 )
 from flask_login import (
     LoginManager,
@@ -20,74 +27,155 @@ from flask_login import (
     login_user,
     logout_user,
 )
-from oauthlib.oauth2 import WebApplicationClient
-import requests
 
 # used to allow the Flask app to work behind a reverse proxy
 from werkzeug.middleware.proxy_fix import ProxyFix
 
 # Internal Imports
-# from db import get_db, close_connection, query_db
+import config
+
 from utils import (
+    HTTP_TIMEOUT,
+    get_date_of_idx,
+    get_idx_end_time,
     get_google_provider_cfg,
-    logger
+    get_http_session,
+    google_provider_cfg_cache,
+    logger,
+    setup_logging
 )
 
 from models import (
-    Language,
     User,
-    Result
+    Result,
+    UserStats,
+    DailyStats,
+    compile_word_file,
+    get_language,
+    language_registry,
+    language_stats,
+    result_writes,
+    user_cache
 )
 
+from scoring import STATE_NAMES
+
+import export
+
+from assets import PageCache
+
+from leaderboard import get_daily_stats, get_leaderboard, snapshot_cache
+
 from database import (
+    check_db,
     db_session,
+    engine,
     init_db
 )
 
-# set random seed 42 for reproducibility (important to maintain stable word lists)
-random.seed(42)
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, metrics
 
-# Flask app setup
-app = Flask(__name__)
-app.config.from_pyfile('config.py')
+from compression import CompressionMiddleware
 
-# Create the database
-init_db()
 
-# Use secret key to cryptographically sign cookies and other items
-app.secret_key = app.config['SECRET_KEY']
+from constraints import BoardConstraints
+
+from write_queue import WriteQueueFull
+
+# Every route and command. create_app() registers them on the app
+views = Blueprint("views", __name__, cli_group=None)
 
 # User session management setup
 # https://flask-login.readthedocs.io/en/latest
 login_manager = LoginManager()
-login_manager.init_app(app)
 
-# OAuth 2 client setup
-client = WebApplicationClient(app.config['GOOGLE_CLIENT_ID'])
+MAX_CHECK_WORDS = 100 # Most words /check-words will look up in one request
+
+# Rendered game pages, by (game_date_idx, archive). See render_game()
+game_page_cache = PageCache()
+
+
+def create_app(test_config=None):
+    '''Build the Flask app, with settings from config.py updated with test_config.
+
+    This is cheap: nothing here touches the database or the word lists. The schema
+    and daily word schedule are set up once per deployment with `flask init-db`,
+    and warm_up() loads the word lists (see wsgi.py and gunicorn.conf.py)'''
+    app = Flask(__name__)
+    app.config.from_object(config)
+    if test_config:
+        app.config.update(test_config)
+
+    setup_logging(
+        app.config['LOG_LEVEL'],
+        app.config['LOG_FILE'],
+        app.config['LOG_MAX_BYTES'],
+        app.config['LOG_BACKUP_COUNT']
+    )
+
+    # Use secret key to cryptographically sign cookies and other items
+    app.secret_key = app.config['SECRET_KEY']
+    login_manager.init_app(app)
+
+    # Reverse Proxy Config
+    app.wsgi_app = ProxyFix(
+        app.wsgi_app,
+        x_for=int(app.config['WSGI_X_FOR']),
+        x_proto=int(app.config['WSGI_X_PROTO']),
+        x_host=int(app.config['WSGI_X_HOST']),
+        x_prefix=int(app.config['WSGI_X_PREFIX'])
+    )
+    # Compression and ETags for every response that doesn't bring its own
+    compression = CompressionMiddleware(
+        app.wsgi_app,
+        min_size=app.config['COMPRESS_MIN_SIZE'],
+        level=app.config['COMPRESS_LEVEL'],
+        etags=app.config['CONDITIONAL_GET']
+    )
+    app.extensions["compression"] = compression
+    app.wsgi_app = compression
+
+    # Registered before the blueprint's request hooks so redirects are timed too
+    if app.config['METRICS_ENABLED']:
+        metrics.init_app(app, engine)
+
+    app.teardown_appcontext(shutdown_session)
+    app.register_blueprint(views)
+    return app
+
+
+def warm_up():
+    '''Load the word lists and daily word schedule now rather than on the first request.
+
+    Under gunicorn with preload_app this runs once in the master process, and the
+    forked workers share what it loaded instead of each building their own copy'''
+    check_db()
+    get_language().schedule_words()
+    if config.HINTS_ENABLED:
+        from solver import get_solver
+        get_solver()
+
+
+def oauth_client():
+    '''OAuth 2 client for Google sign-in. oauthlib is only imported once someone signs in'''
+    from oauthlib.oauth2 import WebApplicationClient
+    return WebApplicationClient(current_app.config['GOOGLE_CLIENT_ID'])
+
 
 @login_manager.user_loader
 def load_user(user_id):
-    '''Flask-Login helper to retrieve a user from our db'''
+    '''Flask-Login helper to retrieve a user from the session, the cache or our db'''
     try:
-        user = User.get_user(user_id)
+        if current_app.config['SESSION_IDENTITY']:
+            identity = session.get("identity")
+            if identity and identity[0] == user_id:
+                return User.from_identity(identity)
+        user = User.load_user(user_id)
         return user
     except Exception as e:
         logger.debug("Error loading user: %s", e)
 
-ALLOWED_DOMAINS = app.config['ALLOWED_DOMAINS'] # Only allow users from these domains
-
-# Reverse Proxy Config
-app.wsgi_app = ProxyFix(
-    app.wsgi_app,
-    x_for=int(app.config['WSGI_X_FOR']),
-    x_proto=int(app.config['WSGI_X_PROTO']),
-    x_host=int(app.config['WSGI_X_HOST']),
-    x_prefix=int(app.config['WSGI_X_PREFIX'])
-)
-
-logging.basicConfig(level=logging.DEBUG)
 
-@app.teardown_appcontext
 def shutdown_session(exception=None):
     '''Flask will automatically remove database sessions at the end of the request or when the applicaiton shuts down'''
     db_session.remove()
@@ -96,7 +184,7 @@ def shutdown_session(exception=None):
 ###########
 # ROUTES
 ###########
-@app.before_request
+@views.before_app_request
 def before_request():
     '''Before request, redirect to https'''
     if (
@@ -110,12 +198,12 @@ def before_request():
         return redirect(url, code=code)
 
 
-@app.route("/")
+@views.route("/")
 def index():
     '''Prompt Users to Sign In w/ Google.'''
     try:
         if current_user.is_authenticated:
-            return redirect(url_for("game"))
+            return redirect(url_for(".game"))
         return """
             <html>
                 <head>
@@ -184,7 +272,7 @@ def index():
         return render_template("error.html", message=f"An unexpected error occurred: {e}"), 500
 
 
-@app.route("/login")
+@views.route("/login")
 def login():
     '''Google Account Login.'''
     # Find out what URL to hit for Google Login
@@ -193,7 +281,7 @@ def login():
 
     # Use library to construct the request for Google login and provide
     # scopes that let you retrieve user's profile from Google
-    request_uri = client.prepare_request_uri(
+    request_uri = oauth_client().prepare_request_uri(
         authorization_endpoint,
         redirect_uri=request.base_url + "/callback",
         scope=["openid", "https://www.googleapis.com/auth/userinfo.email", "https://www.googleapis.com/auth/userinfo.profile"],
@@ -202,7 +290,7 @@ def login():
     return redirect(request_uri)
 
 
-@app.route("/login/callback")
+@views.route("/login/callback")
 def callback():
     '''Google Account Callback'''
     # Get authorization code Google sent back to you
@@ -214,6 +302,7 @@ def callback():
     token_endpoint = google_provider_cfg["token_endpoint"]
 
     # Prepare and send a request to get tokens!
+    client = oauth_client()
     token_url, headers, body = client.prepare_token_request(
         token_endpoint,
         authorization_response=request.url,
@@ -221,12 +310,13 @@ def callback():
         code=code
     )
 
-    token_response = requests.post(
+    http_session = get_http_session()
+    token_response = http_session.post(
         token_url,
         headers=headers,
         data=body,
-        auth=(app.config['GOOGLE_CLIENT_ID'], app.config['GOOGLE_CLIENT_SECRET']),
-        timeout=30
+        auth=(current_app.config['GOOGLE_CLIENT_ID'], current_app.config['GOOGLE_CLIENT_SECRET']),
+        timeout=HTTP_TIMEOUT
     )
 
     # Parse the tokens
@@ -237,125 +327,577 @@ def callback():
     # including their Google profile image and email
     userinfo_endpoint = google_provider_cfg["userinfo_endpoint"]
     uri, headers, body = client.add_token(userinfo_endpoint)
-    userinfo_response = requests.get(uri, headers=headers, data=body, timeout=30)
+    userinfo_response = http_session.get(uri, headers=headers, data=body, timeout=HTTP_TIMEOUT)
+    userinfo = userinfo_response.json()
 
     # Make sure their email is verified
     # The user authenticated with Google, authorized the
     # app, and now we've verified their email through Google
-    if userinfo_response.json().get("email_verified"):
-        unique_id = userinfo_response.json()["sub"]
-        email = userinfo_response.json()["email"]
-        name = userinfo_response.json()["given_name"]
+    if userinfo.get("email_verified"):
+        unique_id = userinfo["sub"]
+        email = userinfo["email"]
+        name = userinfo["given_name"]
     else:
         return "User email not available or not verified by Google.", 400
 
     # Check if the account is part of the organization
     logger.debug("domain: %s", email.split("@")[-1])
-    if email.split("@")[-1] not in ALLOWED_DOMAINS:
+    if email.split("@")[-1] not in current_app.config['ALLOWED_DOMAINS']:
         return "Access denied: you must use a company email address.", 403
 
     user = User.create_user(unique_id, name, email)
 
     # Begin user session by logging the user in
     login_user(user)
+    if current_app.config['SESSION_IDENTITY']:
+        session["identity"] = list(user.identity)
 
     # Send user to game
-    return redirect(url_for("game"))
+    return redirect(url_for(".game"))
 
 
-@app.route("/logout")
+@views.route("/logout")
 @login_required
 def logout():
     '''Google Account Logout.'''
     logout_user()
-    return redirect(url_for("index"))
+    session.pop("identity", None)
+    return redirect(url_for(".index"))
+
+
+def send_asset(asset, max_age, public=False, immutable=False):
+    '''Response for a CompressedAsset: 304 if the client has it, else the best encoding it accepts'''
+    body, encoding, etag = asset.encoded_body(request.headers.get("Accept-Encoding"))
+    if request.if_none_match.contains(etag):
+        response = make_response("", 304)
+    else:
+        response = make_response(body)
+        response.content_type = asset.content_type
+        if encoding:
+            response.content_encoding = encoding
+
+    response.set_etag(etag)
+    if public:
+        response.cache_control.public = True
+    else:
+        response.cache_control.private = True
+    response.cache_control.max_age = max_age
+    if immutable:
+        response.cache_control.immutable = True
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def bearer_token_matches(token):
+    '''Whether the request has "Authorization: Bearer <token>", compared in constant time'''
+    sent = request.headers.get("Authorization", "").encode("utf-8")
+    return hmac.compare_digest(sent, f"Bearer {token}".encode("utf-8"))
+
+
+def requested_game_idx(value):
+    '''Game index a request asked for, today's if it didn't ask.
+    None if it isn't today's or an earlier game'''
+    todays_idx = get_language().todays_idx
+    if value is None or value == "":
+        return todays_idx
+    try:
+        game_date_idx = int(value)
+    except (TypeError, ValueError):
+        return None
+    if not 0 <= game_date_idx <= todays_idx:
+        return None
+    return game_date_idx
+
+
+def requested_language(values):
+    '''Language of the game a request asked for with "language" and "word_length",
+    the default game's if it didn't ask. None if that game isn't hosted'''
+    word_length = values.get("word_length")
+    if word_length is None or word_length == "":
+        word_length = None
+    else:
+        try:
+            word_length = int(word_length)
+        except (TypeError, ValueError):
+            return None
+    return get_language(str(values.get("language") or "") or None, word_length)
+
+
+def language_args(language):
+    '''Query arguments naming a Language's game in URLs. None for the default game'''
+    if language.key == language_registry.default_key:
+        return {}
+    return {"language": language.language_code, "word_length": language.word_length}
+
+
+def render_game(game_date_idx, language=None):
+    '''Page for today's game or an archived one, of the default game unless given
+    another Language. The page is the same for every player, so it is rendered once
+    per day and worker and the board is loaded afterwards with /get-game-result'''
+    if language is None:
+        language = get_language()
+    archive = game_date_idx != language.todays_idx
+
+    def render():
+        words_url = None
+        if current_app.config['CLIENT_WORD_LIST']:
+            words_url = url_for(".words_asset", filename=language.word_list_asset.filename, **language_args(language))
+        return render_template(
+            "game.html",
+            language=language,
+            default_game=language.key == language_registry.default_key,
+            max_attempts=Result.MAX_ATTEMPTS,
+            words_url=words_url,
+            game_date_idx=game_date_idx,
+            game_date=get_date_of_idx(game_date_idx).strftime("%m/%d"),
+            archive=archive,
+        )
+
+    page = game_page_cache.get((language.key, game_date_idx, archive), language.version, render)
+    max_age = current_app.config['GAME_PAGE_MAX_AGE']
+    if not archive:
+        # today's page turns into an archive page at midnight UTC
+        max_age = min(max_age, max(0, get_idx_end_time(game_date_idx) - int(time.time())))
+    return send_asset(page, max_age=max_age, public=current_app.config['GAME_PAGE_PUBLIC'])
 
 
 # game route
-@app.route("/game")
+@views.route("/game")
 @login_required
 def game():
     '''Runs the game.'''
-    language = Language()
-    # ... perform database operations ...
-    result = Result.get_result(current_user.user_id)
+    return render_game(get_language().todays_idx)
 
-    return render_template("game.html", language=language, result=result or {
-        "result.game_over": False
-        }
-    )
+
+@views.route("/game/<int:game_date_idx>")
+@login_required
+def archived_game(game_date_idx):
+    '''Play an earlier day's game. It doesn't count towards stats or streaks'''
+    if game_date_idx == get_language().todays_idx:
+        return redirect(url_for(".game"))
+    if requested_game_idx(game_date_idx) is None:
+        abort(404)
+    return render_game(game_date_idx)
 
 
-@app.route("/update-game-result", methods=['POST'])
-def update_game_result():
-    '''do necessary conversations, then update record'''
-    data = request.get_json() # Get data sent from JavaScript
-    # Process data in python
-    user_id = current_user.user_id
-    num_attempts = data['attempts']
-    tiles = data['tiles']
-    tile_classes = data['tile_classes']
-    game_over = data['game_over']
-    game_lost = data['game_lost']
-    game_won = data['game_won']
+@views.route("/game/<language_code>")
+@views.route("/game/<language_code>/<int:word_length>")
+@login_required
+def language_game(language_code, word_length=None):
+    '''Today's game in another language or with another word length (see config.LANGUAGES).
+    It doesn't count towards stats or streaks'''
+    language = get_language(language_code.lower(), word_length)
+    if language is None:
+        abort(404)
+    if language.key == language_registry.default_key:
+        return redirect(url_for(".game"))
+    return render_game(language.todays_idx, language)
+
+
+@views.route("/archive", methods=['GET'])
+@login_required
+def archive():
+    '''list earlier games, newest first, with how the player did in each.
+    Pass ?before=<game_date_idx> for the next page'''
+    before = requested_game_idx(request.args.get("before"))
+    if before is None:
+        return {"error": "'before' must be a game index no later than today"}, 400
+
+    last = before - 1
+    first = max(0, before - current_app.config['ARCHIVE_PAGE_SIZE'])
+    played = {
+        result.game_date_idx: result
+        for result in Result.get_user_results(current_user.user_id, first, last)
+    }
+    games = []
+    for game_date_idx in range(last, first - 1, -1):
+        result = played.get(game_date_idx)
+        games.append({
+            "game_date_idx": game_date_idx,
+            "date": get_date_of_idx(game_date_idx).isoformat(),
+            "url": url_for(".archived_game", game_date_idx=game_date_idx),
+            "num_attempts": result.num_attempts if result else 0,
+            "game_over": bool(result and result.game_over),
+            "game_won": bool(result and result.game_won),
+        })
+    return {"games": games, "next_before": first if first > 0 else None}
+
+
+@views.route("/assets/<filename>")
+def words_asset(filename):
+    '''Serve the fingerprinted word list, of another game with ?language= and ?word_length=.
+    Old fingerprints are gone for good'''
+    language = requested_language(request.args)
+    if language is None:
+        abort(404)
+    asset = language.word_list_asset
+    if filename != asset.filename:
+        abort(404)
+    return send_asset(asset, max_age=asset.MAX_AGE, public=True, immutable=True)
+
+
+@views.route("/check-word", methods=['GET'])
+@login_required
+def check_word():
+    '''check if a single guess is a valid word, in another game with ?language= and ?word_length='''
+    language = requested_language(request.args)
+    if language is None:
+        return {"error": "Unknown game"}, 404
+    word = request.args.get("word", "").strip().lower()
+    return {"word": word, "valid": language.check_word(word)}
+
+
+@views.route("/check-words", methods=['POST'])
+@login_required
+def check_words():
+    '''check a batch of guesses in one request'''
+    data = request.get_json(silent=True) or {}
+    words = data.get("words")
+    if not isinstance(words, list) or len(words) > MAX_CHECK_WORDS:
+        return {"error": f"'words' must be a list of at most {MAX_CHECK_WORDS} words"}, 400
+
+    language = requested_language(data)
+    if language is None:
+        return {"error": "Unknown game"}, 404
+    results = {}
+    for word in words:
+        word = str(word).strip().lower()
+        results[word] = language.check_word(word)
+    return {"results": results}
+
+
+MAX_GUESS_KEY_LENGTH = 64 # Longest idempotency key /guess accepts
+
+
+def parse_guess(data):
+    '''Check a guess sent by the game.
+    Returns (guess, game_date_idx, Language, answer, error response)'''
+    guess = str(data.get('guess', '')).strip().lower()
+    language = requested_language(data)
+    if language is None:
+        return None, None, None, None, ({"error": "Unknown game"}, 400)
+
+    game_date_idx = requested_game_idx(data.get('game_date_idx'))
+    if game_date_idx is None:
+        return None, None, None, None, ({"error": "Unknown game"}, 400)
+    if len(guess) != language.word_length or not language.character_set.issuperset(guess):
+        return None, None, None, None, ({"error": "Please enter a full word"}, 400)
+    answer = language.get_daily_word(game_date_idx)
+    # easy mode lets players guess any combination of letters. The answer is always
+    # allowed, it may have been scheduled before it was taken out of words.txt
+    if not data.get('allow_any_word') and guess != answer and not language.check_word(guess):
+        return None, None, None, None, ({"error": "Word is not valid"}, 400)
+    return guess, game_date_idx, language, answer, None
+
+
+def remaining_words(result, language):
+    '''How many of a Language's valid words still fit a board'''
+    constraints = BoardConstraints(zip(result.guess_list, result.state_rows))
+    return language.constraint_index.count(constraints)
+
+
+def guess_response(result, states, language, answer):
+    '''The board after a guess, the guess's tile states, how many words still fit,
+    and the answer once the game is over'''
+    response = result.to_dict()
+    response["states"] = [STATE_NAMES[state] for state in states]
+    response["remaining"] = remaining_words(result, language)
+    if result.game_over:
+        response["answer"] = answer
+    return response
+
+
+@views.route("/guess", methods=['POST'])
+@login_required
+def guess():
+    '''score a guess server-side and append it to the board.
+    Takes {"guess", "row", "key", "game_date_idx", "language", "word_length", "allow_any_word",
+    "hard_mode", "durable"}. "row" is the number of guesses the client's board already has, and
+    "key" is a unique id for the guess, so retrying with the same key can't add it twice.
+    With WRITE_QUEUE_ENABLED, "durable" waits for the guess to be committed before answering'''
+    data = request.get_json(silent=True) or {} # Get data sent from JavaScript
+    guess_word, game_date_idx, language, answer, error = parse_guess(data)
+    if error:
+        return error
+
+    row = data.get('row')
+    if not isinstance(row, int) or isinstance(row, bool) or not 0 <= row < Result.MAX_ATTEMPTS:
+        return {"error": "'row' must be the number of guesses already on the board"}, 400
+    key = data.get('key')
+    if key is not None and (not isinstance(key, str) or len(key) > MAX_GUESS_KEY_LENGTH):
+        return {"error": f"'key' must be a string of at most {MAX_GUESS_KEY_LENGTH} characters"}, 400
+
+    if data.get('hard_mode'):
+        # checked against the saved board. If that has moved on since the client's
+        # row, append_guess() answers with a 409 or replays a retried guess anyway
+        board = Result.get_result(current_user.user_id, game_date_idx, language.key)
+        if board.num_attempts == row:
+            error = BoardConstraints(zip(board.guess_list, board.state_rows)).hard_mode_error(guess_word)
+            if error:
+                return {"error": error}, 400
+
+    if current_app.config['WRITE_QUEUE_ENABLED']:
+        durable = data.get('durable', current_app.config['WRITE_QUEUE_DURABLE'])
+        try:
+            result, states = Result.queue_guess(
+                current_user.user_id, game_date_idx, row, guess_word, answer, key, language.key, bool(durable)
+            )
+        except WriteQueueFull as e:
+            logger.warning("Guess not queued: %s", e)
+            # the game retries server errors with the same key
+            return {"error": "Too many guesses at once, please try again"}, 503, {"Retry-After": "1"}
+    else:
+        result, states = Result.append_guess(
+            current_user.user_id, game_date_idx, row, guess_word, answer, key, language.key
+        )
+    if states is None:
+        # send the board back so the client can catch up
+        error = "Game is already over" if result.game_over else "Your board changed, please try again"
+        return {"error": error, **result.to_dict()}, 409
+    return guess_response(result, states, language, answer)
+
 
-    result = Result.update_result(user_id, num_attempts, tiles, tile_classes, game_over, game_lost, game_won)
+@views.route("/update-game-result", methods=['POST'])
+@login_required
+def update_game_result():
+    '''score a guess server-side and add it to today's board.
+    Kept for clients loaded before /guess, which is safer to retry'''
+    data = request.get_json(silent=True) or {} # Get data sent from JavaScript
+    guess_word, game_date_idx, language, answer, error = parse_guess(data)
+    if error:
+        return error
 
-    return result.to_dict()
+    result, states = Result.add_guess(current_user.user_id, guess_word, answer, game_date_idx, language.key)
+    if states is None:
+        return {"error": "Game is already over"}, 409
+    return guess_response(result, states, language, answer)
 
 
-@app.route("/get-game-result", methods=['GET'])
+@views.route("/get-game-result", methods=['GET'])
+@login_required
 def get_game_result():
-    '''get today's result for player'''
+    '''get today's result for player, or an archived game's with ?game_date_idx=.
+    Another game's with ?language= and ?word_length=. Has the answer once the game is over'''
     user_id = current_user.user_id
+    language = requested_language(request.args)
+    game_date_idx = requested_game_idx(request.args.get("game_date_idx"))
+    if language is None or game_date_idx is None:
+        return {"error": "Unknown game"}, 400
+
+    result = Result.get_result(user_id, game_date_idx, language.key)
 
-    result = Result.get_result(user_id)
+    response = result.to_dict()
+    response["remaining"] = remaining_words(result, language)
+    if result.game_over:
+        response["answer"] = language.get_daily_word(game_date_idx)
+    return response
 
-    return result.to_dict()
 
+@views.route("/hint", methods=['GET'])
+@login_required
+def hint():
+    '''suggest the guess that narrows the possible answers down the most, for today's
+    board or an archived game's with ?game_date_idx=, in another game with ?language= and ?word_length='''
+    language = requested_language(request.args)
+    if language is None or not config.HINTS_ENABLED:
+        abort(404)
+    # numpy comes with it, so it's only imported once hints are asked for
+    from solver import get_solver
+    solver = get_solver(language)
+    if solver is None:
+        abort(404)
+    game_date_idx = requested_game_idx(request.args.get("game_date_idx"))
+    if game_date_idx is None:
+        return {"error": "Unknown game"}, 400
+
+    result = Result.get_result(current_user.user_id, game_date_idx, language.key)
+    if result.game_over:
+        return {"error": "Game is already over"}, 409
+    guess, bits, candidates = solver.hint(list(zip(result.guess_list, result.state_rows)))
+    return {
+        "game_date_idx": game_date_idx,
+        "hint": guess,
+        "expected_bits": round(bits, 2),
+        "candidates": candidates,
+    }
+
+
+@views.route("/language-stats", methods=['GET'])
+@login_required
+def get_language_stats():
+    '''get load/reload stats for the shared word lists'''
+    return dict(language_stats)
 
-@app.route("/get-user-stats", methods=['GET'])
+
+@views.route("/cache-stats", methods=['GET'])
+@login_required
+def get_cache_stats():
+    '''get hit/miss counters for the in-process caches'''
+    return {
+        "user_cache": user_cache.get_stats(),
+        "google_provider_cfg": dict(google_provider_cfg_cache.stats),
+        "leaderboard_snapshots": dict(snapshot_cache.stats),
+        "game_pages": dict(game_page_cache.stats),
+        "compression": dict(current_app.extensions["compression"].stats),
+        "write_queue": dict(result_writes.stats),
+    }
+
+
+@views.route("/metrics", methods=['GET'])
+def get_metrics():
+    '''request, query and cache metrics for this worker in Prometheus' text format'''
+    if not current_app.config['METRICS_ENABLED']:
+        abort(404)
+    token = current_app.config['METRICS_TOKEN']
+    if token and not bearer_token_matches(token):
+        abort(401)
+    body = metrics.render({
+        "wordle_language": language_stats,
+        "wordle_user_cache": user_cache.get_stats(),
+        "wordle_provider_cfg_cache": google_provider_cfg_cache.stats,
+        "wordle_leaderboard_snapshots": snapshot_cache.stats,
+        "wordle_game_page_cache": game_page_cache.stats,
+        "wordle_compression": current_app.extensions["compression"].stats,
+        "wordle_write_queue": result_writes.stats,
+    })
+    return body, 200, {"Content-Type": METRICS_CONTENT_TYPE}
+
+
+@views.route("/get-user-stats", methods=['GET'])
+@login_required
 def get_user_stats():
     '''get the stats for a user'''
+    return UserStats.get_stats(current_user.user_id).to_dict()
+
+
+@views.route("/leaderboard", methods=['GET'])
+@login_required
+def leaderboard():
+    '''get today's stats and the top players, from a snapshot refreshed every LEADERBOARD_CACHE_TTL seconds'''
+    return get_leaderboard()
+
+
+@views.route("/daily-stats/<int:game_date_idx>", methods=['GET'])
+@login_required
+def daily_stats(game_date_idx):
+    '''get win rate, guess distribution and fastest solvers for a day'''
+    if game_date_idx > get_language().todays_idx:
+        abort(404)
+    return get_daily_stats(game_date_idx)
+
+
+@views.route("/export/results", methods=['GET'])
+def export_results():
+    '''stream results for analytics. Needs "Authorization: Bearer <EXPORT_TOKEN>".
+    Takes ?format=ndjson|csv, ?from= and ?to= (game index or YYYY-MM-DD) and ?user_id='''
+    token = current_app.config['EXPORT_TOKEN']
+    if not token:
+        abort(404)
+    if not bearer_token_matches(token):
+        abort(401)
+
+    fmt = request.args.get("format", "ndjson")
+    if fmt not in export.FORMATS:
+        return {"error": f"'format' must be one of {', '.join(export.FORMATS)}"}, 400
     try:
-        user_id = current_user.user_id
-        
-        results = Result.get_user_results(user_id)
-
-        wins = 0
-        losses = 0
-        total_attempts = 0
-        games = len(results)
-        current_streak = 0
-        longest_streak = 0
-        
-        for i in range(games):
-            played_game = results[i].to_dict()
-            if played_game['game_won']:
-                wins += 1
-                current_streak += 1
-                if current_streak > longest_streak:
-                    longest_streak = current_streak
-            else:
-                losses += 1
-            total_attempts += int(played_game['num_attempts'])
-
-        avg_attempts = total_attempts / games
-        win_percentage = ((wins / (wins + losses)) * 100) or 0
-
-        return {
-            "wins": wins,
-            "losses": losses,
-            "games": games,
-            "total_attempts": total_attempts,
-            "avg_attempts": avg_attempts,
-            "win_percentage": win_percentage,
-            "longest_streak": longest_streak,
-            "current_streak": current_streak 
-        }
-    except Exception as e:
-        logger.debug("Error in /get-user-stats: %s", e)
+        first_idx = export.parse_game_idx(request.args.get("from"))
+        last_idx = export.parse_game_idx(request.args.get("to"))
+    except ValueError:
+        return {"error": "'from' and 'to' must be game indexes or YYYY-MM-DD dates"}, 400
+
+    lines = export.export_results(
+        fmt,
+        first_idx=first_idx,
+        last_idx=last_idx,
+        user_id=request.args.get("user_id") or None,
+    )
+    return Response(
+        stream_with_context(lines),
+        mimetype=export.FORMATS[fmt],
+        headers={"Content-Disposition": f"attachment; filename=results.{fmt}"},
+    )
+
+
+###########
+# COMMANDS
+###########
+@views.cli.command("rescore-day")
+@click.argument("game_date_idx", type=int)
+@click.option("--fix", is_flag=True, help="Save the corrected boards.")
+@click.option("--language", "language_code", help="Language of the game, the default one if not given.")
+@click.option("--length", "word_length", type=int, help="Word length of the game.")
+def rescore_day_command(game_date_idx, fix, language_code, word_length):
+    '''Re-score every board of a game for a day and report the ones that don't match'''
+    language = get_language(language_code, word_length)
+    if language is None:
+        raise click.BadParameter("isn't one of the games in LANGUAGES", param_hint="--language/--length")
+    answer = language.get_daily_word(game_date_idx)
+    summary = Result.rescore_day(game_date_idx, answer, fix=fix, language_key=language.key)
+    click.echo(json.dumps(summary, indent=2))
+    if summary["fixed"]:
+        click.echo("Run backfill-stats to bring the player and daily stats up to date")
+
+
+@views.cli.command("backfill-stats")
+def backfill_stats_command():
+    '''Rebuild the user_stats and daily_stats tables from every finished game'''
+    n_users = UserStats.backfill()
+    n_days = DailyStats.backfill()
+    snapshot_cache.clear()
+    click.echo(f"Rebuilt stats for {n_users} users and {n_days} days")
+
+
+@views.cli.command("export-results")
+@click.option("--format", "fmt", type=click.Choice(sorted(export.FORMATS)), default="ndjson", show_default=True)
+@click.option("--from", "first", help="First game, as a game index or YYYY-MM-DD.")
+@click.option("--to", "last", help="Last game, as a game index or YYYY-MM-DD.")
+@click.option("--user", "user_id", help="Only this user's results.")
+@click.option("--output", "-o", type=click.File("w"), default="-", help="File to write, stdout by default.")
+@click.option("--batch-size", type=int, default=1000, show_default=True, help="Rows fetched from the database at a time.")
+def export_results_command(fmt, first, last, user_id, output, batch_size):
+    '''Stream every result as NDJSON or CSV'''
+    try:
+        first_idx = export.parse_game_idx(first)
+        last_idx = export.parse_game_idx(last)
+    except ValueError as e:
+        raise click.BadParameter("--from and --to must be game indexes or YYYY-MM-DD dates") from e
+    for line in export.export_results(fmt, first_idx=first_idx, last_idx=last_idx, user_id=user_id, batch_size=batch_size):
+        output.write(line)
+
+
+@views.cli.command("compile-words")
+@click.option("--language", "language_code", help="Only this language's games.")
+@click.option("--length", "word_length", type=int, help="Only games with this word length.")
+def compile_words_command(language_code, word_length):
+    '''Save each game's word index as a file the workers memory-map instead of loading the word lists'''
+    keys = [
+        key for key in language_registry.keys
+        if language_code in (None, key[0]) and word_length in (None, key[1])
+    ]
+    if not keys:
+        raise click.BadParameter("isn't one of the games in LANGUAGES", param_hint="--language/--length")
+    for key in keys:
+        path, n_words = compile_word_file(key)
+        click.echo(f"Compiled {n_words} words for {key[0]} ({key[1]} letters) to {path}")
+
+
+@views.cli.command("init-db")
+def init_db_command():
+    '''Create or migrate the database and schedule the daily words. Run once per deployment'''
+    init_db()
+    for key in language_registry.keys:
+        compile_word_file(key)
+        language = language_registry.get(key)
+        language.schedule_words()
+        if config.HINTS_ENABLED:
+            # builds the solver's pattern matrix if the word lists changed
+            from solver import get_solver
+            get_solver(language)
+    click.echo("Database is ready")
 
 
 if __name__ == '__main__':
+    app = create_app()
+    with app.app_context():
+        init_db()
     app.run(host='0.0.0.0', port=8000, ssl_context="adhoc", debug=True)
@@ -0,0 +1,113 @@
+'''Precompressed responses: static assets generated from the language data, and cached pages'''
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from compression import choose_encoding
+
+try:
+    import brotli  # optional, only used if installed
+except ImportError:
+    brotli = None
+
+
+class CompressedAsset:
+    '''A response body kept alongside its gzip (and brotli) encodings, with an ETag of its content per encoding.
+
+    Compressing once up front means serving it is only a matter of picking the
+    right bytes for the client's Accept-Encoding.'''
+
+    def __init__(self, body, content_type):
+        self.body = body
+        self.content_type = content_type
+        self.etag = hashlib.sha256(body).hexdigest()[:16]
+        # mtime=0 keeps the gzip bytes identical between workers and restarts
+        self.gzip_body = gzip.compress(body, compresslevel=9, mtime=0)
+        self.brotli_body = brotli.compress(body) if brotli else None
+
+    def encoded_body(self, accept_encoding):
+        '''Return (body, content encoding, ETag) for the client's Accept-Encoding header.
+        Each encoding has its own ETag, the bytes differ'''
+        encoding = choose_encoding(accept_encoding, allow_brotli=self.brotli_body is not None)
+        if encoding == "br":
+            return self.brotli_body, "br", f"{self.etag}-br"
+        if encoding == "gzip":
+            return self.gzip_body, "gzip", f"{self.etag}-gzip"
+        return self.body, None, self.etag
+
+
+class WordListAsset(CompressedAsset):
+    '''JSON array of every valid word, precompressed and named after its content hash.
+
+    The fingerprint is part of the URL, so browsers can cache it forever and a new
+    URL is handed out whenever the word lists change.'''
+
+    MAX_AGE = 31536000  # one year, the usual value for immutable assets
+
+    def __init__(self, words):
+        super().__init__(json.dumps(sorted(words), separators=(",", ":")).encode("utf-8"), "application/json")
+        self.fingerprint = self.etag
+        self.filename = f"words.{self.fingerprint}.json"
+
+
+class MappedWordListAsset(WordListAsset):
+    '''WordListAsset compiled into a word file, see word_index.py.
+
+    The bodies are sliced out of the word file's mmap when served, so loading
+    compresses nothing and no worker keeps its own copy. `word_index` is the
+    file's MappedWordIndex.'''
+
+    def __init__(self, word_index):
+        self.word_index = word_index
+        self.content_type = "application/json"
+        self.etag = word_index.asset_etag
+        self.fingerprint = self.etag
+        self.filename = f"words.{self.fingerprint}.json"
+
+    @property
+    def body(self):
+        return self.word_index.asset_body("json")
+
+    @property
+    def gzip_body(self):
+        return self.word_index.asset_body("gzip")
+
+    @property
+    def brotli_body(self):
+        # compiled without brotli installed
+        return self.word_index.asset_body("br") or None
+
+
+class PageCache:
+    '''Rendered pages that are the same for every user, as CompressedAssets.
+
+    Each entry remembers the `version` it was rendered from (e.g. the Language
+    object) and is rendered again once that changes. Least recently used
+    entries are dropped past max_size.'''
+
+    def __init__(self, max_size=32):
+        self.max_size = max_size
+        self.entries = OrderedDict()  # key -> (version, CompressedAsset)
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "renders": 0}
+
+    def get(self, key, version, render, content_type="text/html; charset=utf-8"):
+        '''Cached page for key, rendered with render() if missing or out of date'''
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] is version:
+                self.entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry[1]
+
+        # rendered outside the lock, two requests may both render a new page but neither waits
+        page = CompressedAsset(render().encode("utf-8"), content_type)
+        with self.lock:
+            self.entries[key] = (version, page)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+            self.stats["renders"] += 1
+        return page
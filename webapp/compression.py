@@ -0,0 +1,177 @@
+'''WSGI middleware that compresses responses and answers conditional GETs.
+
+It wraps app.wsgi_app next to ProxyFix, so every route gets the same treatment
+without each view having to care. Responses that already handle this
+themselves are passed through untouched: anything with a Content-Encoding
+(the precompressed assets), streamed responses without a Content-Length
+(/export/results) and range requests.'''
+import gzip
+import hashlib
+from itertools import chain
+
+from werkzeug.datastructures import Headers
+from werkzeug.http import parse_accept_header, parse_etags
+
+try:
+    import brotli  # optional, only used if installed
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    "application/x-ndjson",
+    "image/svg+xml",
+)
+# Bigger responses are passed through as they are instead of being held in memory
+MAX_BUFFERED_SIZE = 4 * 1024 * 1024
+# Statuses that never have a body
+NO_BODY_STATUSES = {204, 304}
+
+
+class CompressionMiddleware:
+    '''gzip/brotli for responses of at least `min_size` bytes, plus weak ETags on GET JSON.
+
+    With `etags` a 200 JSON response to a GET gets an ETag of its body, and a
+    request whose If-None-Match matches it gets an empty 304 instead. The view
+    still runs, so this saves the transfer and the client's parsing, not the
+    queries behind it. The tag is of the uncompressed body, so it's the same
+    weak ETag whichever encoding the client gets.'''
+
+    def __init__(self, app, min_size=500, level=6, etags=True):
+        self.app = app
+        self.min_size = min_size
+        self.level = level
+        self.etags = etags
+        self.stats = {"compressed": 0, "not_modified": 0, "bytes_in": 0, "bytes_out": 0}
+
+    def __call__(self, environ, start_response):
+        captured = []
+        written = []
+
+        def capture(status, headers, exc_info=None):
+            captured[:] = [status, headers, exc_info]
+            return written.append
+
+        app_iter = self.app(environ, capture)
+        if not captured:  # start_response wasn't called yet, nothing to go on
+            app_iter = self._prime(app_iter)
+        status, headers, exc_info = captured
+        headers = Headers(headers)
+        status_code = int(status.split(None, 1)[0])
+
+        if not self._should_buffer(environ, status_code, headers):
+            start_response(status, headers.to_wsgi_list(), exc_info)
+            return chain(written, app_iter) if written else app_iter
+
+        try:
+            body = b"".join(chain(written, app_iter))
+        finally:
+            if hasattr(app_iter, "close"):
+                app_iter.close()
+
+        compress = self.min_size > 0 and len(body) >= self.min_size and self._is_compressible(headers)
+        if compress:
+            # on a 304 too, it stands for the response the client already has
+            _add_vary(headers, "Accept-Encoding")
+
+        if self.etags and self._wants_etag(environ, status_code, headers):
+            tag = hashlib.sha1(body).hexdigest()[:20]
+            headers["ETag"] = f'W/"{tag}"'
+            if "Cache-Control" not in headers:
+                # the browser keeps it but asks every time, which is when the ETag pays off
+                headers["Cache-Control"] = "private, no-cache"
+            if parse_etags(environ.get("HTTP_IF_NONE_MATCH")).contains_weak(tag):
+                self.stats["not_modified"] += 1
+                # anything else, like a Set-Cookie, still goes out with the 304
+                for name in ("Content-Type", "Content-Length"):
+                    headers.remove(name)
+                start_response("304 Not Modified", headers.to_wsgi_list(), exc_info)
+                return []
+
+        if compress:
+            encoding = choose_encoding(environ.get("HTTP_ACCEPT_ENCODING"))
+            if encoding:
+                compressed = self._compress(body, encoding)
+                self.stats["compressed"] += 1
+                self.stats["bytes_in"] += len(body)
+                self.stats["bytes_out"] += len(compressed)
+                body = compressed
+                headers["Content-Encoding"] = encoding
+                etag = headers.get("ETag")
+                if etag and not etag.startswith("W/"):
+                    # the bytes differ from the uncompressed ones, so only a weak match holds
+                    headers["ETag"] = "W/" + etag
+
+        headers["Content-Length"] = str(len(body))
+        start_response(status, headers.to_wsgi_list(), exc_info)
+        return [body]
+
+    def _prime(self, app_iter):
+        '''Run the app up to its first chunk, so that it calls start_response'''
+        iterator = iter(app_iter)
+        first = next(iterator, None)
+        rest = chain([] if first is None else [first], iterator)
+        if hasattr(app_iter, "close"):
+            return _ClosingIterator(rest, app_iter.close)
+        return rest
+
+    def _should_buffer(self, environ, status_code, headers):
+        if environ.get("REQUEST_METHOD") == "HEAD" or status_code in NO_BODY_STATUSES:
+            return False
+        if "Content-Encoding" in headers or "HTTP_RANGE" in environ:
+            return False
+        length = headers.get("Content-Length")
+        if length is None or not length.isdigit() or int(length) > MAX_BUFFERED_SIZE:
+            return False
+        return self._is_compressible(headers) and (self.min_size > 0 or self.etags)
+
+    def _wants_etag(self, environ, status_code, headers):
+        return (
+            environ.get("REQUEST_METHOD") == "GET"
+            and status_code == 200
+            and "ETag" not in headers
+            and headers.get("Content-Type", "").startswith("application/json")
+            and "no-store" not in headers.get("Cache-Control", "")
+        )
+
+    def _is_compressible(self, headers):
+        content_type = headers.get("Content-Type", "")
+        return content_type.startswith(COMPRESSIBLE_TYPES)
+
+    def _compress(self, body, encoding):
+        if encoding == "br":
+            return brotli.compress(body, quality=min(self.level, 11))
+        return gzip.compress(body, compresslevel=self.level, mtime=0)
+
+
+def choose_encoding(accept_encoding, allow_brotli=True):
+    '''br or gzip, whichever the client prefers of those it accepts. None for neither.
+    br only if the brotli package is installed and allow_brotli'''
+    if not accept_encoding:
+        return None
+    accepted = parse_accept_header(accept_encoding)
+    gzip_quality = accepted.quality("gzip")
+    br_quality = accepted.quality("br") if brotli and allow_brotli else 0
+    if br_quality > 0 and br_quality >= gzip_quality:
+        return "br"
+    return "gzip" if gzip_quality > 0 else None
+
+
+class _ClosingIterator:
+    '''Iterator that still calls the app's close() once the server is done with it'''
+
+    def __init__(self, iterator, close):
+        self.iterator = iterator
+        self.close = close
+
+    def __iter__(self):
+        return self.iterator
+
+
+def _add_vary(headers, name):
+    values = [value.strip() for value in headers.get("Vary", "").split(",") if value.strip()]
+    if name.lower() not in (value.lower() for value in values):
+        values.append(name)
+    headers["Vary"] = ", ".join(values)
@@ -0,0 +1,131 @@
+'''What a board's scored guesses say about the answer, and bitsets to count the words that fit.
+
+A ConstraintIndex keeps one bitset per (position, letter) and per (letter,
+copies), as Python ints with a bit per word. The words that fit a board are
+then a handful of AND / AND NOT operations on those ints, a few hundred
+machine words each even for the full word list.'''
+from collections import Counter
+
+from scoring import ABSENT, CORRECT, PRESENT
+
+
+def _ordinal(n):
+    '''1st, 2nd, 3rd, 4th...'''
+    if 10 <= n % 100 <= 20:
+        return f"{n}th"
+    return f"{n}{ {1: 'st', 2: 'nd', 3: 'rd'}.get(n % 10, 'th')}"
+
+
+class BoardConstraints:
+    '''The answer as far as a board's (guess, tile states) rows reveal it.
+
+    Follows the scoring rules in scoring.AnswerScorer: a CORRECT tile fixes its
+    letter, every other tile rules its letter out at that position, the CORRECT
+    and PRESENT copies of a letter in one guess are copies the answer has at
+    least, and an ABSENT copy means the answer has no more than those.'''
+
+    def __init__(self, rows):
+        self.correct = {}       # position -> letter
+        self.not_at = set()     # (position, letter) pairs the answer doesn't have
+        self.min_counts = {}    # letter -> copies the answer has at least
+        self.max_counts = {}    # letter -> copies the answer has at most
+        for guess, states in rows:
+            found = Counter()
+            for position, (letter, state) in enumerate(zip(guess, states)):
+                if state == CORRECT:
+                    self.correct[position] = letter
+                else:
+                    self.not_at.add((position, letter))
+                if state in (CORRECT, PRESENT):
+                    found[letter] += 1
+            for letter, copies in found.items():
+                self.min_counts[letter] = max(self.min_counts.get(letter, 0), copies)
+            for letter, state in zip(guess, states):
+                if state == ABSENT:
+                    self.max_counts[letter] = min(self.max_counts.get(letter, found[letter]), found[letter])
+
+    def hard_mode_error(self, guess):
+        '''Why a guess breaks hard mode, or None if it doesn't.
+
+        Hard mode means using every hint so far: CORRECT letters stay where they
+        are and PRESENT letters have to be in the guess somewhere.'''
+        for position, letter in sorted(self.correct.items()):
+            if position >= len(guess) or guess[position] != letter:
+                return f"{_ordinal(position + 1)} letter must be {letter.upper()}"
+        counts = Counter(guess)
+        for letter, copies in sorted(self.min_counts.items()):
+            if counts[letter] < copies:
+                times = f" {copies} times" if copies > 1 else ""
+                return f"Guess must contain {letter.upper()}{times}"
+        return None
+
+
+class ConstraintIndex:
+    '''Bitsets over a sequence of words, bit i standing for words[i]'''
+
+    def __init__(self, words):
+        # only the count is kept, the words themselves are read once here
+        self.n_words = len(words)
+        self.all_words = (1 << self.n_words) - 1
+        at_position = {}  # (position, letter) -> indexes of the words with letter at position
+        at_least = {}     # (letter, copies) -> indexes of the words with at least that many copies
+        for i, word in enumerate(words):
+            for position, letter in enumerate(word):
+                at_position.setdefault((position, letter), []).append(i)
+            for letter, copies in Counter(word).items():
+                for n in range(1, copies + 1):
+                    at_least.setdefault((letter, n), []).append(i)
+        self.at_position = {key: self._bitset(indexes) for key, indexes in at_position.items()}
+        self.at_least = {key: self._bitset(indexes) for key, indexes in at_least.items()}
+
+    def _bitset(self, indexes):
+        '''int with the given bits set. Built as bytes, OR-ing bits into an int one
+        at a time would copy the whole int for every word'''
+        bits = bytearray((self.n_words + 7) // 8)
+        for i in indexes:
+            bits[i >> 3] |= 1 << (i & 7)
+        return int.from_bytes(bits, "little")
+
+    def position_bits(self, position, letter):
+        '''Bitset of the words with letter at position'''
+        return self.at_position.get((position, letter), 0)
+
+    def copies_bits(self, letter, copies):
+        '''Bitset of the words with at least `copies` copies of letter'''
+        return self.at_least.get((letter, copies), 0)
+
+    def matching(self, constraints):
+        '''Bitset of the words that fit a BoardConstraints'''
+        mask = self.all_words
+        for position, letter in constraints.correct.items():
+            mask &= self.position_bits(position, letter)
+        for position, letter in constraints.not_at:
+            mask &= ~self.position_bits(position, letter)
+        for letter, copies in constraints.min_counts.items():
+            mask &= self.copies_bits(letter, copies)
+        for letter, copies in constraints.max_counts.items():
+            mask &= ~self.copies_bits(letter, copies + 1)
+        return mask
+
+    def count(self, constraints):
+        '''How many words fit a BoardConstraints'''
+        return self.matching(constraints).bit_count()
+
+
+class MappedConstraintIndex(ConstraintIndex):
+    '''ConstraintIndex whose bitsets were compiled into a word file.
+
+    Each bitset is read from the word file's mmap when a board needs it, so
+    loading builds nothing and the workers share the pages instead of each
+    holding its own ints. `word_index` is the file's MappedWordIndex.'''
+
+    def __init__(self, word_index):
+        self.word_index = word_index
+        self.n_words = len(word_index)
+        self.all_words = (1 << self.n_words) - 1
+
+    def position_bits(self, position, letter):
+        return self.word_index.position_bits(position, letter)
+
+    def copies_bits(self, letter, copies):
+        return self.word_index.copies_bits(letter, copies)
@@ -1,16 +1,94 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import scoped_session, sessionmaker, declarative_base
 
-engine = create_engine('sqlite:///database.db')
+import config
+
+SQLITE_JOURNAL_MODES = {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"}
+SQLITE_SYNCHRONOUS_MODES = {"OFF", "NORMAL", "FULL", "EXTRA"}
+
+
+def _engine_options(url):
+    '''create_engine() arguments for the kind of database the URL points at'''
+    if url.get_backend_name() == "sqlite":
+        # busy_timeout is set with the other pragmas, this covers the time before that runs
+        return {"connect_args": {"timeout": config.SQLITE_BUSY_TIMEOUT_MS / 1000}}
+    return {
+        "pool_size": config.DB_POOL_SIZE,
+        "max_overflow": config.DB_MAX_OVERFLOW,
+        "pool_timeout": config.DB_POOL_TIMEOUT,
+        "pool_recycle": config.DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    '''Tune every new SQLite connection for several processes writing at once'''
+    journal_mode = config.SQLITE_JOURNAL_MODE.upper()
+    synchronous = config.SQLITE_SYNCHRONOUS.upper()
+    if journal_mode not in SQLITE_JOURNAL_MODES:
+        raise ValueError(f"Unknown SQLITE_JOURNAL_MODE: {config.SQLITE_JOURNAL_MODE}")
+    if synchronous not in SQLITE_SYNCHRONOUS_MODES:
+        raise ValueError(f"Unknown SQLITE_SYNCHRONOUS: {config.SQLITE_SYNCHRONOUS}")
+
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={journal_mode}")
+    cursor.execute(f"PRAGMA synchronous={synchronous}")
+    cursor.execute(f"PRAGMA busy_timeout={int(config.SQLITE_BUSY_TIMEOUT_MS)}")
+    cursor.execute(f"PRAGMA mmap_size={int(config.SQLITE_MMAP_SIZE)}")
+    cursor.execute(f"PRAGMA cache_size={int(config.SQLITE_CACHE_SIZE)}")
+    cursor.close()
+
+
+database_url = make_url(config.DATABASE_URL)
+engine = create_engine(database_url, **_engine_options(database_url))
+if database_url.get_backend_name() == "sqlite":
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+
+# expire_on_commit=False: sessions only live for one request, and reloading
+# every object after each commit would cost another query per request
 db_session = scoped_session(sessionmaker(autocommit=False,
                                         autoflush=False,
+                                        expire_on_commit=False,
                                         bind=engine))
 
 Base = declarative_base()
 Base.query = db_session.query_property()
 
+
+def dialect_insert(model):
+    '''INSERT for the engine's database that supports on_conflict_do_update (upserts)'''
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
+
+
 def init_db():
     # import all modules here that might define models so that 
     # they will be registered properly on the metadata. Otherwise
     # you will have to import them first before calling init_db()
+    import models
+    import migrations
+
+    # a brand new database gets the current schema from create_all, so it has nothing to migrate
+    new_database = not inspect(engine).has_table(models.Result.__tablename__)
     Base.metadata.create_all(bind=engine)
+    if new_database:
+        migrations.stamp_latest(engine)
+    else:
+        migrations.migrate(engine)
+
+
+def check_db():
+    '''Raise RuntimeError unless init_db() has brought the database up to date'''
+    import migrations
+
+    with engine.begin() as conn:
+        version = migrations.get_version(conn)
+    if version < migrations.latest_version():
+        raise RuntimeError(
+            f"The database is at schema version {version} of {migrations.latest_version()}. "
+            "Run `flask --app webapp/app.py init-db` first"
+        )
@@ -0,0 +1,126 @@
+'''Streams every result out of the database for analytics, as NDJSON or CSV.
+
+Rows are read in batches with yield_per (a server-side cursor where the database
+has one) and written out one at a time, so memory use doesn't grow with the
+size of the results table.'''
+import csv
+import datetime
+import io
+import json
+
+from sqlalchemy import select
+
+from database import db_session
+from models import Result
+from scoring import encode_states, unpack_board
+from utils import get_date_of_idx, get_idx_of_date
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+RESULT_COLUMNS = [
+    "result_id", "user_id", "game_date_idx", "date", "language_code", "word_length",
+    "num_attempts", "game_over", "game_won", "game_lost", "finished_at",
+]
+CSV_COLUMNS = (
+    RESULT_COLUMNS
+    + [f"guess_{i}" for i in range(1, Result.MAX_ATTEMPTS + 1)]
+    + [f"states_{i}" for i in range(1, Result.MAX_ATTEMPTS + 1)]
+)
+
+
+def iter_results(first_idx=None, last_idx=None, user_id=None, batch_size=1000):
+    '''Results as dicts, oldest first. Each guess and its tile states are split out,
+    the states as one digit per tile (0 empty, 1 absent, 2 present, 3 correct)'''
+    stmt = select(
+        Result.result_id,
+        Result.user_id,
+        Result.game_date_idx,
+        Result.language_code,
+        Result.word_length,
+        Result.num_attempts,
+        Result.guesses,
+        Result.states,
+        Result.game_over,
+        Result.game_won,
+        Result.game_lost,
+        Result.finished_at,
+    ).order_by(Result.result_id)
+    if first_idx is not None:
+        stmt = stmt.where(Result.game_date_idx >= first_idx)
+    if last_idx is not None:
+        stmt = stmt.where(Result.game_date_idx <= last_idx)
+    if user_id is not None:
+        stmt = stmt.where(Result.user_id == user_id)
+
+    rows = db_session.execute(stmt.execution_options(yield_per=batch_size))
+    dates = {}  # game_date_idx -> ISO date, there is one per day so this stays small
+    for row in rows:
+        width = row.word_length
+        guesses = [row.guesses[i:i + width] for i in range(0, len(row.guesses), width)]
+        states = unpack_board(row.states, len(guesses), width)
+        date = dates.get(row.game_date_idx)
+        if date is None:
+            date = dates[row.game_date_idx] = get_date_of_idx(row.game_date_idx).isoformat()
+        yield {
+            "result_id": row.result_id,
+            "user_id": row.user_id,
+            "game_date_idx": row.game_date_idx,
+            "date": date,
+            "language_code": row.language_code,
+            "word_length": row.word_length,
+            "num_attempts": row.num_attempts,
+            "game_over": bool(row.game_over),
+            "game_won": bool(row.game_won),
+            "game_lost": bool(row.game_lost),
+            "finished_at": row.finished_at,
+            "guesses": guesses,
+            "states": [encode_states(row_states) for row_states in states],
+        }
+
+
+def to_ndjson(results):
+    '''One JSON object per line'''
+    for result in results:
+        yield json.dumps(result, separators=(",", ":")) + "\n"
+
+
+def to_csv(results):
+    '''A header, then one line per result with a column for each guess and its states'''
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return line
+
+    writer.writerow(CSV_COLUMNS)
+    yield flush()
+    padding = [""] * Result.MAX_ATTEMPTS
+    for result in results:
+        guesses = (result["guesses"] + padding)[:Result.MAX_ATTEMPTS]
+        states = (result["states"] + padding)[:Result.MAX_ATTEMPTS]
+        writer.writerow([result[column] for column in RESULT_COLUMNS] + guesses + states)
+        yield flush()
+
+
+def parse_game_idx(value):
+    '''Game index from a number or a YYYY-MM-DD date. None stays None'''
+    if value is None or value == "":
+        return None
+    value = str(value).strip()
+    if value.lstrip("-").isdigit():
+        return int(value)
+    return get_idx_of_date(datetime.date.fromisoformat(value))
+
+
+def export_results(fmt, **filters):
+    '''Lines of the export in the given format ("ndjson" or "csv")'''
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    results = iter_results(**filters)
+    return to_ndjson(results) if fmt == "ndjson" else to_csv(results)
@@ -0,0 +1,28 @@
+'''gunicorn settings, picked up when gunicorn is started in this directory.
+
+The app is loaded once in the master process (preload_app) and the workers are
+forked from it, so they are ready as soon as they start and share the loaded
+word lists copy-on-write. Run `flask --app webapp/app.py init-db` first, the
+workers won't create or migrate the database themselves.'''
+import gc
+
+wsgi_app = "wsgi:app"
+preload_app = True
+
+
+def when_ready(server):
+    '''Runs in the master once the app is loaded, before any worker is forked'''
+    # what the master loaded lives as long as it does. Moving it out of the garbage
+    # collector's reach stops the workers' collections from writing to (and so
+    # copying) the pages they share with the master
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    '''Runs in each worker straight after the fork'''
+    from database import engine
+    from utils import restart_logging
+
+    # the master's pooled connections can't be shared, let the worker open its own
+    engine.dispose(close=False)
+    restart_logging()
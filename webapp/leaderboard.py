@@ -0,0 +1,107 @@
+'''Leaderboard and daily stats snapshots.
+
+The numbers come from the daily_stats and user_stats rollups, and each snapshot
+is cached for LEADERBOARD_CACHE_TTL seconds, so a page view costs a dict lookup
+no matter how many players there are.'''
+import threading
+import time
+
+from sqlalchemy import select
+
+import config
+from database import db_session
+from models import DailyStats, User, UserStats, get_language
+from utils import get_todays_idx
+
+
+class SnapshotCache:
+    '''Computed values kept for `ttl` seconds.
+
+    When a value expires the first request to ask rebuilds it while the others
+    wait for that instead of rebuilding it too.'''
+
+    def __init__(self, ttl, max_size=64):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries = {}  # key -> (expires_at, value)
+        # reentrant, the leaderboard snapshot includes today's daily snapshot
+        self.lock = threading.RLock()
+        self.stats = {"hits": 0, "refreshes": 0}
+
+    def get(self, key, build):
+        '''Cached value for key, built with build() if missing or expired'''
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self.stats["hits"] += 1
+            return entry[1]
+        with self.lock:
+            # another request may have rebuilt it while this one waited
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.stats["hits"] += 1
+                return entry[1]
+            value = build()
+            if len(self.entries) >= self.max_size:
+                self.entries.clear()
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.stats["refreshes"] += 1
+            return value
+
+    def clear(self):
+        '''Forget everything, e.g. after the rollups were rebuilt'''
+        with self.lock:
+            self.entries.clear()
+
+
+snapshot_cache = SnapshotCache(config.LEADERBOARD_CACHE_TTL)
+
+
+def word_difficulty(answer):
+    '''solver.get_difficulty(), without importing solver.py and numpy unless HINTS_ENABLED'''
+    if not config.HINTS_ENABLED:
+        return None
+    from solver import get_difficulty
+    return get_difficulty(answer)
+
+
+def build_daily_stats(game_date_idx):
+    '''Win rate, guess distribution, fastest solvers and word difficulty of one day'''
+    return {
+        **DailyStats.get_stats(game_date_idx).to_dict(),
+        "fastest_solvers": DailyStats.fastest_solvers(game_date_idx, config.LEADERBOARD_SIZE),
+        # how hard the word is for the solver in solver.py, None without one
+        "difficulty": word_difficulty(get_language().get_daily_word(game_date_idx)),
+        "generated_at": int(time.time()),
+    }
+
+
+def _top_players(order_by):
+    rows = (
+        select(User.name, UserStats)
+        .join(User, User.user_id == UserStats.user_id)
+        .order_by(*order_by)
+        .limit(config.LEADERBOARD_SIZE)
+    )
+    return [{"name": name, **stats.to_dict()} for name, stats in db_session.execute(rows)]
+
+
+def build_leaderboard():
+    '''Today's stats plus the players with the most wins and the longest streaks'''
+    todays_idx = get_todays_idx()
+    return {
+        "game_date_idx": todays_idx,
+        "today": get_daily_stats(todays_idx),
+        "most_wins": _top_players([UserStats.wins.desc(), UserStats.total_attempts]),
+        "longest_streaks": _top_players([UserStats.longest_streak.desc(), UserStats.wins.desc()]),
+        "generated_at": int(time.time()),
+    }
+
+
+def get_daily_stats(game_date_idx):
+    '''Cached snapshot of build_daily_stats()'''
+    return snapshot_cache.get(("daily", game_date_idx), lambda: build_daily_stats(game_date_idx))
+
+
+def get_leaderboard():
+    '''Cached snapshot of build_leaderboard()'''
+    return snapshot_cache.get(("leaderboard", get_todays_idx()), build_leaderboard)
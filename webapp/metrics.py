@@ -0,0 +1,258 @@
+'''Opt-in request metrics and sampling profiler (METRICS_ENABLED).
+
+Every gunicorn worker keeps its own numbers, so /metrics describes the worker
+that answered the scrape. Counters start again from zero when a worker restarts,
+which Prometheus' rate() already allows for.'''
+import bisect
+import cProfile
+import heapq
+import os
+import random
+import threading
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+from utils import logger
+
+# seconds, roughly Prometheus' default buckets with more detail under 100ms
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    '''Cumulative histogram with fixed buckets, like a Prometheus histogram'''
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        '''Exposition lines for the _bucket, _sum and _count series'''
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            yield f"{name}_bucket{_labels({**labels, 'le': le})} {cumulative}"
+        yield f"{name}_sum{_labels(labels)} {self.sum}"
+        yield f"{name}_count{_labels(labels)} {self.count}"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class SlowRequestProfiler:
+    '''Profiles a random sample of requests and keeps the `keep` slowest as .prof files.
+
+    Open the files with `python -m pstats` or snakeviz. Only one request per
+    worker is profiled at a time, the others run as usual.'''
+
+    def __init__(self, sample_rate, directory, keep):
+        self.sample_rate = sample_rate
+        self.directory = directory
+        self.keep = keep
+        self.slowest = []  # min-heap of (seconds, path)
+        self.lock = threading.Lock()
+        self.active = threading.Lock()
+        self.random = random.Random()
+        self.stats = {"profiled": 0, "saved": 0}
+
+    def start(self):
+        '''Return a running profiler for this request, or None if it isn't sampled'''
+        if self.sample_rate <= 0 or self.random.random() >= self.sample_rate:
+            return None
+        if not self.active.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:  # another profiler is already running in this process
+            self.active.release()
+            return None
+        return profiler
+
+    def finish(self, profiler, endpoint, seconds):
+        '''Stop the profiler and save it if the request is one of the slowest so far'''
+        profiler.disable()
+        self.active.release()
+        with self.lock:
+            self.stats["profiled"] += 1
+            if len(self.slowest) >= self.keep and seconds <= self.slowest[0][0]:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(
+                self.directory,
+                f"{seconds * 1000:09.2f}ms-{endpoint}-{os.getpid()}-{int(time.time())}.prof"
+            )
+            profiler.dump_stats(path)
+            self.stats["saved"] += 1
+            heapq.heappush(self.slowest, (seconds, path))
+            if len(self.slowest) > self.keep:
+                _, faster = heapq.heappop(self.slowest)
+                try:
+                    os.remove(faster)
+                except OSError as e:
+                    logger.debug("Could not remove profile %s: %s", faster, e)
+
+
+class Metrics:
+    '''Request, query and in-flight numbers for one worker'''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        self.in_flight = 0
+        self.requests = {}         # (method, endpoint, status) -> count
+        self.latency = {}          # endpoint -> Histogram of seconds
+        self.queries = {}          # endpoint -> Histogram of queries per request
+        self.query_seconds = {}    # endpoint -> total seconds spent in queries
+        self.queries_outside_requests = 0
+        self.profiler = None
+
+    def init_app(self, app, engine):
+        '''Hook the metrics into a Flask app and SQLAlchemy engine.
+
+        Call this before registering other before_request functions, one of
+        them returning a redirect would otherwise skip the timer.'''
+        if app.config.get("METRICS_PROFILE_SAMPLE_RATE", 0) > 0:
+            self.profiler = SlowRequestProfiler(
+                app.config["METRICS_PROFILE_SAMPLE_RATE"],
+                app.config["METRICS_PROFILE_DIR"],
+                app.config["METRICS_PROFILE_KEEP"],
+            )
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_appcontext(self._teardown)
+        # once per engine, every create_app() shares it
+        if not event.contains(engine, "after_cursor_execute", self._after_cursor_execute):
+            event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def _before_request(self):
+        with self.lock:
+            self.in_flight += 1
+        g.metrics_started = time.perf_counter()
+        # the request context is gone by the time teardown_appcontext runs
+        g.metrics_key = (request.method, request.endpoint or "unmatched")
+        g.metrics_queries = 0
+        g.metrics_query_seconds = 0.0
+        g.metrics_status = 500  # unless after_request says otherwise
+        g.metrics_profiler = self.profiler.start() if self.profiler else None
+
+    def _after_request(self, response):
+        g.metrics_status = response.status_code
+        return response
+
+    def _teardown(self, exception=None):
+        started = g.pop("metrics_started", None)
+        if started is None:  # app context without a request, e.g. a CLI command
+            return
+        seconds = time.perf_counter() - started
+        method, endpoint = g.metrics_key
+        profiler = g.pop("metrics_profiler", None)
+        if profiler is not None:
+            self.profiler.finish(profiler, endpoint, seconds)
+
+        key = (method, endpoint, g.metrics_status)
+        with self.lock:
+            self.in_flight -= 1
+            self.requests[key] = self.requests.get(key, 0) + 1
+            if endpoint not in self.latency:
+                self.latency[endpoint] = Histogram(LATENCY_BUCKETS)
+                self.queries[endpoint] = Histogram(QUERY_BUCKETS)
+                self.query_seconds[endpoint] = 0.0
+            self.latency[endpoint].observe(seconds)
+            self.queries[endpoint].observe(g.metrics_queries)
+            self.query_seconds[endpoint] += g.metrics_query_seconds
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get("metrics_query_started")
+        if started is None:
+            return
+        seconds = time.perf_counter() - started
+        if has_request_context() and "metrics_started" in g:
+            g.metrics_queries += 1
+            g.metrics_query_seconds += seconds
+        else:
+            with self.lock:
+                self.queries_outside_requests += 1
+
+    def render(self, gauges=None):
+        '''Prometheus text exposition of everything recorded so far.
+
+        `gauges` maps a metric prefix to a dict of stats, e.g. the cache
+        counters, and every number in it is exported as `<prefix>_<key>`.'''
+        lines = []
+        with self.lock:
+            lines += [
+                "# HELP wordle_http_requests_total Requests handled by this worker.",
+                "# TYPE wordle_http_requests_total counter",
+            ]
+            for (method, endpoint, status), count in sorted(self.requests.items()):
+                labels = {"method": method, "endpoint": endpoint, "status": status}
+                lines.append(f"wordle_http_requests_total{_labels(labels)} {count}")
+
+            lines += [
+                "# HELP wordle_http_request_duration_seconds Time from before_request to teardown.",
+                "# TYPE wordle_http_request_duration_seconds histogram",
+            ]
+            for endpoint, histogram in sorted(self.latency.items()):
+                lines += histogram.lines("wordle_http_request_duration_seconds", {"endpoint": endpoint})
+
+            lines += [
+                "# HELP wordle_db_queries_per_request SQL statements run by each request.",
+                "# TYPE wordle_db_queries_per_request histogram",
+            ]
+            for endpoint, histogram in sorted(self.queries.items()):
+                lines += histogram.lines("wordle_db_queries_per_request", {"endpoint": endpoint})
+
+            lines += [
+                "# HELP wordle_db_query_seconds_total Time spent executing SQL per endpoint.",
+                "# TYPE wordle_db_query_seconds_total counter",
+            ]
+            for endpoint, seconds in sorted(self.query_seconds.items()):
+                lines.append(f"wordle_db_query_seconds_total{_labels({'endpoint': endpoint})} {seconds}")
+
+            lines += [
+                "# TYPE wordle_db_queries_outside_requests_total counter",
+                f"wordle_db_queries_outside_requests_total {self.queries_outside_requests}",
+                "# HELP wordle_http_requests_in_flight Requests this worker is handling right now.",
+                "# TYPE wordle_http_requests_in_flight gauge",
+                f"wordle_http_requests_in_flight {self.in_flight}",
+                "# TYPE wordle_process_start_time_seconds gauge",
+                f"wordle_process_start_time_seconds {self.started_at}",
+            ]
+
+        if self.profiler is not None:
+            gauges = {**(gauges or {}), "wordle_profiler": dict(self.profiler.stats)}
+        for prefix, stats in (gauges or {}).items():
+            for key, value in sorted(stats.items()):
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                lines.append(f"# TYPE {prefix}_{key} gauge")
+                lines.append(f"{prefix}_{key} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["metrics_query_started"] = time.perf_counter()
+
+
+metrics = Metrics()
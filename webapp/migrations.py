@@ -0,0 +1,327 @@
+'''Schema migrations for databases created by older versions of the app.
+
+create_all() only creates missing tables, it never changes existing ones. Anything
+that alters a table goes here as a numbered migration. The version a database is
+at is kept in the schema_version table, and init_db() runs whatever is newer.'''
+import json
+
+from sqlalchemy import Integer, LargeBinary, inspect, text
+
+import config
+from scoring import state_from_class
+from utils import get_idx_end_time, logger
+
+MIGRATIONS = []
+# Longest guesses results.guesses holds since migration 7, 6 rows of 12 letters
+BOARD_COLUMN_LENGTH = 6 * 12
+
+
+def migration(version):
+    '''Register a function as the migration to the given schema version'''
+    def register(func):
+        MIGRATIONS.append((version, func))
+        MIGRATIONS.sort(key=lambda item: item[0])
+        return func
+    return register
+
+
+def _ensure_version_table(conn):
+    conn.execute(text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"))
+
+
+def get_version(conn):
+    '''Schema version of the database, 0 if it has never been migrated'''
+    _ensure_version_table(conn)
+    return conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+
+
+def _set_version(conn, version):
+    conn.execute(text("DELETE FROM schema_version"))
+    conn.execute(text("INSERT INTO schema_version (version) VALUES (:version)"), {"version": version})
+
+
+def latest_version():
+    '''Version of the newest migration'''
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def stamp_latest(engine):
+    '''Mark a database created from the current models as fully migrated'''
+    with engine.begin() as conn:
+        _ensure_version_table(conn)
+        _set_version(conn, latest_version())
+
+
+def migrate(engine):
+    '''Run every migration newer than the database, each in its own transaction.
+    Returns the versions that were applied'''
+    with engine.begin() as conn:
+        current = get_version(conn)
+
+    applied = []
+    for version, func in MIGRATIONS:
+        if version <= current:
+            continue
+        with engine.begin() as conn:
+            logger.info("Migrating database to version %d (%s)", version, func.__name__)
+            func(conn)
+            _set_version(conn, version)
+        applied.append(version)
+    return applied
+
+
+def _add_binary_column_sql(dialect, table, column):
+    '''ALTER TABLE adding an empty, not null binary column: BLOB on SQLite, BYTEA on Postgres'''
+    type_name = LargeBinary().compile(dialect=dialect)
+    # X'' is SQLite's empty blob, Postgres reads '' as an empty bytea
+    empty = "X''" if dialect.name == "sqlite" else "''"
+    return f"ALTER TABLE {table} ADD COLUMN {column} {type_name} NOT NULL DEFAULT {empty}"
+
+
+def _pack_int_board(rows, width):
+    '''A board in the integer format results.states had until migration 7:
+    2 bits per tile, tile j of row i at bit (i * width + j) * 2'''
+    packed = 0
+    for i, states in enumerate(rows):
+        for j, state in enumerate(states):
+            packed |= state << ((i * width + j) * 2)
+    return packed
+
+
+@migration(1)
+def compact_boards(conn):
+    '''Move boards stored in the old JSON tiles/tile_classes columns into guesses/states.
+
+    Older databases kept every board as two JSON strings of letters and CSS
+    classes. This adds the compact columns, converts each row and then drops the
+    JSON columns.'''
+    columns = {column["name"] for column in inspect(conn).get_columns("results")}
+    if "tiles" not in columns:
+        return
+
+    width = 5
+    if "guesses" not in columns:
+        conn.execute(text("ALTER TABLE results ADD COLUMN guesses VARCHAR(30) NOT NULL DEFAULT ''"))
+        # 60 bits, more than a Postgres INTEGER holds
+        conn.execute(text("ALTER TABLE results ADD COLUMN states BIGINT NOT NULL DEFAULT 0"))
+
+    updates = []
+    for row in conn.execute(text("SELECT result_id, num_attempts, tiles, tile_classes FROM results")):
+        tiles = json.loads(row.tiles)
+        tile_classes = json.loads(row.tile_classes)
+        # only the submitted rows, the old client also saved half typed words
+        n_rows = min(int(row.num_attempts or 0), len(tiles), 6)
+        guesses = "".join("".join(tiles[i]).ljust(width)[:width] for i in range(n_rows))
+        states = [[state_from_class(css_class) for css_class in tile_classes[i]] for i in range(n_rows)]
+        updates.append({"result_id": row.result_id, "guesses": guesses, "states": _pack_int_board(states, width)})
+
+    if updates:
+        conn.execute(text("UPDATE results SET guesses = :guesses, states = :states WHERE result_id = :result_id"), updates)
+    conn.execute(text("ALTER TABLE results DROP COLUMN tiles"))
+    conn.execute(text("ALTER TABLE results DROP COLUMN tile_classes"))
+    logger.info("Moved %d results to the compact board format", len(updates))
+
+
+@migration(2)
+def unique_result_per_day(conn):
+    '''Index results on (user_id, game_date_idx) and make it unique.
+
+    Concurrent first requests of the day could insert duplicate rows. Before the
+    index can be created those are removed, keeping the one with the most attempts.'''
+    deleted = conn.execute(text("""
+        DELETE FROM results WHERE result_id NOT IN (
+            SELECT result_id FROM (
+                SELECT result_id, ROW_NUMBER() OVER (
+                    PARTITION BY user_id, game_date_idx
+                    ORDER BY num_attempts DESC, result_id
+                ) AS rank_in_day
+                FROM results
+            ) AS ranked
+            WHERE rank_in_day = 1
+        )
+    """)).rowcount
+    if deleted:
+        logger.info("Removed %d duplicate results", deleted)
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_results_user_game ON results (user_id, game_date_idx)"
+    ))
+
+
+@migration(3)
+def daily_rollup(conn):
+    '''Add results.finished_at and its index, and fill daily_stats from the finished games.
+
+    Games that ended before this migration have no finish time, they sort after
+    every timed game with the same number of attempts. Like the live totals, only
+    games finished on their own day are counted (see Result.finished_on_its_day()).'''
+    columns = {column["name"] for column in inspect(conn).get_columns("results")}
+    if "finished_at" not in columns:
+        conn.execute(text("ALTER TABLE results ADD COLUMN finished_at INTEGER"))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_results_day_solvers "
+        "ON results (game_date_idx, game_won, num_attempts, finished_at)"
+    ))
+
+    won_in = ", ".join(
+        f"SUM(CASE WHEN game_won AND num_attempts = {attempts} THEN 1 ELSE 0 END)"
+        for attempts in range(1, 7)
+    )
+    conn.execute(text("DELETE FROM daily_stats"))
+    days = conn.execute(text(f"""
+        INSERT INTO daily_stats (game_date_idx, wins, losses, total_attempts,
+                                 won_in_1, won_in_2, won_in_3, won_in_4, won_in_5, won_in_6)
+        SELECT game_date_idx,
+               SUM(CASE WHEN game_won THEN 1 ELSE 0 END),
+               SUM(CASE WHEN game_won THEN 0 ELSE 1 END),
+               SUM(num_attempts),
+               {won_in}
+        FROM results
+        WHERE game_over
+          AND (finished_at IS NULL OR finished_at < :day_zero_end + game_date_idx * 86400)
+        GROUP BY game_date_idx
+    """), {"day_zero_end": get_idx_end_time(0)}).rowcount
+    logger.info("Rolled up daily stats for %d days", days)
+
+
+@migration(4)
+def guess_idempotency_key(conn):
+    '''Add results.last_guess_key for /guess retries'''
+    columns = {column["name"] for column in inspect(conn).get_columns("results")}
+    if "last_guess_key" not in columns:
+        conn.execute(text("ALTER TABLE results ADD COLUMN last_guess_key VARCHAR(64)"))
+
+
+@migration(5)
+def language_columns(conn):
+    '''Add results.language_code/word_length and keep a daily word schedule per game.
+
+    Everything saved before this was the DEFAULT_LANGUAGE's 5 letter game. The
+    unique index on results gets the new columns, and daily_words is copied into
+    a new table because its primary key changes.'''
+    language = {"language_code": config.DEFAULT_LANGUAGE, "word_length": 5}
+    columns = {column["name"] for column in inspect(conn).get_columns("results")}
+    if "language_code" not in columns:
+        conn.execute(text("ALTER TABLE results ADD COLUMN language_code VARCHAR(12) NOT NULL DEFAULT ''"))
+        conn.execute(text("ALTER TABLE results ADD COLUMN word_length INTEGER NOT NULL DEFAULT 5"))
+        conn.execute(text("UPDATE results SET language_code = :language_code"), language)
+    conn.execute(text("DROP INDEX IF EXISTS ix_results_user_game"))
+    conn.execute(text(
+        "CREATE UNIQUE INDEX ix_results_user_game "
+        "ON results (user_id, game_date_idx, language_code, word_length)"
+    ))
+
+    columns = {column["name"] for column in inspect(conn).get_columns("daily_words")}
+    if "language_code" not in columns:
+        conn.execute(text("""
+            CREATE TABLE daily_words_new (
+                language_code VARCHAR(12) NOT NULL,
+                word_length INTEGER NOT NULL,
+                game_date_idx INTEGER NOT NULL,
+                word VARCHAR(12) NOT NULL,
+                PRIMARY KEY (language_code, word_length, game_date_idx)
+            )
+        """))
+        days = conn.execute(text(
+            "INSERT INTO daily_words_new (language_code, word_length, game_date_idx, word) "
+            "SELECT :language_code, :word_length, game_date_idx, word FROM daily_words"
+        ), language).rowcount
+        conn.execute(text("DROP TABLE daily_words"))
+        conn.execute(text("ALTER TABLE daily_words_new RENAME TO daily_words"))
+        logger.info("Moved %d scheduled words to the %s schedule", days, config.DEFAULT_LANGUAGE)
+
+
+@migration(6)
+def user_stats_rollup(conn):
+    '''Fill user_stats from the finished games, as `flask backfill-stats` does.
+
+    Databases from before user_stats existed would otherwise show every player
+    0 games until someone ran backfill-stats by hand. Only the DEFAULT_LANGUAGE's
+    5 letter game finished on its own day counts, as in UserStats.counted_games().'''
+    conn.execute(text("DELETE FROM user_stats"))
+    rows = conn.execute(text("""
+        SELECT user_id, game_date_idx, num_attempts, game_won
+        FROM results
+        WHERE game_over AND language_code = :language_code AND word_length = 5
+          AND (finished_at IS NULL OR finished_at < :day_zero_end + game_date_idx * 86400)
+        ORDER BY user_id, game_date_idx
+    """), {"language_code": config.DEFAULT_LANGUAGE, "day_zero_end": get_idx_end_time(0)})
+
+    insert = text("""
+        INSERT INTO user_stats (user_id, wins, losses, total_attempts,
+                                won_in_1, won_in_2, won_in_3, won_in_4, won_in_5, won_in_6,
+                                current_streak, longest_streak, last_played_idx, last_won_idx)
+        VALUES (:user_id, :wins, :losses, :total_attempts,
+                :won_in_1, :won_in_2, :won_in_3, :won_in_4, :won_in_5, :won_in_6,
+                :current_streak, :longest_streak, :last_played_idx, :last_won_idx)
+    """)
+    n_users = 0
+    batch = []
+    for stats in _fold_user_stats(rows):
+        batch.append(stats)
+        if len(batch) >= 1000:
+            conn.execute(insert, batch)
+            n_users += len(batch)
+            batch = []
+    if batch:
+        conn.execute(insert, batch)
+        n_users += len(batch)
+    logger.info("Rebuilt stats for %d users", n_users)
+
+
+def _fold_user_stats(rows):
+    '''user_stats rows from (user_id, game_date_idx, num_attempts, game_won) rows
+    sorted by user and day. Streaks follow game_date_idx, so a skipped day ends them'''
+    stats = None
+    for row in rows:
+        if stats is None or stats["user_id"] != row.user_id:
+            if stats is not None:
+                yield stats
+            stats = {
+                "user_id": row.user_id, "wins": 0, "losses": 0, "total_attempts": 0,
+                **{f"won_in_{attempts}": 0 for attempts in range(1, 7)},
+                "current_streak": 0, "longest_streak": 0, "last_played_idx": None, "last_won_idx": None,
+            }
+        stats["total_attempts"] += row.num_attempts
+        if row.game_won:
+            stats["wins"] += 1
+            if 1 <= row.num_attempts <= 6:
+                stats[f"won_in_{row.num_attempts}"] += 1
+            if stats["last_won_idx"] is not None and stats["last_won_idx"] == row.game_date_idx - 1:
+                stats["current_streak"] += 1
+            else:
+                stats["current_streak"] = 1
+            stats["longest_streak"] = max(stats["longest_streak"], stats["current_streak"])
+            stats["last_won_idx"] = row.game_date_idx
+        else:
+            stats["losses"] += 1
+            stats["current_streak"] = 0
+        stats["last_played_idx"] = row.game_date_idx
+    if stats is not None:
+        yield stats
+
+
+@migration(7)
+def state_bytes(conn):
+    '''Store results.states as bytes instead of an integer, still 2 bits per tile.
+
+    A 64 bit integer only had room for 6 rows of 5 letters. The bytes are the
+    integer's, little endian, cut to the rows played. results.guesses is widened
+    for the longest words too, SQLite doesn't enforce VARCHAR lengths but Postgres
+    gets it changed in place. Both can add, drop and rename columns.'''
+    columns = {column["name"]: column for column in inspect(conn).get_columns("results")}
+    if not isinstance(columns["states"]["type"], Integer):
+        return
+
+    if conn.dialect.name != "sqlite":
+        conn.execute(text(f"ALTER TABLE results ALTER COLUMN guesses TYPE VARCHAR({BOARD_COLUMN_LENGTH})"))
+    conn.execute(text(_add_binary_column_sql(conn.dialect, "results", "state_bytes")))
+    updates = []
+    for row in conn.execute(text("SELECT result_id, word_length, guesses, states FROM results")):
+        n_tiles = len(row.guesses) // row.word_length * row.word_length
+        packed = row.states.to_bytes((n_tiles * 2 + 7) // 8, "little")
+        updates.append({"result_id": row.result_id, "state_bytes": packed})
+    if updates:
+        conn.execute(text("UPDATE results SET state_bytes = :state_bytes WHERE result_id = :result_id"), updates)
+    conn.execute(text("ALTER TABLE results DROP COLUMN states"))
+    conn.execute(text("ALTER TABLE results RENAME COLUMN state_bytes TO states"))
+    logger.info("Moved the tile states of %d results to bytes", len(updates))
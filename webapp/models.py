@@ -1,11 +1,25 @@
 '''Language class and database tables'''
-import json
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
 
 from flask_login import UserMixin
-from sqlalchemy import Column, Integer, String, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, LargeBinary, String, ForeignKey, Boolean, Index, case, func, or_, select, text, update
 from sqlalchemy.orm import relationship
-from database import Base, db_session
+import config
+from assets import MappedWordListAsset, WordListAsset
+from database import Base, db_session, dialect_insert, engine
+from scoring import encode_states, get_scorer, pack_board, packed_size, score_board, unpack_board
+from word_index import MappedWordIndex, WordIndex, write_word_file
+from constraints import ConstraintIndex, MappedConstraintIndex
+from write_queue import WriteQueue, WriteQueueFull
 from utils import (
+    DATA_DIR,
+    get_idx_end_time,
     get_todays_idx,
     load_language_config,
     load_characters,
@@ -15,42 +29,478 @@ from utils import (
     logger
 )
 
+# Guesses a game allows, and the word length of a language that doesn't ask for another
+MAX_ATTEMPTS = 6
+DEFAULT_WORD_LENGTH = 5
+# Longest words a game can have, the most a WordIndex packs into one array item
+MAX_WORD_LENGTH = WordIndex.MAX_WORD_LENGTH
+# What a language code may look like, it is also the name of its directory in data/
+LANGUAGE_CODE_PATTERN = re.compile(r"[a-z0-9_-]{1,12}")
+
+
 class Language:
-    '''Holds the attributes of a language'''
-
-    def __init__(self):
-        # self.language_code = language_code
-        self.characters = load_characters()
-        self.word_list = load_words(self.characters)
-        self.word_list_supplement = load_words_supplement(self.characters)
-        # self.word_list_supplement = language_codes_5words_supplements[language_code]
-        self.todays_idx = get_todays_idx()
-        self.daily_word = self.word_list[self.todays_idx % len(self.word_list)]
-        self.config = load_language_config()
-
-        self.keyboard = load_keyboard()
-        if self.keyboard == []:  # if no keyboard defined, then use available chars
+    '''Holds the attributes of a language, for one word length.
+
+    Built once and shared by every request, so treat it as read-only.
+    Use get_language() instead of constructing one per request.'''
+
+    # files in DATA_DIR a Language is built from. get_language() rebuilds when one changes
+    DATA_FILES = (
+        "characters.txt",
+        "words.txt",
+        "words_supplement.txt",
+        "language_config.json",
+        "keyboard.json",
+    )
+
+    def __init__(self, language_code=None, word_length=DEFAULT_WORD_LENGTH, data_dir=DATA_DIR, use_word_file=True):
+        self.language_code = language_code or config.DEFAULT_LANGUAGE
+        self.word_length = word_length
+        # which game this is, see LanguageRegistry
+        self.key = (self.language_code, self.word_length)
+        self.characters = tuple(load_characters(data_dir))
+        self.character_set = frozenset(self.characters)
+        # word_list is already shuffled, so it doubles as the daily word table
+        self.word_list = load_daily_words(self.characters, data_dir, word_length)
+        # every word a guess may be, packed for fast lookups. See check_word(). Mapped from
+        # the compiled word file if there's an up to date one, the supplement isn't read then
+        word_file = self._load_word_file(data_dir) if use_word_file else None
+        if word_file is not None:
+            self.word_index = word_file
+            # compiled into the word file as well, nothing is built from the words
+            self.constraint_index = MappedConstraintIndex(word_file)
+            self.word_list_asset = MappedWordListAsset(word_file)
+        else:
+            self.word_index = WordIndex(
+                self.characters,
+                self.word_list + load_supplement_words(self.characters, data_dir, word_length),
+            )
+            words = tuple(self.word_index)
+            # bitsets of the same words for counting the ones that fit a board. See constraints.py
+            self.constraint_index = ConstraintIndex(words)
+            # the same words as a cacheable file for clients that check guesses locally
+            self.word_list_asset = WordListAsset(words)
+        language_config = load_language_config(data_dir)
+        if not isinstance(language_config, dict):
+            # a language without its own texts uses the ones in data/
+            language_config = load_language_config()
+        self.config = {**language_config, "language_code": self.language_code}
+        self.keyboard = self._build_keyboard(data_dir)
+        # stands for this load of the data files in caches of things built from it, without
+        # keeping the whole Language alive once the registry drops it (see assets.PageCache)
+        self.version = object()
+
+    @property
+    def todays_idx(self):
+        '''Index of today's game. Computed on access because the Language outlives the day'''
+        return get_todays_idx()
+
+    @property
+    def daily_word(self):
+        '''Today's word'''
+        return self.get_daily_word(self.todays_idx)
+
+    def get_daily_word(self, game_date_idx):
+        '''Word for a given game index, from the saved schedule (see WordSchedule)'''
+        return get_word_schedule(self.key).get_word(game_date_idx, self.word_list)
+
+    def schedule_words(self):
+        '''Save the daily words up to SCHEDULE_DAYS_AHEAD days after today'''
+        get_word_schedule(self.key).ensure(self.word_list)
+
+    def _load_word_file(self, data_dir):
+        '''MappedWordIndex of the game's word file, None if there isn't an up to date one'''
+        path = word_file_path(self.key)
+        try:
+            index = MappedWordIndex(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning("Not using the word file: %s", e)
+            return None
+        # the sources are only read and hashed if their sizes or mtimes changed
+        up_to_date = (
+            index.source_stamp == word_sources_stamp(data_dir, self.word_length)
+            or index.source_digest == word_sources_digest(data_dir, self.word_length)
+        )
+        if not up_to_date or index.characters != self.characters:
+            logger.warning("%s is out of date, run `flask --app webapp/app.py compile-words`", path)
+            return None
+        return index
+
+    def check_word(self, word):
+        '''Whether a guess is in either word list'''
+        return word in self.word_index
+
+    def _build_keyboard(self, data_dir):
+        '''Load the keyboard layout, falling back to one built from the character set'''
+        keyboard = load_keyboard(data_dir)
+        if not isinstance(keyboard, list):  # no keyboard.json
+            keyboard = []
+        if keyboard == []:  # if no keyboard defined, then use available chars
             # keyboard of ten characters per row
             for i, c in enumerate(self.characters):
                 if i % 10 == 0:
-                    self.keyboard.append([])
-                self.keyboard[-1].append(c)
-            self.keyboard[-1].insert(0, "⇨")
-            self.keyboard[-1].append("⌫")
+                    keyboard.append([])
+                keyboard[-1].append(c)
+            keyboard[-1].insert(0, "⇨")
+            keyboard[-1].append("⌫")
 
             # Deal with bottom row being too crammed:
-            if len(self.keyboard[-1]) == 11:
-                popped_c = self.keyboard[-1].pop(1)
-                self.keyboard[-2].insert(-1, popped_c)
-            if len(self.keyboard[-1]) == 12:
-                popped_c = self.keyboard[-2].pop(0)
-                self.keyboard[-3].insert(-1, popped_c)
-                popped_c = self.keyboard[-1].pop(2)
-                self.keyboard[-2].insert(-1, popped_c)
-                popped_c = self.keyboard[-1].pop(2)
-                self.keyboard[-2].insert(-1, popped_c)
+            if len(keyboard[-1]) == 11:
+                popped_c = keyboard[-1].pop(1)
+                keyboard[-2].insert(-1, popped_c)
+            if len(keyboard[-1]) == 12:
+                popped_c = keyboard[-2].pop(0)
+                keyboard[-3].insert(-1, popped_c)
+                popped_c = keyboard[-1].pop(2)
+                keyboard[-2].insert(-1, popped_c)
+                popped_c = keyboard[-1].pop(2)
+                keyboard[-2].insert(-1, popped_c)
+
+        return tuple(tuple(row) for row in keyboard)
+
+
+def load_daily_words(characters, data_dir, word_length):
+    '''Words of a game's length in words.txt, shuffled'''
+    words = tuple(word for word in load_words(characters, data_dir) if len(word) == word_length)
+    if not words:
+        raise ValueError(f"No {word_length} letter words in {os.path.join(data_dir, 'words.txt')}")
+    return words
+
+
+def load_supplement_words(characters, data_dir, word_length):
+    '''Words of a game's length in words_supplement.txt'''
+    # the loaders hand back an error tuple if a file is missing, and the supplement is optional
+    return tuple(
+        word for word in load_words_supplement(characters, data_dir)
+        if isinstance(word, str) and len(word) == word_length
+    )
+
+
+# files a game's word index is built from
+WORD_SOURCE_FILES = ("characters.txt", "words.txt", "words_supplement.txt")
+
+
+def word_file_path(key):
+    '''Where a game's compiled word file is, by (language code, word length)'''
+    return os.path.join(config.WORD_FILE_DIR, f"words-{key[0]}-{key[1]}.bin")
+
+
+def word_sources_digest(data_dir, word_length):
+    '''16 byte digest of the files a game's word index is built from, to tell if a word file is stale'''
+    digest = hashlib.sha256(str(word_length).encode("ascii"))
+    for name in WORD_SOURCE_FILES:
+        digest.update(b"\0")
+        try:
+            with open(os.path.join(data_dir, name), "rb") as f:
+                digest.update(f.read())
+        except FileNotFoundError:
+            pass
+    return digest.digest()[:16]
 
 
+def word_sources_stamp(data_dir, word_length):
+    '''16 byte digest of the sizes and mtimes of a game's word lists. Cheaper than
+    word_sources_digest(), but it changes when the files are only copied or touched'''
+    digest = hashlib.sha256(str(word_length).encode("ascii"))
+    for name in WORD_SOURCE_FILES:
+        try:
+            stat = os.stat(os.path.join(data_dir, name))
+        except FileNotFoundError:
+            digest.update(b"\0-")
+        else:
+            digest.update(f"\0{stat.st_size}:{stat.st_mtime_ns}".encode("ascii"))
+    return digest.digest()[:16]
+
+
+def compile_word_file(key):
+    '''Build a game's word index from its word lists and save it as its word file.
+    Returns (path, number of words)'''
+    data_dir = language_registry.data_dir(key)
+    characters = tuple(load_characters(data_dir))
+    words = load_daily_words(characters, data_dir, key[1]) + load_supplement_words(characters, data_dir, key[1])
+    # WordIndex drops duplicates and words with letters outside characters.txt
+    index = WordIndex(characters, words)
+    indexed_words = tuple(index)
+    path = word_file_path(key)
+    write_word_file(
+        path, index, ConstraintIndex(indexed_words), WordListAsset(indexed_words),
+        word_sources_digest(data_dir, key[1]), word_sources_stamp(data_dir, key[1]),
+    )
+    return path, len(index)
+
+
+# how often (seconds) get_language() looks at the data files for changes
+LANGUAGE_CHECK_INTERVAL = 1.0
+
+language_stats = {
+    "loads": 0,
+    "last_load_seconds": None,
+    "last_loaded_at": None,
+    "total_load_seconds": 0.0,
+    "checks": 0,
+    "evictions": 0,
+}
+
+
+def parse_languages(value, default_language):
+    '''(language code, word length) of every game to host from a LANGUAGES setting.
+    The default language's DEFAULT_WORD_LENGTH letter game always comes first'''
+    if not LANGUAGE_CODE_PATTERN.fullmatch(default_language):
+        raise ValueError(f"Bad DEFAULT_LANGUAGE: {default_language!r}")
+    keys = [(default_language, DEFAULT_WORD_LENGTH)]
+    for item in value.split(","):
+        item = item.strip().lower()
+        if not item:
+            continue
+        language_code, _, word_length = item.partition(":")
+        if not LANGUAGE_CODE_PATTERN.fullmatch(language_code):
+            raise ValueError(f"Bad language code in LANGUAGES: {language_code!r}")
+        word_length = int(word_length) if word_length else DEFAULT_WORD_LENGTH
+        if not 2 <= word_length <= MAX_WORD_LENGTH:
+            raise ValueError(f"Word lengths in LANGUAGES must be 2 to {MAX_WORD_LENGTH}: {item!r}")
+        if (language_code, word_length) not in keys:
+            keys.append((language_code, word_length))
+    return tuple(keys)
+
+
+def _language_data_mtimes(data_dir, key):
+    '''Modification times of a game's data files and word file. Missing files are None'''
+    paths = [os.path.join(data_dir, name) for name in Language.DATA_FILES] + [word_file_path(key)]
+    mtimes = []
+    for path in paths:
+        try:
+            mtimes.append(os.stat(path).st_mtime_ns)
+        except FileNotFoundError:
+            mtimes.append(None)
+    return tuple(mtimes)
+
+
+class LanguageRegistry:
+    '''The hosted games by (language code, word length), each Language loaded on first use.
+
+    The default language's files are in data/ and every other language's in
+    data/<code>/. A language's word lengths share its directory, each game
+    takes the words of its own length. The default game is always kept
+    (warm_up() loads it before gunicorn forks), the others are dropped least
+    recently used first once more than max_size are loaded. Like before, a
+    Language is built again when one of its data files changes, which is
+    checked at most every LANGUAGE_CHECK_INTERVAL seconds.'''
+
+    def __init__(self, keys, max_size):
+        self.keys = keys
+        self.default_key = keys[0]
+        self.max_size = max_size
+        # key -> (Language, data file mtimes, time.monotonic() of the last check)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def data_dir(self, key):
+        '''Directory a game's data files are in'''
+        if key[0] == self.default_key[0]:
+            return DATA_DIR
+        return os.path.join(DATA_DIR, key[0])
+
+    def resolve(self, language_code=None, word_length=None):
+        '''Key of a hosted game, or None. Without a code that's the default language,
+        and without a length the first one LANGUAGES lists for the code'''
+        language_code = language_code or self.default_key[0]
+        for key in self.keys:
+            if key[0] == language_code and word_length in (None, key[1]):
+                return key
+        return None
+
+    def get(self, key):
+        '''Language of a hosted game, loaded if it isn't or its files changed'''
+        now = time.monotonic()
+        entry = self.entries.get(key)
+        if entry is not None and now - entry[2] < LANGUAGE_CHECK_INTERVAL:
+            return entry[0]
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and now - entry[2] < LANGUAGE_CHECK_INTERVAL:
+                return entry[0]
+            language_stats["checks"] += 1
+            data_dir = self.data_dir(key)
+            mtimes = _language_data_mtimes(data_dir, key)
+            if entry is None or mtimes != entry[1]:
+                started = time.perf_counter()
+                language = Language(key[0], key[1], data_dir)
+                elapsed = time.perf_counter() - started
+                language_stats["loads"] += 1
+                language_stats["last_load_seconds"] = elapsed
+                language_stats["total_load_seconds"] += elapsed
+                language_stats["last_loaded_at"] = time.time()
+                logger.info("Loaded language data for %s (%d letters) in %.3fs", key[0], key[1], elapsed)
+            else:
+                language = entry[0]
+            self.entries[key] = (language, mtimes, time.monotonic())
+            self.entries.move_to_end(key)
+            self._evict()
+            return language
+
+    def _evict(self):
+        '''Drop the least recently checked games past max_size, never the default one'''
+        for key in list(self.entries):
+            if len(self.entries) <= max(1, self.max_size):
+                break
+            if key != self.default_key:
+                del self.entries[key]
+                language_stats["evictions"] += 1
+
+
+language_registry = LanguageRegistry(
+    parse_languages(config.LANGUAGES, config.DEFAULT_LANGUAGE),
+    config.LANGUAGE_CACHE_SIZE,
+)
+
+
+def get_language(language_code=None, word_length=None):
+    '''Shared Language of a hosted game, the default one unless another is asked for.
+    None if that game isn't hosted (see config.LANGUAGES)'''
+    key = language_registry.resolve(language_code, word_length)
+    if key is None:
+        return None
+    return language_registry.get(key)
+
+
+class DailyWord(Base):
+    '''The word of each game index, saved so editing words.txt never changes a past or scheduled game'''
+    __tablename__ = 'daily_words'
+    language_code = Column(String(12), primary_key=True)
+    word_length = Column(Integer, primary_key=True, autoincrement=False)
+    game_date_idx = Column(Integer, primary_key=True, autoincrement=False)
+    word = Column(String(12), nullable=False)
+
+    def __repr__(self):
+        return f'<DailyWord {self.game_date_idx!r}>'
+
+
+class WordSchedule:
+    '''In-memory copy of the daily_words table, so looking up a day's word is a dict lookup.
+
+    Each hosted game has its own schedule. Days missing from the table are
+    filled in the way words always were picked, word_list[game_date_idx % len(word_list)],
+    from index 0 up to SCHEDULE_DAYS_AHEAD days after today. Existing rows are
+    never overwritten, so only days that weren't scheduled yet pick up changes
+    to the word list.'''
+
+    def __init__(self, language_code, word_length, days_ahead):
+        self.language_code = language_code
+        self.word_length = word_length
+        self.days_ahead = days_ahead
+        self.words = {}  # game_date_idx -> word
+        self.lock = threading.Lock()
+
+    def get_word(self, game_date_idx, word_list):
+        '''Word for a game index, scheduling more days if it is past the end'''
+        word = self.words.get(game_date_idx)
+        if word is None:
+            self.ensure(word_list, max(game_date_idx, get_todays_idx() + self.days_ahead))
+            word = self.words.get(game_date_idx)
+        return word
+
+    def ensure(self, word_list, last_idx=None):
+        '''Load the schedule, adding any missing days up to last_idx'''
+        if last_idx is None:
+            last_idx = get_todays_idx() + self.days_ahead
+        with self.lock:
+            # days are always filled from 0, so having last_idx means having everything before it
+            if last_idx in self.words:
+                return
+            scheduled = select(DailyWord.game_date_idx, DailyWord.word).where(
+                DailyWord.language_code == self.language_code,
+                DailyWord.word_length == self.word_length,
+            )
+            with engine.begin() as conn:
+                words = dict(conn.execute(scheduled).all())
+                missing = [
+                    {
+                        "language_code": self.language_code,
+                        "word_length": self.word_length,
+                        "game_date_idx": idx,
+                        "word": word_list[idx % len(word_list)],
+                    }
+                    for idx in range(last_idx + 1) if idx not in words
+                ]
+                if missing:
+                    # another worker may be filling the same days, the first one wins
+                    conn.execute(dialect_insert(DailyWord).on_conflict_do_nothing(), missing)
+                    words = dict(conn.execute(scheduled).all())
+                    logger.info(
+                        "Scheduled daily words for %s (%d letters) up to game %d",
+                        self.language_code, self.word_length, last_idx
+                    )
+            self.words = words
+
+
+# WordSchedule of each game, by (language code, word length)
+_word_schedules = {}
+_word_schedules_lock = threading.Lock()
+
+
+def get_word_schedule(key):
+    '''WordSchedule of a game. It outlives the Language, reloading words.txt doesn't lose it'''
+    schedule = _word_schedules.get(key)
+    if schedule is None:
+        with _word_schedules_lock:
+            schedule = _word_schedules.get(key)
+            if schedule is None:
+                schedule = _word_schedules[key] = WordSchedule(key[0], key[1], config.SCHEDULE_DAYS_AHEAD)
+    return schedule
+
+
+class UserCache:
+    '''LRU cache of user records by user_id, entries expire after `ttl` seconds.
+
+    Only (user_id, name, email) is kept, never the ORM object, because that
+    belongs to the request's database session.'''
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()  # user_id -> (expires_at, identity)
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def get(self, user_id):
+        '''Cached identity for a user, or None'''
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None or entry[0] < time.monotonic():
+                self.stats["misses"] += 1
+                return None
+            self.entries.move_to_end(user_id)
+            self.stats["hits"] += 1
+            return entry[1]
+
+    def put(self, user_id, identity):
+        '''Cache a user's identity'''
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.entries[user_id] = (time.monotonic() + self.ttl, identity)
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def invalidate(self, user_id):
+        '''Forget a user, e.g. after their record changed'''
+        with self.lock:
+            if self.entries.pop(user_id, None) is not None:
+                self.stats["invalidations"] += 1
+
+    def get_stats(self):
+        '''Counters plus the current size'''
+        with self.lock:
+            return {**self.stats, "size": len(self.entries), "max_size": self.max_size}
+
+
+user_cache = UserCache(config.USER_CACHE_SIZE, config.USER_CACHE_TTL)
+
 
 class User(UserMixin, Base):
     '''Holds the attributes for a User'''
@@ -78,7 +528,29 @@ class User(UserMixin, Base):
     def get_user(cls, user_id):
         """Return a User instance by unique ID or None if not found."""
         user = db_session.query(cls).filter(cls.user_id == user_id).first()
-        logger.debug(user)
+        logger.debug("Loaded user %r", user)
+        return user
+
+    @property
+    def identity(self):
+        """The fields needed to rebuild this user without the database"""
+        return (self.user_id, self.name, self.email)
+
+    @classmethod
+    def from_identity(cls, identity):
+        """User rebuilt from `identity`. It isn't attached to a database session"""
+        return cls(*identity)
+
+    @classmethod
+    def load_user(cls, user_id):
+        """Return a User by unique ID, from user_cache if possible, or None if not found."""
+        identity = user_cache.get(user_id)
+        if identity is not None:
+            return cls.from_identity(identity)
+
+        user = cls.get_user(user_id)
+        if user:
+            user_cache.put(user_id, user.identity)
         return user
 
     @classmethod
@@ -89,43 +561,42 @@ class User(UserMixin, Base):
             user = cls(user_id, name, email)
             db_session.add(user)
             db_session.commit()
+        user_cache.invalidate(user_id)
         return user
 
 
 class Result(Base):
     '''Stores game results'''
     __tablename__ = 'results'
+    __table_args__ = (
+        # every request looks up today's result by these, and a user gets one result per day and game
+        Index("ix_results_user_game", "user_id", "game_date_idx", "language_code", "word_length", unique=True),
+        # fastest solvers of a day, see DailyStats.fastest_solvers()
+        Index("ix_results_day_solvers", "game_date_idx", "game_won", "num_attempts", "finished_at"),
+    )
+    MAX_ATTEMPTS = MAX_ATTEMPTS
+
     result_id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(String(50), ForeignKey("users.user_id", ondelete="CASCADE"), nullable=False)
     game_date_idx = Column(Integer, nullable=False)
+    # the game the board is for, see LanguageRegistry
+    language_code = Column(String(12), nullable=False, default=config.DEFAULT_LANGUAGE)
+    word_length = Column(Integer, nullable=False, default=DEFAULT_WORD_LENGTH)
 
     # Using string for num_attempts because that is what the javascript used originally
     num_attempts = Column(Integer, default=0, nullable=False)
 
-    tiles = Column(String(200),
-                    default='''[
-                        ["", "", "", "", ""],
-                        ["", "", "", "", ""],
-                        ["", "", "", "", ""],
-                        ["", "", "", "", ""],
-                        ["", "", "", "", ""],
-                        ["", "", "", "", ""]
-                    ]''',
-                    nullable=False)
-    tile_classes = Column(String(1200),
-                        default='''
-                        [
-                            ["border-2 border-neutral-300", "border-2 border-neutral-300", "border-2 border-neutral-300", "border-2 border-neutral-300", "border-2 border-neutral-300"],
-                            ["border-2 border-neutral-300", "border-2 border-neutral-300", "border-2 border-neutral-300", "border-2 border-neutral-300", "border-2 border-neutral-300"],
-                            ["border-2 border-neutral-300", "border-2 border-neutral-300", "border-2 border-neutral-300", "border-2 border-neutral-300", "border-2 border-neutral-300"],
-                            ["border-2 border-neutral-300", "border-2 border-neutral-300", "border-2 border-neutral-300", "border-2 border-neutral-300", "border-2 border-neutral-300"],
-                            ["border-2 border-neutral-300", "border-2 border-neutral-300", "border-2 border-neutral-300", "border-2 border-neutral-300", "border-2 border-neutral-300"],
-                            ["border-2 border-neutral-300", "border-2 border-neutral-300", "border-2 border-neutral-300", "border-2 border-neutral-300", "border-2 border-neutral-300"]
-                        ]''',
-                        nullable=False)
+    # submitted guesses back to back, word_length characters each
+    guesses = Column(String(MAX_ATTEMPTS * MAX_WORD_LENGTH), default="", nullable=False)
+    # tile states of the guesses, 2 bits per tile. See scoring.pack_board()
+    states = Column(LargeBinary(packed_size(MAX_ATTEMPTS, MAX_WORD_LENGTH)), default=b"", nullable=False)
     game_over = Column(Boolean, default=False, nullable=False)
     game_lost = Column(Boolean, default=False, nullable=False)
     game_won = Column(Boolean, default=False, nullable=False)
+    # unix time the game ended, breaks ties between solvers with the same number of attempts
+    finished_at = Column(Integer)
+    # idempotency key of the last guess sent to /guess, so a retried request isn't applied twice
+    last_guess_key = Column(String(64))
 
     # relationship to user
     user = relationship("User", back_populates="results")
@@ -133,24 +604,10 @@ class Result(Base):
     def __init__(self, user_id):
         self.user_id = user_id
         self.game_date_idx = get_todays_idx()
+        self.language_code, self.word_length = language_registry.default_key
         self.num_attempts = 0
-        # stringified because that is how sqlite likes it
-        self.tiles = [
-                        ["", "", "", "", ""],
-                        ["", "", "", "", ""],
-                        ["", "", "", "", ""],
-                        ["", "", "", "", ""],
-                        ["", "", "", "", ""],
-                        ["", "", "", "", ""]
-                        ]
-        self.tile_classes = [
-                            ["border-2 border-neutral-300", "border-2 border-neutral-300", "border-2 border-neutral-300", "border-2 border-neutral-300", "border-2 border-neutral-300"],
-                            ["border-2 border-neutral-300", "border-2 border-neutral-300", "border-2 border-neutral-300", "border-2 border-neutral-300", "border-2 border-neutral-300"],
-                            ["border-2 border-neutral-300", "border-2 border-neutral-300", "border-2 border-neutral-300", "border-2 border-neutral-300", "border-2 border-neutral-300"],
-                            ["border-2 border-neutral-300", "border-2 border-neutral-300", "border-2 border-neutral-300", "border-2 border-neutral-300", "border-2 border-neutral-300"],
-                            ["border-2 border-neutral-300", "border-2 border-neutral-300", "border-2 border-neutral-300", "border-2 border-neutral-300", "border-2 border-neutral-300"],
-                            ["border-2 border-neutral-300", "border-2 border-neutral-300", "border-2 border-neutral-300", "border-2 border-neutral-300", "border-2 border-neutral-300"]
-                            ]
+        self.guesses = ""
+        self.states = b""
         self.game_over = False
         self.game_lost = False
         self.game_won = False
@@ -158,43 +615,112 @@ class Result(Base):
     def __repr__(self):
         return f'<Result {self.result_id!r}>'
 
+    @property
+    def guess_list(self):
+        """Submitted guesses as a list of words"""
+        width = self.word_length
+        return [self.guesses[i:i + width] for i in range(0, len(self.guesses), width)]
+
+    @property
+    def state_rows(self):
+        """Tile states of the submitted guesses, one tuple per guess"""
+        return unpack_board(self.states, len(self.guesses) // self.word_length, self.word_length)
+
+    @property
+    def board_key(self):
+        """(user, day, language code, word length), the board's key in result_writes"""
+        return (self.user_id, self.game_date_idx, self.language_code, self.word_length)
+
+    @property
+    def counts_towards_stats(self):
+        """Only the default game played on its own day counts towards stats and the leaderboard"""
+        return (
+            self.game_date_idx == get_todays_idx()
+            and (self.language_code, self.word_length) == language_registry.default_key
+        )
+
+    @classmethod
+    def finished_on_its_day(cls):
+        """Filter for boards that count towards stats: not finished after their game's day
+        ended, i.e. not played from the archive. Boards from before finished_at was saved count"""
+        # get_idx_end_time(game_date_idx) worked out in SQL, every game's day is 86400 seconds
+        day_end = get_idx_end_time(0) + cls.game_date_idx * 86400
+        return or_(cls.finished_at.is_(None), cls.finished_at < day_end)
+
+    @classmethod
+    def in_game(cls, language_key=None):
+        """Filters for the boards of one game, by (language code, word length). The default game if None"""
+        language_code, word_length = language_key or language_registry.default_key
+        return (cls.language_code == language_code, cls.word_length == word_length)
+
     def to_dict(self):
         """Turns Result to dictionary"""
         return {
             "result_id": self.result_id,
             "user_id": self.user_id,
             "game_date_idx": self.game_date_idx,
+            "language_code": self.language_code,
+            "word_length": self.word_length,
             "num_attempts": self.num_attempts,
-            "tiles": self.tiles,
-            "tile_classes": self.tile_classes,
+            # the client builds the board from these, see loadFromDatabase() in game.js
+            "guesses": self.guess_list,
+            "guess_states": [encode_states(states) for states in self.state_rows],
             "game_over": self.game_over,
             "game_lost": self.game_lost,
             "game_won": self.game_won,
         }
 
     @classmethod
-    def get_result(cls, user_id):
-        """Get board for user. Always pulls todays result"""
-        game_date_idx = get_todays_idx()
-        result =  db_session.query(cls).filter(cls.user_id == user_id).filter(cls.game_date_idx == game_date_idx).first()
+    def get_result(cls, user_id, game_date_idx=None, language_key=None):
+        """Get board for user. Pulls today's result unless given an archived game's index,
+        for the default game unless given another's (language code, word length)"""
+        if game_date_idx is None:
+            game_date_idx = get_todays_idx()
+        # a guess this worker queued but hasn't committed yet, see queue_guess(). Looked up
+        # before the board is read, so one committed in between is in one or the other
+        language_code, word_length = language_key or language_registry.default_key
+        pending = result_writes.pending_values((user_id, game_date_idx, language_code, word_length))
+        result = (
+            db_session.query(cls)
+            .filter(cls.user_id == user_id, cls.game_date_idx == game_date_idx, *cls.in_game(language_key))
+            .first()
+        )
 
         if not result:
-            result = cls.create_result(user_id)
+            result = cls.create_result(user_id, game_date_idx, language_key)
 
-        result.tiles = json.loads(result.tiles)
-        result.tile_classes = json.loads(result.tile_classes)
+        if pending:
+            result = result.with_values(pending)
 
         return result
 
+    def with_values(self, values):
+        """Set column values that are saved some other way than this request's session,
+        so the session won't flush them. Returns self"""
+        if self in db_session:
+            db_session.expunge(self)
+        for column, value in values.items():
+            setattr(self, column, value)
+        return self
+
     @classmethod
-    def update_result(cls, user_id, num_attempts, tiles, tile_classes, game_over, game_lost, game_won):
-        """Update result with new board, result, etc"""
-        result = cls.get_result(user_id)
+    def update_result(cls, user_id, num_attempts, guesses, states, game_over, game_lost, game_won, result=None):
+        """Update result with new board, result, etc.
+        Pass the result from get_result() if the caller already has it"""
+        if result is None:
+            result = cls.get_result(user_id)
 
         if result:
+            # stats only change when a game finishes, and only count the default game played on its own day
+            if game_over and not result.game_over:
+                if result.counts_towards_stats:
+                    UserStats.record_game(user_id, result.game_date_idx, num_attempts, game_won)
+                    DailyStats.record_game(result.game_date_idx, num_attempts, game_won)
+                result.finished_at = int(time.time())
+
             result.num_attempts = num_attempts
-            result.tiles = json.dumps(tiles)
-            result.tile_classes = json.dumps(tile_classes)
+            result.guesses = guesses
+            result.states = states
             result.game_over = game_over
             result.game_lost = game_lost
             result.game_won = game_won
@@ -204,18 +730,535 @@ class Result(Base):
         return result
 
     @classmethod
-    def create_result(cls, user_id):
-        """Create a new result. Used after first attempt is submitted"""
-        result = cls(user_id)
-        result.tiles = json.dumps(result.tiles)
-        result.tile_classes = json.dumps(result.tile_classes)
-        db_session.add(result)
+    def add_guess(cls, user_id, guess, answer, game_date_idx=None, language_key=None):
+        """Score a guess against the answer and add it to today's board, or an archived one.
+        Returns (result, states), or (result, None) if the game is already over"""
+        result = cls.get_result(user_id, game_date_idx, language_key)
+        if result.game_over or result.num_attempts >= cls.MAX_ATTEMPTS:
+            return result, None
+
+        scorer = get_scorer(answer)
+        states = scorer.score(guess)
+        row = result.num_attempts
+
+        num_attempts = row + 1
+        game_won = scorer.is_win(states)
+        game_lost = not game_won and num_attempts >= cls.MAX_ATTEMPTS
+        result = cls.update_result(
+            user_id,
+            num_attempts,
+            result.guesses + guess,
+            pack_board(result.state_rows + [states], result.word_length),
+            game_won or game_lost,
+            game_lost,
+            game_won,
+            result=result,
+        )
+        return result, states
+
+    @classmethod
+    def append_guess(cls, user_id, game_date_idx, row, guess, answer, key, language_key=None):
+        """Add a guess as row `row` of a board with a single conditional UPDATE.
+
+        The board is read first, and the UPDATE only matches if it still has the
+        same `row` guesses and the game isn't over, so a guess saved in between
+        by another request is never overwritten. If the board has moved on and
+        its last guess has the same idempotency key, the request is a retry of a
+        guess that was already saved and gets the same answer again.
+        Returns (result, states), or (result, None) if the guess doesn't follow on
+        from the board (already over, or another tab got there first).
+        The guess has to be as long as the game's words"""
+        result = cls.get_result(user_id, game_date_idx, language_key)
+        scorer = get_scorer(answer)
+        states = scorer.score(guess)
+        num_attempts = row + 1
+        if result.num_attempts != row or result.game_over:
+            if key and result.last_guess_key == key and result.num_attempts == num_attempts:
+                return result, result.state_rows[-1]
+            return result, None
+
+        game_won = scorer.is_win(states)
+        game_lost = not game_won and num_attempts >= cls.MAX_ATTEMPTS
+        game_over = game_won or game_lost
+        values = {
+            "num_attempts": num_attempts,
+            "guesses": result.guesses + guess,
+            "states": pack_board(result.state_rows + [states], len(guess)),
+            "game_over": game_over,
+            "game_lost": game_lost,
+            "game_won": game_won,
+            "last_guess_key": key,
+        }
+        if game_over:
+            values["finished_at"] = int(time.time())
+        stmt = (
+            update(cls)
+            .where(
+                cls.user_id == user_id,
+                cls.game_date_idx == game_date_idx,
+                *cls.in_game(language_key),
+                cls.num_attempts == row,
+                cls.game_over.is_(False),
+                cls.guesses == result.guesses,
+            )
+            .values(**values)
+            .returning(cls)
+        )
+
+        result = db_session.scalars(stmt, execution_options={"populate_existing": True}).one_or_none()
+        if result is None:
+            # another request added a guess since the board was read
+            db_session.expire_all()
+            result = cls.get_result(user_id, game_date_idx, language_key)
+            if key and result.last_guess_key == key and result.num_attempts == num_attempts:
+                return result, result.state_rows[-1]
+            return result, None
+
+        # stats only count the default game played on its own day, see update_result()
+        if game_over and result.counts_towards_stats:
+            UserStats.record_game(user_id, game_date_idx, num_attempts, game_won)
+            DailyStats.record_game(game_date_idx, num_attempts, game_won)
+        db_session.commit()
+        return result, states
+
+    @classmethod
+    def queue_guess(cls, user_id, game_date_idx, row, guess, answer, key, language_key=None, durable=False):
+        """append_guess() through result_writes, for WRITE_QUEUE_ENABLED.
+
+        The board is worked out here from the saved one (or the one this worker
+        queued) and handed to the writer thread with the row, guesses and game state
+        it was worked out from, which the writer's UPDATE checks again. With `durable`, and
+        always for a guess that ends the game, this waits for the commit.
+        Returns the same as append_guess(). Raises WriteQueueFull if the queue stays
+        full, or the commit takes longer than WRITE_QUEUE_TIMEOUT"""
+        result = cls.get_result(user_id, game_date_idx, language_key)
+        scorer = get_scorer(answer)
+        states = scorer.score(guess)
+        num_attempts = row + 1
+        if result.num_attempts != row or result.game_over:
+            if key and result.last_guess_key == key and result.num_attempts == num_attempts:
+                return result, result.state_rows[-1]
+            return result, None
+
+        game_won = scorer.is_win(states)
+        game_lost = not game_won and num_attempts >= cls.MAX_ATTEMPTS
+        game_over = game_won or game_lost
+        values = {
+            "num_attempts": num_attempts,
+            "guesses": result.guesses + guess,
+            "states": pack_board(result.state_rows + [states], len(guess)),
+            "game_over": game_over,
+            "game_lost": game_lost,
+            "game_won": game_won,
+            "last_guess_key": key,
+        }
+        after = None
+        if game_over:
+            values["finished_at"] = int(time.time())
+            # stats only count the default game played on its own day, see update_result()
+            if result.counts_towards_stats:
+                after = partial(cls.record_stats, user_id, game_date_idx, num_attempts, game_won)
+
+        # the guesses too: another worker's guess to the same row must not be overwritten
+        conditions = {"num_attempts": row, "guesses": result.guesses, "game_over": False}
+        write = result_writes.submit(result.board_key, conditions, values, after)
+        if write is None:
+            # another request in this worker added a guess first
+            return cls.get_result(user_id, game_date_idx, language_key), None
+        if durable or game_over:
+            saved = write.wait(result_writes.timeout)
+            if saved is None:
+                raise WriteQueueFull("timed out waiting for the guess to be saved")
+            if not saved:
+                # another worker changed the board first, or saving it failed
+                db_session.expire_all()
+                return cls.get_result(user_id, game_date_idx, language_key), None
+        return result.with_values(values), states
+
+    @staticmethod
+    def record_stats(user_id, game_date_idx, num_attempts, game_won):
+        """Add a finished game of the default game to the player's and the day's stats"""
+        UserStats.record_game(user_id, game_date_idx, num_attempts, game_won)
+        DailyStats.record_game(game_date_idx, num_attempts, game_won)
+
+    @classmethod
+    def save_queued(cls, writes):
+        """Save a batch of result_writes' writes in one transaction, from its writer thread.
+
+        Each write and its `after` callables get a savepoint of their own, so one
+        that fails is marked failed and rolled back without the rest of the batch"""
+        try:
+            if db_session.get_bind().dialect.name == "sqlite":
+                # pysqlite only starts a transaction before an INSERT/UPDATE/DELETE, so the
+                # first SAVEPOINT would start one of its own and its RELEASE commit it
+                db_session.execute(text("BEGIN IMMEDIATE"))
+            for write in writes:
+                user_id, game_date_idx, language_code, word_length = write.key
+                stmt = (
+                    update(cls)
+                    .where(
+                        cls.user_id == user_id,
+                        cls.game_date_idx == game_date_idx,
+                        cls.language_code == language_code,
+                        cls.word_length == word_length,
+                        *(getattr(cls, column) == value for column, value in write.conditions.items()),
+                    )
+                    .values(**write.values)
+                    .execution_options(synchronize_session=False)
+                )
+                try:
+                    with db_session.begin_nested():
+                        saved = db_session.execute(stmt).rowcount == 1
+                        if saved:
+                            for after in write.after:
+                                after()
+                except Exception:
+                    logger.exception("Saving the queued write to %r failed", write.key)
+                    write.saved = False
+                    write.failed = True
+                else:
+                    write.saved = saved
+            db_session.commit()
+        except Exception:
+            db_session.rollback()
+            raise
+        finally:
+            db_session.remove()
+
+    @classmethod
+    def rescore_day(cls, game_date_idx, answer, fix=False, language_key=None):
+        """Re-score every stored board of a game for a day against the answer.
+        Returns a summary of the boards whose colors or outcome don't match.
+        With fix=True those boards are corrected in one batched update."""
+        rows = db_session.execute(
+            select(cls.result_id, cls.num_attempts, cls.guesses, cls.states, cls.game_lost, cls.game_won)
+            .where(cls.game_date_idx == game_date_idx, *cls.in_game(language_key))
+        )
+
+        width = len(answer)
+        scored = {}  # most boards share guesses, so each one is only scored once
+        checked = 0
+        changes = []
+        for row in rows:
+            checked += 1
+            guesses = [row.guesses[i:i + width] for i in range(0, len(row.guesses), width)]
+            states, game_won = score_board(guesses, answer, scored)
+            packed = pack_board(states, width)
+            game_lost = not game_won and row.num_attempts >= cls.MAX_ATTEMPTS
+
+            if (packed, game_won, game_lost) != (row.states, row.game_won, row.game_lost):
+                changes.append({
+                    "result_id": row.result_id,
+                    "states": packed,
+                    "game_over": game_won or game_lost,
+                    "game_lost": game_lost,
+                    "game_won": game_won,
+                })
+
+        if fix and changes:
+            db_session.execute(update(cls), changes)
+            db_session.commit()
+
+        return {
+            "game_date_idx": game_date_idx,
+            "checked": checked,
+            "mismatched": len(changes),
+            "fixed": fix and bool(changes),
+            "result_ids": [change["result_id"] for change in changes],
+        }
+
+    @classmethod
+    def create_result(cls, user_id, game_date_idx=None, language_key=None):
+        """Create a new result, or return the existing one if another request created it first.
+        A single INSERT ... ON CONFLICT ... RETURNING, so concurrent requests can't make duplicates"""
+        if game_date_idx is None:
+            game_date_idx = get_todays_idx()
+        language_code, word_length = language_key or language_registry.default_key
+        insert = dialect_insert(cls)
+        stmt = (
+            insert.values(
+                user_id=user_id,
+                game_date_idx=game_date_idx,
+                language_code=language_code,
+                word_length=word_length,
+            )
+            # a no-op update, so RETURNING also hands back a row that already existed
+            .on_conflict_do_update(
+                index_elements=[cls.user_id, cls.game_date_idx, cls.language_code, cls.word_length],
+                set_={"user_id": insert.excluded.user_id},
+            )
+            .returning(cls)
+        )
+        result = db_session.scalars(stmt, execution_options={"populate_existing": True}).one()
         db_session.commit()
         return result
 
     @classmethod
-    def get_user_results(cls, user_id):
-        """Get all of the results for a user"""
-        results =  db_session.query(cls).filter(cls.user_id == user_id).all()
+    def get_user_results(cls, user_id, first_idx=None, last_idx=None, language_key=None):
+        """Get all of a user's results for a game, or those between two game indexes (inclusive)"""
+        query = db_session.query(cls).filter(cls.user_id == user_id, *cls.in_game(language_key))
+        if first_idx is not None:
+            query = query.filter(cls.game_date_idx >= first_idx)
+        if last_idx is not None:
+            query = query.filter(cls.game_date_idx <= last_idx)
+        results = query.all()
 
         return results
+
+
+# guesses saved by a writer thread when WRITE_QUEUE_ENABLED, see write_queue.py
+result_writes = WriteQueue(
+    Result.save_queued,
+    max_size=config.WRITE_QUEUE_SIZE,
+    interval=config.WRITE_QUEUE_INTERVAL_MS / 1000,
+    max_batch=config.WRITE_QUEUE_MAX_BATCH,
+    timeout=config.WRITE_QUEUE_TIMEOUT,
+)
+
+
+class GameTotals:
+    '''Columns counting finished games, shared by UserStats and DailyStats'''
+    wins = Column(Integer, default=0, nullable=False)
+    losses = Column(Integer, default=0, nullable=False)
+    total_attempts = Column(Integer, default=0, nullable=False)
+    # number of games won in 1, 2, ... 6 attempts
+    won_in_1 = Column(Integer, default=0, nullable=False)
+    won_in_2 = Column(Integer, default=0, nullable=False)
+    won_in_3 = Column(Integer, default=0, nullable=False)
+    won_in_4 = Column(Integer, default=0, nullable=False)
+    won_in_5 = Column(Integer, default=0, nullable=False)
+    won_in_6 = Column(Integer, default=0, nullable=False)
+
+    @property
+    def guess_distribution(self):
+        """Games won in 1, 2, ... MAX_ATTEMPTS attempts"""
+        return [getattr(self, f"won_in_{attempts}") for attempts in range(1, Result.MAX_ATTEMPTS + 1)]
+
+    def totals_dict(self):
+        """Win rate, average attempts and the guess distribution"""
+        games = self.wins + self.losses
+        return {
+            "wins": self.wins,
+            "losses": self.losses,
+            "games": games,
+            "total_attempts": self.total_attempts,
+            "avg_attempts": self.total_attempts / games if games else 0,
+            "win_percentage": self.wins / games * 100 if games else 0,
+            "guess_distribution": self.guess_distribution,
+        }
+
+
+class UserStats(GameTotals, Base):
+    '''Running totals of a user's finished games.
+
+    Result.update_result() updates the row whenever a game ends, so reading
+    stats never has to look at the results table.'''
+    __tablename__ = 'user_stats'
+    user_id = Column(String(50), ForeignKey("users.user_id", ondelete="CASCADE"), primary_key=True)
+    current_streak = Column(Integer, default=0, nullable=False)
+    longest_streak = Column(Integer, default=0, nullable=False)
+    last_played_idx = Column(Integer)
+    last_won_idx = Column(Integer)
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.wins = 0
+        self.losses = 0
+        self.total_attempts = 0
+        for attempts in range(1, Result.MAX_ATTEMPTS + 1):
+            setattr(self, f"won_in_{attempts}", 0)
+        self.current_streak = 0
+        self.longest_streak = 0
+
+    def __repr__(self):
+        return f'<UserStats {self.user_id!r}>'
+
+    def add_game(self, game_date_idx, num_attempts, game_won):
+        """Count a finished game. Streaks follow game_date_idx, so a skipped day ends them"""
+        self.total_attempts += num_attempts
+        if game_won:
+            self.wins += 1
+            if 1 <= num_attempts <= Result.MAX_ATTEMPTS:
+                column = f"won_in_{num_attempts}"
+                setattr(self, column, getattr(self, column) + 1)
+            if self.last_won_idx is not None and self.last_won_idx == game_date_idx - 1:
+                self.current_streak += 1
+            else:
+                self.current_streak = 1
+            self.longest_streak = max(self.longest_streak, self.current_streak)
+            self.last_won_idx = game_date_idx
+        else:
+            self.losses += 1
+            self.current_streak = 0
+        if self.last_played_idx is None or game_date_idx > self.last_played_idx:
+            self.last_played_idx = game_date_idx
+
+    def to_dict(self, todays_idx=None):
+        """Turns UserStats to the dictionary /get-user-stats returns"""
+        if todays_idx is None:
+            todays_idx = get_todays_idx()
+        current_streak = self.current_streak
+        # the streak is over if neither today's nor yesterday's game was won
+        if self.last_won_idx is None or self.last_won_idx < todays_idx - 1:
+            current_streak = 0
+        return {
+            **self.totals_dict(),
+            "longest_streak": self.longest_streak,
+            "current_streak": current_streak,
+        }
+
+    @classmethod
+    def get_stats(cls, user_id):
+        """Stats for a user, or empty stats if they haven't finished a game"""
+        return db_session.get(cls, user_id) or cls(user_id)
+
+    @classmethod
+    def record_game(cls, user_id, game_date_idx, num_attempts, game_won):
+        """Add a finished game to the user's stats. Committed together with the result"""
+        stats = db_session.get(cls, user_id)
+        if stats is None:
+            stats = cls(user_id)
+            db_session.add(stats)
+        stats.add_game(game_date_idx, num_attempts, game_won)
+        return stats
+
+    @classmethod
+    def counted_games(cls):
+        """SELECT of the finished games that count towards stats, as (user_id,
+        game_date_idx, num_attempts, game_won) rows in the order add_game() takes them"""
+        return (
+            select(Result.user_id, Result.game_date_idx, Result.num_attempts, Result.game_won)
+            .where(Result.game_over.is_(True), *Result.in_game(), Result.finished_on_its_day())
+            .order_by(Result.user_id, Result.game_date_idx)
+        )
+
+    @classmethod
+    def from_games(cls, rows):
+        """UserStats of each user in rows from counted_games()"""
+        stats = None
+        for row in rows:
+            if stats is None or stats.user_id != row.user_id:
+                if stats is not None:
+                    yield stats
+                stats = cls(row.user_id)
+            stats.add_game(row.game_date_idx, row.num_attempts, row.game_won)
+        if stats is not None:
+            yield stats
+
+    def column_values(self):
+        """The row as a dict, for inserting it outside the ORM"""
+        return {column.name: getattr(self, column.name) for column in self.__table__.columns}
+
+    @classmethod
+    def backfill(cls, batch_size=1000):
+        """Rebuild every user's stats from the results table. Returns the number of users"""
+        rows = db_session.execute(cls.counted_games().execution_options(yield_per=batch_size))
+
+        db_session.query(cls).delete()
+        n_users = 0
+        for stats in cls.from_games(rows):
+            db_session.add(stats)
+            n_users += 1
+        db_session.commit()
+        return n_users
+
+
+class DailyStats(GameTotals, Base):
+    '''Totals of every player's finished games for one day.
+
+    Kept up to date by Result.update_result() with one upsert per finished game,
+    so /daily-stats and /leaderboard never aggregate the results table.'''
+    __tablename__ = 'daily_stats'
+    game_date_idx = Column(Integer, primary_key=True, autoincrement=False)
+
+    COUNTERS = ("wins", "losses", "total_attempts") + tuple(
+        f"won_in_{attempts}" for attempts in range(1, Result.MAX_ATTEMPTS + 1)
+    )
+
+    def __init__(self, game_date_idx):
+        self.game_date_idx = game_date_idx
+        for counter in self.COUNTERS:
+            setattr(self, counter, 0)
+
+    def __repr__(self):
+        return f'<DailyStats {self.game_date_idx!r}>'
+
+    def to_dict(self):
+        """Turns DailyStats to the dictionary /daily-stats returns"""
+        return {"game_date_idx": self.game_date_idx, **self.totals_dict()}
+
+    @classmethod
+    def get_stats(cls, game_date_idx):
+        """Stats for a day, or empty stats if nobody has finished that game"""
+        return db_session.get(cls, game_date_idx) or cls(game_date_idx)
+
+    @classmethod
+    def record_game(cls, game_date_idx, num_attempts, game_won):
+        """Add a finished game to the day's totals. Committed together with the result.
+        Every finished game touches the same row, so this is a single atomic upsert
+        instead of a read-modify-write that concurrent workers could interleave"""
+        values = {
+            "wins": int(game_won),
+            "losses": int(not game_won),
+            "total_attempts": num_attempts,
+        }
+        for attempts in range(1, Result.MAX_ATTEMPTS + 1):
+            values[f"won_in_{attempts}"] = int(game_won and num_attempts == attempts)
+
+        insert_stmt = dialect_insert(cls)
+        stmt = insert_stmt.values(game_date_idx=game_date_idx, **values).on_conflict_do_update(
+            index_elements=[cls.game_date_idx],
+            set_={
+                counter: getattr(cls, counter) + getattr(insert_stmt.excluded, counter)
+                for counter, value in values.items() if value
+            },
+        )
+        db_session.execute(stmt)
+
+    @classmethod
+    def fastest_solvers(cls, game_date_idx, limit):
+        """Players who won a day's game in the fewest attempts, earliest first.
+        Archived games finished on a later day don't count"""
+        rows = db_session.execute(
+            select(User.name, Result.num_attempts, Result.finished_at)
+            .join(User, User.user_id == Result.user_id)
+            .where(
+                Result.game_date_idx == game_date_idx,
+                *Result.in_game(),
+                Result.game_won.is_(True),
+                or_(Result.finished_at.is_(None), Result.finished_at < get_idx_end_time(game_date_idx)),
+            )
+            # games from before finished_at was saved go after the timed ones, on any database
+            .order_by(Result.num_attempts, Result.finished_at.is_(None), Result.finished_at, Result.result_id)
+            .limit(limit)
+        )
+        return [
+            {"name": row.name, "num_attempts": row.num_attempts, "finished_at": row.finished_at}
+            for row in rows
+        ]
+
+    @classmethod
+    def backfill(cls):
+        """Rebuild every day's totals from the results table. Returns the number of days"""
+        won = Result.game_won.is_(True)
+        columns = [
+            Result.game_date_idx,
+            func.sum(case((won, 1), else_=0)),
+            func.sum(case((won, 0), else_=1)),
+            func.sum(Result.num_attempts),
+        ]
+        for attempts in range(1, Result.MAX_ATTEMPTS + 1):
+            columns.append(func.sum(case((won & (Result.num_attempts == attempts), 1), else_=0)))
+        totals = (
+            select(*columns)
+            .where(Result.game_over.is_(True), *Result.in_game(), Result.finished_on_its_day())
+            .group_by(Result.game_date_idx)
+        )
+
+        db_session.query(cls).delete()
+        db_session.execute(
+            cls.__table__.insert().from_select(["game_date_idx", *cls.COUNTERS], totals)
+        )
+        n_days = db_session.query(cls).count()
+        db_session.commit()
+        return n_days
@@ -0,0 +1,68 @@
+'''In-process stand-in for Google's OpenID Connect endpoints.
+
+With OAUTH_STUB=True the shared HTTP session (utils.get_http_session) answers
+every request to STUB_BASE_URL from OAuthStubAdapter instead of the network, so
+the login flow can be exercised in tests without Google. Point a test client
+at /login/callback?code=anything to sign in as OAuthStubAdapter.userinfo.'''
+import json
+from urllib.parse import urlparse
+
+from requests.adapters import BaseAdapter
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+
+STUB_BASE_URL = "https://oauth.stub"
+
+DISCOVERY_DOCUMENT = {
+    "issuer": STUB_BASE_URL,
+    "authorization_endpoint": STUB_BASE_URL + "/authorize",
+    "token_endpoint": STUB_BASE_URL + "/token",
+    "userinfo_endpoint": STUB_BASE_URL + "/userinfo",
+}
+
+
+class OAuthStubAdapter(BaseAdapter):
+    '''requests transport adapter that plays the part of Google.
+
+    Tests can change `userinfo` to sign in as someone else and read
+    `requests` to see what the app sent.'''
+
+    def __init__(self, userinfo=None):
+        super().__init__()
+        self.userinfo = userinfo or {
+            "sub": "stub-user",
+            "email": "player@example.com",
+            "email_verified": True,
+            "given_name": "Player",
+        }
+        self.requests = []
+
+    def send(self, request, **kwargs):
+        self.requests.append(request)
+        path = urlparse(request.url).path
+        if path == "/.well-known/openid-configuration":
+            return self._response(request, 200, DISCOVERY_DOCUMENT, {"Cache-Control": "public, max-age=3600"})
+        if path == "/token" and request.method == "POST":
+            return self._response(request, 200, {
+                "access_token": "stub-access-token",
+                "token_type": "Bearer",
+                "expires_in": 3600,
+                "id_token": "stub-id-token",
+            })
+        if path == "/userinfo":
+            return self._response(request, 200, self.userinfo)
+        return self._response(request, 404, {"error": "not_found"})
+
+    def close(self):
+        pass
+
+    @staticmethod
+    def _response(request, status, body, headers=None):
+        response = Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict({"Content-Type": "application/json", **(headers or {})})
+        response._content = json.dumps(body).encode("utf-8")
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        return response
@@ -0,0 +1,130 @@
+'''Scores guesses against the daily word. The server is the only place tiles get colored'''
+from collections import Counter
+from functools import lru_cache
+
+# Tile states. The numbers are what gets stored, the names match the CSS classes in style.css
+EMPTY = 0
+ABSENT = 1
+PRESENT = 2
+CORRECT = 3
+
+STATE_NAMES = {
+    EMPTY: "",
+    ABSENT: "incorrect",
+    PRESENT: "semicorrect",
+    CORRECT: "correct",
+}
+
+
+class AnswerScorer:
+    '''Scores guesses against one answer.
+
+    The answer's letter counts are worked out once, so each guess only costs
+    two passes over its letters.'''
+
+    def __init__(self, answer):
+        self.answer = answer
+        self.letter_counts = Counter(answer)
+
+    def score(self, guess):
+        '''Return a tuple of tile states for a guess.
+
+        Same rules as the original updateColors() in game.js: letters in the
+        right spot are CORRECT first, then the remaining copies of each letter
+        are handed out left to right as PRESENT, and anything left is ABSENT.'''
+        answer = self.answer
+        remaining = self.letter_counts.copy()
+        states = [ABSENT] * len(guess)
+
+        for i, char in enumerate(guess):
+            if i < len(answer) and char == answer[i]:
+                states[i] = CORRECT
+                remaining[char] -= 1
+
+        for i, char in enumerate(guess):
+            if states[i] != CORRECT and remaining[char] > 0:
+                states[i] = PRESENT
+                remaining[char] -= 1
+
+        return tuple(states)
+
+    def is_win(self, states):
+        '''Whether a scored guess is the answer'''
+        return len(states) == len(self.answer) and all(state == CORRECT for state in states)
+
+
+@lru_cache(maxsize=64)
+def get_scorer(answer):
+    '''Shared AnswerScorer per answer, so the letter counts are only computed once per day'''
+    return AnswerScorer(answer)
+
+
+def score_guess(guess, answer):
+    '''Tile states for a guess against an answer'''
+    return get_scorer(answer).score(guess)
+
+
+def score_board(guesses, answer, scored=None):
+    '''Score a list of guesses. Returns (rows of states, game_won).
+
+    Pass the same dict as `scored` when scoring many boards for one answer
+    and every distinct guess is only scored once.'''
+    scorer = get_scorer(answer)
+    if scored is None:
+        scored = {}
+    rows = []
+    for guess in guesses:
+        states = scored.get(guess)
+        if states is None:
+            states = scored[guess] = scorer.score(guess)
+        rows.append(states)
+    game_won = bool(rows) and scorer.is_win(rows[-1])
+    return rows, game_won
+
+
+# Boards are stored as bytes with 2 bits per tile, little endian. Tile j of row i
+# is at bit (i * width + j) * 2, so 6 rows of 12 letters take 18 bytes
+BITS_PER_STATE = 2
+STATE_MASK = 2 ** BITS_PER_STATE - 1
+
+
+def packed_size(n_rows, width):
+    '''Bytes a packed board of n_rows rows takes'''
+    return (n_rows * width * BITS_PER_STATE + 7) // 8
+
+
+def pack_board(rows, width):
+    '''Pack rows of tile states into as few bytes as they fit in'''
+    packed = 0
+    for i, states in enumerate(rows):
+        for j, state in enumerate(states):
+            packed |= state << ((i * width + j) * BITS_PER_STATE)
+    return packed.to_bytes(packed_size(len(rows), width), "little")
+
+
+def unpack_board(packed, n_rows, width):
+    '''Turn a packed board back into n_rows tuples of tile states'''
+    packed = int.from_bytes(packed, "little")
+    rows = []
+    for i in range(n_rows):
+        row = []
+        for j in range(width):
+            row.append((packed >> ((i * width + j) * BITS_PER_STATE)) & STATE_MASK)
+        rows.append(tuple(row))
+    return rows
+
+
+def encode_states(states):
+    '''A row of tile states as a string with one digit per tile, e.g. "31002"'''
+    return "".join(str(state) for state in states)
+
+
+def state_from_class(css_class):
+    '''Tile state from the CSS classes the old JSON boards stored'''
+    if "semicorrect" in css_class:
+        return PRESENT
+    if "incorrect" in css_class:
+        return ABSENT
+    if "correct" in css_class:
+        return CORRECT
+    return EMPTY
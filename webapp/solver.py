@@ -0,0 +1,272 @@
+'''Feedback patterns for every guess/answer pair, and an entropy solver built on them.
+
+The solver picks the guess that is expected to tell the most about which word
+is the answer, which is what /hint suggests, and how many guesses it needs
+for a word is that word's difficulty.
+
+Every guess is scored against every possible answer once, with numpy, into a
+uint8 matrix that is saved to SOLVER_CACHE_DIR as a .npy file. Later processes
+memory-map that file instead of building it again, so loading takes
+milliseconds and gunicorn workers share the pages. numpy is optional: without
+it get_solver() returns None and hints are turned off.'''
+import hashlib
+import os
+import tempfile
+import threading
+import time
+import weakref
+
+try:
+    import numpy as np  # optional, only used if installed
+except ImportError:
+    np = None
+
+import config
+from models import get_language
+from scoring import ABSENT, score_guess
+from utils import logger
+
+# A pattern is the guess's tile states as a base 3 number, one digit per tile:
+# 0 absent, 1 present, 2 correct (the scoring.py state - ABSENT). Tile j is digit j.
+# 3 ** 5 = 243 patterns, so a 5 letter word's pattern fits in a uint8
+PATTERN_LENGTH = 5
+N_PATTERNS = 3 ** PATTERN_LENGTH
+# Most guess x answer pairs scored at once while building the matrix
+BUILD_BATCH_CELLS = 1024 * 1024
+# Most guess x answer patterns counted at once by expected_information()
+COUNT_BATCH_CELLS = 4 * 1024 * 1024
+# Turns difficulty() plays before giving up on a word
+MAX_SOLVER_GUESSES = 10
+
+
+def pattern_of_states(states):
+    '''Pattern of a row of scoring.py tile states'''
+    pattern = 0
+    for j, state in enumerate(states):
+        pattern += (state - ABSENT) * 3 ** j
+    return pattern
+
+
+def build_pattern_matrix(guesses, answers, characters):
+    '''uint8 matrix of the pattern each guess gets against each answer.
+
+    Same rules as scoring.AnswerScorer, worked out tile by tile for a batch of
+    guesses against every answer at once: a tile is correct if the letters
+    match, and the k-th copy of a letter among the guess's other tiles is
+    present if the answer has more than k copies of it outside its correct tiles.'''
+    codes = {char: i for i, char in enumerate(characters)}
+    guess_letters = np.array([[codes[char] for char in word] for word in guesses], dtype=np.uint8)
+    answer_letters = np.array([[codes[char] for char in word] for word in answers], dtype=np.uint8)
+    length = guess_letters.shape[1]
+    # letter_counts[c, j]: copies of letter c in answer j
+    letter_counts = np.zeros((len(characters), len(answers)), dtype=np.uint8)
+    for k in range(length):
+        np.add.at(letter_counts, (answer_letters[:, k], np.arange(len(answers))), 1)
+
+    matrix = np.empty((len(guesses), len(answers)), dtype=np.uint8)
+    batch_size = max(1, BUILD_BATCH_CELLS // max(1, len(answers)))
+    for start in range(0, len(guesses), batch_size):
+        batch = guess_letters[start:start + batch_size]
+        # correct[k][g, a]: tile k of guess g matches answer a
+        correct = [batch[:, k, None] == answer_letters[None, :, k] for k in range(length)]
+        patterns = np.zeros((len(batch), len(answers)), dtype=np.uint8)
+        for i in range(length):
+            available = letter_counts[batch[:, i]]
+            handed_out = np.zeros_like(available)
+            for k in range(length):
+                same_letter = (batch[:, k] == batch[:, i])[:, None]
+                # copies on correct tiles aren't available to be present
+                available -= correct[k] & same_letter
+                if k < i:
+                    handed_out += ~correct[k] & same_letter
+            present = ~correct[i] & (handed_out < available)
+            patterns += (correct[i] * np.uint8(2) + present) * np.uint8(3 ** i)
+        matrix[start:start + batch_size] = patterns
+    return matrix
+
+
+class Solver:
+    '''Entropy solver over a pattern matrix.
+
+    `guesses` are all the words a guess may be, `answers` the words an answer
+    may be, and matrix[i, j] the pattern guesses[i] gets against answers[j].'''
+
+    def __init__(self, guesses, answers, matrix):
+        self.guesses = guesses
+        self.answers = answers
+        self.matrix = matrix
+        self.guess_idx = {word: i for i, word in enumerate(guesses)}
+        # row of each answer in the matrix, for preferring guesses that could win
+        self.answer_rows = np.array([self.guess_idx[word] for word in answers], dtype=np.intp)
+        self._first_guess = None
+        self._difficulty = {}
+        self.lock = threading.Lock()
+
+    def candidates(self, rows):
+        '''Indexes of the answers that fit every (guess, tile states) row so far'''
+        remaining = np.arange(len(self.answers))
+        for guess, states in rows:
+            pattern = pattern_of_states(states)
+            i = self.guess_idx.get(guess)
+            if i is not None:
+                remaining = remaining[self.matrix[i, remaining] == pattern]
+            else:
+                # easy mode lets guesses be any letters, those aren't in the matrix
+                remaining = np.array([
+                    j for j in remaining
+                    if pattern_of_states(score_guess(guess, self.answers[j])) == pattern
+                ], dtype=np.intp)
+        return remaining
+
+    def expected_information(self, candidates):
+        '''Bits each guess is expected to tell about which of the candidates is the answer'''
+        n_guesses = len(self.guesses)
+        bits = np.empty(n_guesses)
+        batch_size = max(1, COUNT_BATCH_CELLS // max(1, len(candidates)))
+        for start in range(0, n_guesses, batch_size):
+            patterns = self.matrix[start:start + batch_size][:, candidates].astype(np.intp)
+            # count each row's patterns in one bincount by giving every row its own range
+            patterns += np.arange(len(patterns))[:, None] * N_PATTERNS
+            counts = np.bincount(patterns.ravel(), minlength=len(patterns) * N_PATTERNS)
+            p = counts.reshape(len(patterns), N_PATTERNS) / len(candidates)
+            bits[start:start + batch_size] = -(p * np.log2(p, out=np.zeros_like(p), where=p > 0)).sum(axis=1)
+        return bits
+
+    def best_guess(self, candidates):
+        '''(guess, expected bits) that best splits the candidates'''
+        if len(candidates) <= 2:
+            # guessing one of them is as good as it gets
+            return self.answers[candidates[0]], float(len(candidates) - 1)
+        bits = self.expected_information(candidates)
+        # on a tie prefer a guess that could be the answer
+        score = bits.copy()
+        score[self.answer_rows[candidates]] += 1e-9
+        i = int(np.argmax(score))
+        return self.guesses[i], float(bits[i])
+
+    def first_guess(self):
+        '''best_guess() before anything is known, the same for everyone so worked out once'''
+        with self.lock:
+            if self._first_guess is None:
+                self._first_guess = self.best_guess(np.arange(len(self.answers)))
+            return self._first_guess
+
+    def hint(self, rows):
+        '''(best next guess, expected bits, number of answers left) for a board.
+        The guess is None if no answer fits the board'''
+        if not rows:
+            guess, bits = self.first_guess()
+            return guess, bits, len(self.answers)
+        candidates = self.candidates(rows)
+        if len(candidates) == 0:
+            return None, 0.0, 0
+        guess, bits = self.best_guess(candidates)
+        return guess, bits, len(candidates)
+
+    def difficulty(self, answer):
+        '''How hard a word is for the solver, or None if it isn't one of the answers.
+
+        "solver_guesses" is how many guesses the solver needs, and
+        "left_after_first_guess" how many answers still fit after its first one.'''
+        if answer not in self.guess_idx:
+            return None
+        cached = self._difficulty.get(answer)
+        if cached is not None:
+            return cached
+
+        rows = []
+        left_after_first_guess = None
+        guess, _ = self.first_guess()
+        for _ in range(MAX_SOLVER_GUESSES):
+            rows.append((guess, score_guess(guess, answer)))
+            if guess == answer:
+                break
+            candidates = self.candidates(rows)
+            if left_after_first_guess is None:
+                left_after_first_guess = len(candidates)
+            if len(candidates) == 0:
+                return None
+            guess, _ = self.best_guess(candidates)
+        else:
+            return None
+
+        difficulty = {
+            "solver_guesses": len(rows),
+            "left_after_first_guess": left_after_first_guess if left_after_first_guess is not None else 0,
+        }
+        self._difficulty[answer] = difficulty
+        return difficulty
+
+
+def _matrix_path(cache_dir, guesses, answers):
+    '''Cache file for a pair of word lists, named after their content'''
+    digest = hashlib.sha256()
+    digest.update("\n".join(guesses).encode("utf-8"))
+    digest.update(b"\0")
+    digest.update("\n".join(answers).encode("utf-8"))
+    return os.path.join(cache_dir, f"patterns-{digest.hexdigest()[:16]}.npy")
+
+
+def load_solver(language, cache_dir):
+    '''Solver for a Language's words, building and saving its pattern matrix if there isn't one.
+    None if the words aren't PATTERN_LENGTH letters long'''
+    if language.word_length != PATTERN_LENGTH:
+        return None
+    guesses = tuple(word for word in language.word_index if len(word) == PATTERN_LENGTH)
+    answers = tuple(sorted({word for word in language.word_list if word in language.word_index and len(word) == PATTERN_LENGTH}))
+    if not answers:
+        return None
+
+    path = _matrix_path(cache_dir, guesses, answers)
+    try:
+        matrix = np.load(path, mmap_mode="r")
+        if matrix.shape != (len(guesses), len(answers)) or matrix.dtype != np.uint8:
+            raise ValueError(f"expected a {len(guesses)}x{len(answers)} uint8 matrix")
+    except (OSError, ValueError) as e:
+        if not isinstance(e, FileNotFoundError):
+            logger.info("Rebuilding pattern matrix %s: %s", path, e)
+        started = time.perf_counter()
+        matrix = build_pattern_matrix(guesses, answers, language.characters)
+        os.makedirs(cache_dir, exist_ok=True)
+        # written next to the real name and renamed, so other workers never load half a file
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".npy.tmp")
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, matrix)
+        os.replace(tmp_path, path)
+        logger.info(
+            "Built the %dx%d pattern matrix in %.3fs",
+            len(guesses), len(answers), time.perf_counter() - started
+        )
+        matrix = np.load(path, mmap_mode="r")
+    return Solver(guesses, answers, matrix)
+
+
+# Solver (or None) of each Language. Weak keys, so a Language the registry drops or
+# reloads takes its solver with it
+_solvers = weakref.WeakKeyDictionary()
+_solver_lock = threading.Lock()
+
+
+def get_solver(language=None):
+    '''Solver for a Language's word lists (the default game's if None), loaded again when they change.
+    None if numpy isn't installed, HINTS_ENABLED is off or the words aren't 5 letters long'''
+    if np is None or not config.HINTS_ENABLED:
+        return None
+    if language is None:
+        language = get_language()
+    try:
+        return _solvers[language]
+    except KeyError:
+        pass
+    with _solver_lock:
+        if language not in _solvers:
+            _solvers[language] = load_solver(language, config.SOLVER_CACHE_DIR)
+        return _solvers[language]
+
+
+def get_difficulty(answer):
+    '''Solver difficulty of one of the default game's words (see Solver.difficulty), None if there's no solver'''
+    solver = get_solver()
+    if solver is None:
+        return None
+    return solver.difficulty(answer)
@@ -1,3 +1,30 @@
+// Set of valid words, filled from the cached word list file (words_url) if the server offers it.
+// Kept outside of Vue so it isn't made reactive.
+var local_words = null;
+
+// Tile state digits in a result's guess_states, numbered as in scoring.py
+const STATE_NAMES = ["", "incorrect", "semicorrect", "correct"];
+const EMPTY_TILE_CLASS = "border-2 border-neutral-300";
+
+function emptyBoard(value) {
+    // max_attempts rows of word_length tiles
+    return Array.from({length: max_attempts}, () => Array(word_length).fill(value));
+}
+
+// Query string naming the game, for the GET requests about it
+const LANGUAGE_QUERY = "language=" + encodeURIComponent(language_code) + "&word_length=" + word_length;
+
+// Times a guess is sent before giving up, see saveToDatabase()
+const GUESS_RETRIES = 3;
+
+function newGuessKey() {
+    // unique id for one guess, sent again when the request is retried
+    if (window.crypto && window.crypto.randomUUID) {
+        return window.crypto.randomUUID();
+    }
+    return Date.now().toString(36) + Math.random().toString(36).slice(2);
+}
+
 // Vue stuff below
 const app = Vue.createApp({
     delimiters: ['[[', ']]'],  // don't want to clash with Jinja (backend templating coming from flask)
@@ -6,13 +33,12 @@ const app = Vue.createApp({
             active_row: 0,
             active_cell: 0,
             full_word_inputted: false,
+            checking_word: false,  // true while the server is checking a submitted word
 
 
             // these variables come from Jinja
-            todays_word: todays_word,
+            todays_word: "",  // the server only reveals the word once the game is over
             todays_idx: todays_idx,
-            word_list: word_list,
-            word_list_supplement: word_list_supplement,
             characters: characters,
             config: config,
             
@@ -27,6 +53,8 @@ const app = Vue.createApp({
 
             // right_to_left: config.right_to_left == "true",  // this can probably just be set to false, because I don't see why anyone would default to right-to-left
             allow_any_word: false,
+            hard_mode: localStorage.getItem("hard_mode") === "true",
+            remaining: null,  // valid words that still fit the board, sent with every result
 
 
             showHelpModal: false,
@@ -79,6 +107,12 @@ const app = Vue.createApp({
             stats: {},
         }
     },
+    watch: {
+        hard_mode(value) {
+            // remembered for every game, like the NYT setting
+            localStorage.setItem("hard_mode", value);
+        },
+    },
     computed: {
         // computed properties
         key_classes: {
@@ -116,23 +150,12 @@ const app = Vue.createApp({
         // listen for any keypresses
         window.addEventListener('keydown', this.keyDown);
 
-        fetch('/get-game-result', {
-            method: 'GET',
-            headers: {
-                'Content-Type': 'application/json',
-            }
-        })
-        .then(response => response.json())
-        .then(data => {
-            console.log("Response from Flask", data);
-        })
-        .catch(error => {
-            console.error("Error:", error);
-        })
-
         // fetch stats
         this.loadStats();
 
+        // fetch the word list so guesses can be checked without asking the server
+        this.loadWordList();
+
         this.time_until_next_day = this.get_time_until_next_day();
     },
     mounted() {
@@ -160,9 +183,9 @@ const app = Vue.createApp({
             // if config.name_native is not set, use to config.language_code
             var text_to_share;
             if (!this.config.name_native) {
-                text_to_share = "Wordle (" + this.config.language_code + ") #" + this.todays_idx + " " + this.attempts + "/6" + "\n" + "www.wordle.global/" + this.config.language_code + "\n" + "\n" + this.emoji_board;
+                text_to_share = "Wordle (" + this.config.language_code + ") #" + this.todays_idx + " " + this.attempts + "/" + max_attempts + "\n" + "www.wordle.global/" + this.config.language_code + "\n" + "\n" + this.emoji_board;
             } else {
-                text_to_share = "Wordle " + this.config.name_native + " #" + this.today_idx + " " + this.attempts + "/6" + "\n" + "www.wordle.global/" + this.config.language_code + "\n" + "\n" + this.emoji_board; 
+                text_to_share = "Wordle " + this.config.name_native + " #" + this.today_idx + " " + this.attempts + "/" + max_attempts + "\n" + "www.wordle.global/" + this.config.language_code + "\n" + "\n" + this.emoji_board; 
             }
             document.querySelector('#copy_button').addEventListener('click', async event => {
                 if (navigator.share) {
@@ -220,64 +243,54 @@ const app = Vue.createApp({
         addChar(char) {
             this.tiles[this.active_row][this.active_cell] = char;
             this.tile_classes[this.active_row][this.active_cell] = "text-2xl tiny:text-4xl uppercase font-bold select-none border-2 border-neutral-500 pop";
-            this.active_cell = Math.min(this.active_cell + 1, 5);
-            if (this.active_cell == 5) {
+            this.active_cell = Math.min(this.active_cell + 1, word_length);
+            if (this.active_cell == word_length) {
                 this.full_word_inputted = true;
             }
         },
 
-        checkWord(word) {
+        async checkWord(word) {
             if (this.allow_any_word) {
                 return true;
-            } else if (word_list.indexOf(word) == -1 && word_list_supplement.indexOf(word) == -1) {
-                console.log(word + " is not in either word list and thus not valid");
-                return false;
-            } else {
-                console.log(word + " is in the word list and thus valid");
-                return true;
             }
-        },
-
-        updateColors() {
-            // NOTE: if a character appears only once in the final word, but multiple times in submitted word
-            // then we want to only color one. The hierarchy is correct first, then the semi-correct ones by position.
-            // COMMENTED THIS TO SEE IF IT FIXES AN ERROR I WAS HAVING: var todays_word = this.todays_word;
-            const base_class = "text-2xl tiny:text-4xl uppercase font-bold select-none text-whit";
-            var charcounts = {};
-
-            // count characters
-            for (let i = 0; i < todays_word.length; i++) {
-                var character = todays_word[i];
-                if (charcounts[character] == undefined) {
-                    charcounts[character] = 1;
+            if (local_words !== null) {
+                return local_words.has(word);
+            }
+            // the word list hasn't loaded (or isn't offered), so ask the server
+            try {
+                const response = await fetch('/check-word?word=' + encodeURIComponent(word) + "&" + LANGUAGE_QUERY, {
+                    method: 'GET',
+                    headers: {
+                        'Content-Type': 'application/json',
+                    }
+                });
+                const data = await response.json();
+                if (data.valid) {
+                    console.log(word + " is in the word list and thus valid");
                 } else {
-                    charcounts[character] += 1;
+                    console.log(word + " is not in either word list and thus not valid");
                 }
+                return data.valid;
+            } catch (error) {
+                console.error("Error:", error);
+                return false;
             }
+        },
 
-            // color correct characters
-            for (let i = 0; i < this.tiles[this.active_row].length; i++) {
-                var character = this.tiles[this.active_row][i];
-                if (character == todays_word[i]) {
-                    this.tile_classes[this.active_row][i] = "correct" + " " + base_class;
-                    this.key_classes[character] = "correct"
-                    charcounts[character] -= 1;
-                }
-            }
-            for (let i = 0; i < this.tiles[this.active_row].length; i++) {
-                var character = this.tiles[this.active_row][i];
-                if (todays_word.indexOf(character) != -1 && charcounts[character] > 0 && this.tile_classes[this.active_row][i].indexOf("correct") == -1) {
-                    // if the tile is not already colored
-                    this.tile_classes[this.active_row][i] = "semicorrect" + " " + base_class;
-                    if (this.key_classes[character] != "correct") {
-                        this.key_classes[character] = "semicorrect"
-                    }
-                    charcounts[character] -= 1;
-                } else if (this.tile_classes[this.active_row][i].indexOf("correct") == -1) {
-                    this.tile_classes[this.active_row][i] = "incorrect" + " " + base_class;
-                    if (this.key_classes[character] != "correct" && this.key_classes[character] != "semicorrect") {
-                        this.key_classes[character] = "incorrect"
-                    }
+        updateColors(row, states) {
+            // the server scores guesses (see scoring.py), this only paints its answer on the board and keyboard
+            // states are "correct", "semicorrect" or "incorrect" for each tile of the row
+            const base_class = "text-2xl tiny:text-4xl uppercase font-bold select-none text-white";
+            for (let i = 0; i < states.length; i++) {
+                var character = this.tiles[row][i];
+                var state = states[i];
+                this.tile_classes[row][i] = state + " " + base_class;
+                if (state == "correct") {
+                    this.key_classes[character] = "correct";
+                } else if (state == "semicorrect" && this.key_classes[character] != "correct") {
+                    this.key_classes[character] = "semicorrect";
+                } else if (state == "incorrect" && this.key_classes[character] != "correct" && this.key_classes[character] != "semicorrect") {
+                    this.key_classes[character] = "incorrect";
                 }
             }
         },
@@ -297,7 +310,7 @@ const app = Vue.createApp({
                 this.show_not_valid_notif = false;    
             }
 
-            if (this.game_over) {
+            if (this.game_over || this.checking_word) {
                 return;
             }
             // console.log('keyDown', this.active_cell, this.active_row, event.key);
@@ -306,26 +319,8 @@ const app = Vue.createApp({
                     this.showNotification("Please enter a full word");
                     return;
                 }
-                // if checkWord returns true, then go to next row
                 var word = this.tiles[this.active_row].join("").toLowerCase();
-                var word_is_valid = this.checkWord(word);
-                if (word_is_valid) {
-                    this.updateColors();
-                    this.active_row++;
-                    this.attempts++;
-                    this.active_cell = 0;
-                    this.full_word_inputted = false;
-                } else {
-                    this.showNotification("Word is not valid");
-                }
-
-                if (word === this.todays_word) {
-                    this.gameWon();
-                } else if (this.active_row == 6) {
-                    this.gameLost();
-                }
-
-                this.saveToDatabase();
+                this.submitWord(word);
 
             } else if ((key === "Backspace" || key === "Delete" || key === "⌫") && this.active_cell > 0) {
                 // set current active cell to empty and move backwards one
@@ -346,6 +341,37 @@ const app = Vue.createApp({
             this.showTiles();
             //this.saveToLocalStorage();
         },
+        async submitWord(word) {
+            // if checkWord returns true, send the guess to be scored, then go to next row
+            this.checking_word = true;
+            var word_is_valid = await this.checkWord(word);
+            if (!word_is_valid) {
+                this.checking_word = false;
+                this.showNotification("Word is not valid");
+                return;
+            }
+
+            var data = await this.saveToDatabase(word);
+            this.checking_word = false;
+            if (data === null) {
+                return;
+            }
+
+            this.updateColors(this.active_row, data.states);
+            this.active_row++;
+            this.attempts = data.num_attempts;
+            this.remaining = data.remaining;
+            this.active_cell = 0;
+            this.full_word_inputted = false;
+
+            if (data.game_won) {
+                this.gameWon(data.answer);
+            } else if (data.game_lost) {
+                this.gameLost(data.answer);
+            }
+
+            this.showTiles();
+        },
         showTiles() {
             // if left to right, then reverse the tiles visuals. else copy normally.
             if (!this.right_to_left) {
@@ -360,15 +386,14 @@ const app = Vue.createApp({
                 }
             }
         },
-        async gameWon() {
+        async gameWon(answer) {
             // set game_over to true with time delay
+            this.todays_word = answer;
             this.game_over = true;
             this.game_won = true;
             this.emoji_board = this.getEmojiBoard();
             this.showNotification(this.todays_word.toUpperCase(), 12);
 
-            await this.saveToDatabase();
-
             // save a win to localStorage
             // const result = { "won": true, "attempts": this.attempts, "date": new Date() };
             // this.game_results[this.config.language_code].push(result);
@@ -383,12 +408,13 @@ const app = Vue.createApp({
             }, 400);
 
         },
-        gameLost() {
+        gameLost(answer) {
+            this.todays_word = answer;
             this.showNotification(this.todays_word.toUpperCase(), 12);
 
             this.game_over = true;
             this.game_won = false;
-            this.attempts = "6";
+            this.attempts = String(max_attempts);
             setTimeout(() => {
                 this.show_stats_modal = true;
             }, 400);
@@ -471,31 +497,54 @@ const app = Vue.createApp({
             };
             localStorage.setItem(page_name, JSON.stringify(data));
         },
-        async saveToDatabase() {
-            // save result to database
-            dataToSend = {
-                "attempts": this.attempts,
-                "tiles": this.tiles,
-                "tile_classes": this.tile_classes,
-                "game_over": this.game_over,
-                "game_lost": this.game_lost,
-                "game_won": this.game_won
+        async saveToDatabase(word) {
+            // send a guess to be scored and appended to the board. Returns the updated result, or null if it was rejected.
+            // Network errors are retried with the same key, so the server never adds the guess twice
+            const key = newGuessKey();
+            const body = JSON.stringify({
+                "guess": word,
+                "row": this.active_row,
+                "key": key,
+                "allow_any_word": this.allow_any_word,
+                "hard_mode": this.hard_mode,
+                "game_date_idx": game_date_idx,
+                "language": language_code,
+                "word_length": word_length,
+            });
+            for (let attempt = 0; attempt < GUESS_RETRIES; attempt++) {
+                try {
+                    const response = await fetch('/guess', {
+                        method: 'POST',
+                        headers: {
+                            'Content-Type': 'application/json',
+                        },
+                        body: body
+                    });
+                    if (response.status >= 500) {
+                        throw new Error("Server error " + response.status);
+                    }
+                    const data = await response.json();
+                    console.log("Response from Flask", data);
+                    if (response.status === 409) {
+                        // the board changed somewhere else (another tab), show the saved one
+                        this.showNotification(data.error);
+                        this.active_cell = 0;
+                        this.full_word_inputted = false;
+                        this.loadFromDatabase();
+                        return null;
+                    }
+                    if (!response.ok) {
+                        this.showNotification(data.error);
+                        return null;
+                    }
+                    return data;
+                } catch (error) {
+                    console.error("Error:", error);
+                    await new Promise(resolve => setTimeout(resolve, 500 * (attempt + 1)));
+                }
             }
-            
-            fetch('/update-game-result', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify(dataToSend)
-            })
-            .then(response => response.json())
-            .then(data => {
-                console.log("Response from Flask", data);
-            })
-            .catch(error => {
-                console.error("Error:", error);
-            })
+            this.showNotification("Could not save your guess, please try again");
+            return null;
         },
         loadFromLocalStorage() {
             // if local storage has data and the daily word is the same as the todays word, then load data
@@ -518,7 +567,7 @@ const app = Vue.createApp({
         },
         loadFromDatabase() {
             
-            fetch('/get-game-result', {
+            fetch('/get-game-result?game_date_idx=' + game_date_idx + "&" + LANGUAGE_QUERY, {
                 method: 'GET',
                 headers: {
                     'Content-Type': 'application/json',
@@ -528,17 +577,40 @@ const app = Vue.createApp({
             .then(data => {
                 console.log("Response from Flask", data);
                 this.attempts = data.num_attempts;
-                this.tiles = data.tiles;
-                this.tile_classes = data.tile_classes;
+                this.tiles = emptyBoard("");
+                this.tile_classes = emptyBoard(EMPTY_TILE_CLASS);
+                for (let i = 0; i < data.guesses.length; i++) {
+                    this.tiles[i] = data.guesses[i].split("");
+                    this.updateColors(i, data.guess_states[i].split("").map(state => STATE_NAMES[Number(state)]));
+                }
                 this.game_over = data.game_over;
                 this.game_lost = data.game_lost;
                 this.game_won = data.game_won;
                 this.active_row = data.num_attempts;
+                this.remaining = data.remaining;
+                if (this.game_over) {
+                    this.emoji_board = this.getEmojiBoard();
+                    this.todays_word = data.answer;
+                    this.showNotification(this.todays_word.toUpperCase(), 12);
+                }
+                this.showTiles();
             })
             .catch(error => {
                 console.error("Error:", error);
             })
         },
+        async loadWordList() {
+            // the file name is fingerprinted, so the browser keeps it cached until the words change
+            if (!words_url) {
+                return;
+            }
+            try {
+                const response = await fetch(words_url);
+                local_words = new Set(await response.json());
+            } catch (error) {
+                console.error("Error:", error);
+            }
+        },
         async loadStats() {
             this.stats = await this.calculateStats();
             console.log("Stats saved to this.stats", this.stats)
@@ -1,34 +1,105 @@
 import os
+import atexit
+import calendar
 import logging
+import logging.handlers
+import queue
 import datetime
 import json
 import random
-import requests
+import re
+import threading
+import time
+
+import config
 
 # data_dir = "data/"
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(BASE_DIR, "data")
 
 # For pulling Google info
-GOOGLE_DISCOVERY_URL = (
-    "https://accounts.google.com/.well-known/openid-configuration"
-)
-
-logging.basicConfig(
-    level=logging.DEBUG,
-    format="[%(asctime)s] %(levelname)s in %(module)s: %(message)s",
-    handlers=[
-        logging.FileHandler("app.log"),
-        logging.StreamHandler()
-    ]
-)
+GOOGLE_DISCOVERY_URL = config.GOOGLE_DISCOVERY_URL
+
+# (connect, read) timeouts in seconds for calls to Google
+HTTP_TIMEOUT = (3.05, 10)
+
+# How long to keep the discovery document when Google doesn't say, and the shortest we'll keep it
+PROVIDER_CFG_DEFAULT_TTL = 3600
+PROVIDER_CFG_MIN_TTL = 60
+
+# Seed of the word list shuffle. The daily word schedule was first built from this order
+WORD_SHUFFLE_SEED = 42
+
+# get_todays_idx() counts days from this date
+GAME_IDX_EPOCH = datetime.date(1970, 1, 1) + datetime.timedelta(days=18992 - 195)
+
+LOG_FORMAT = "[%(asctime)s] %(levelname)s in %(module)s: %(message)s"
 
 logger = logging.getLogger(__name__)
 
-def load_characters():
+_log_listener = None
+_log_settings = None
+
+
+def setup_logging(level="INFO", log_file=None, max_bytes=10 * 1024 * 1024, backup_count=5):
+    '''Send all logging through a queue so requests never wait on disk or console writes.
+
+    The root logger only gets a QueueHandler. A QueueListener thread formats the
+    records and writes them to stderr and, if log_file is set, a rotating file.
+    Safe to call more than once, later calls replace the earlier setup.'''
+    global _log_listener, _log_settings
+    if _log_listener is not None:
+        _log_listener.stop()
+    _log_settings = (level, log_file, max_bytes, backup_count)
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        handlers.append(logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+        ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+
+    _log_listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _log_listener.start()
+
+
+def restart_logging():
+    '''Set logging up again as the last setup_logging() call did.
+
+    A forked process (a gunicorn worker with preload_app) doesn't inherit the
+    parent's listener thread, so without this its log records would only queue up.'''
+    global _log_listener
+    if _log_settings is None:
+        return
+    # the parent's listener thread doesn't exist here, there is nothing to stop
+    _log_listener = None
+    setup_logging(*_log_settings)
+
+
+@atexit.register
+def _stop_logging():
+    '''Flush whatever is still queued when the process exits'''
+    if _log_listener is not None:
+        _log_listener.stop()
+
+
+def log_payloads():
+    '''Whether to log large values like whole word lists. Off unless LOG_PAYLOADS is set'''
+    return config.LOG_PAYLOADS and logger.isEnabledFor(logging.DEBUG)
+
+def load_characters(data_dir=DATA_DIR):
     '''Load Chars from Chars File.'''
     characters = set()
-    characters_file = os.path.join(DATA_DIR, "characters.txt")
+    characters_file = os.path.join(data_dir, "characters.txt")
     try:
         with open(characters_file, "r", encoding="utf-8") as f:
             characters = [line.strip() for line in f]
@@ -38,10 +109,10 @@ def load_characters():
         return ("Could not load characters file: %s", e)
 
 
-def load_words(characters):
+def load_words(characters, data_dir=DATA_DIR):
     '''loads the words and does some basic QA'''
     words = []
-    words_file = os.path.join(DATA_DIR, "words.txt")
+    words_file = os.path.join(data_dir, "words.txt")
     try:
         with open(words_file, "r", encoding="utf-8") as f:
             for line in f:
@@ -53,19 +124,23 @@ def load_words(characters):
     try:
         # QA
         words = [word.lower() for word in words if word.isalpha()]
-        logger.debug("Word list after isAlpha: %s", words)
+        if log_payloads():
+            logger.debug("Word list after isAlpha: %s", words)
         # remove words without correct characters
+        character_set = set(characters)
         words = [
             word
             for word in words
-            if all(char in characters for char in word)
+            if character_set.issuperset(word)
         ]
-        logger.debug("Word list after character check: %s", words)
+        if log_payloads():
+            logger.debug("Word list after character check: %s", words)
 
-        # we don't want words in order, so we shuffle
-        random.seed(42)
-        random.shuffle(words)
-        logger.debug("Word list after shuffle: %s", words)
+        # we don't want words in order, so we shuffle. A private RNG gives the same
+        # order the old random.seed(42) did, without anything else being able to move it
+        random.Random(WORD_SHUFFLE_SEED).shuffle(words)
+        if log_payloads():
+            logger.debug("Word list after shuffle: %s", words)
 
         return words
     except Exception as e:
@@ -85,16 +160,17 @@ def load_helper_text():
         return ("Could not open language config file: %s", e)
 
 
-def load_words_supplement(characters):
+def load_words_supplement(characters, data_dir=DATA_DIR):
     '''loads the supplemental words file if it exists'''
-    words_sup_file = os.path.join(DATA_DIR, "words_supplement.txt")
+    words_sup_file = os.path.join(data_dir, "words_supplement.txt")
     try:
         with open(words_sup_file, "r", encoding="utf-8") as f:
             supplemental_words = [line.strip() for line in f]
+        character_set = set(characters)
         supplemental_words = [
             word
             for word in supplemental_words
-            if all(char in characters for char in word)
+            if character_set.issuperset(word)
         ]
         return supplemental_words
     except FileNotFoundError as e:
@@ -102,9 +178,9 @@ def load_words_supplement(characters):
         return ("Could not open word supplement file: %s", e)
 
 
-def load_language_config():
+def load_language_config(data_dir=DATA_DIR):
     '''Load language configuration'''
-    lang_config_file = os.path.join(DATA_DIR, "language_config.json")
+    lang_config_file = os.path.join(data_dir, "language_config.json")
     try:
         with open(lang_config_file, "r", encoding="utf-8") as f:
             lang_config = json.load(f)
@@ -114,9 +190,9 @@ def load_language_config():
         return ("Could not open language config file: %s", e)
 
 
-def load_keyboard():
+def load_keyboard(data_dir=DATA_DIR):
     '''Load keyboard'''
-    keyboard_file = os.path.join(DATA_DIR, "keyboard.json")
+    keyboard_file = os.path.join(data_dir, "keyboard.json")
     try:
         with open(keyboard_file, "r", encoding="utf-8") as f:
             kb = json.load(f)
@@ -137,9 +213,135 @@ def get_todays_idx():
         return ("Unexceted error in get_todays_idx: %s", e)
 
 
+def get_date_of_idx(game_date_idx):
+    '''UTC date a game index belongs to'''
+    return GAME_IDX_EPOCH + datetime.timedelta(days=game_date_idx)
+
+
+def get_idx_of_date(date):
+    '''Game index of a UTC date'''
+    return (date - GAME_IDX_EPOCH).days
+
+
+def get_idx_end_time(game_date_idx):
+    '''Unix time the UTC day of a game index ends'''
+    return calendar.timegm(get_date_of_idx(game_date_idx + 1).timetuple())
+
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+def get_http_session():
+    '''Shared keep-alive session for calls to Google.
+
+    Reusing connections saves a TLS handshake per call. Connection errors are
+    retried for every request, other failures only for GETs, since the token
+    exchange can't safely be repeated.'''
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                # imported on first use, most requests never call Google
+                import requests
+                from requests.adapters import HTTPAdapter
+                from urllib3.util.retry import Retry
+
+                retry = Retry(
+                    total=3,
+                    connect=3,
+                    read=2,
+                    status=2,
+                    backoff_factor=0.2,
+                    status_forcelist=(500, 502, 503, 504),
+                    allowed_methods=frozenset(["GET"]),
+                )
+                session = requests.Session()
+                session.mount("https://", HTTPAdapter(max_retries=retry, pool_maxsize=10))
+                if config.OAUTH_STUB:
+                    # local stand-in for Google, see oauth_stub.py
+                    from oauth_stub import STUB_BASE_URL, OAuthStubAdapter
+                    session.mount(STUB_BASE_URL, OAuthStubAdapter())
+                _http_session = session
+    return _http_session
+
+
+def _cache_max_age(cache_control):
+    '''Seconds a response may be cached for according to its Cache-Control header'''
+    if not cache_control:
+        return PROVIDER_CFG_DEFAULT_TTL
+    if "no-store" in cache_control or "no-cache" in cache_control:
+        return PROVIDER_CFG_MIN_TTL
+    match = re.search(r"max-age=(\d+)", cache_control)
+    if not match:
+        return PROVIDER_CFG_DEFAULT_TTL
+    return max(int(match.group(1)), PROVIDER_CFG_MIN_TTL)
+
+
+class ProviderConfigCache:
+    '''Keeps the OpenID discovery document for as long as its Cache-Control allows.
+
+    Only the very first call waits on the network. After the document goes
+    stale the old copy is still served while a background thread fetches a new one.'''
+
+    def __init__(self, url):
+        self.url = url
+        self.value = None
+        self.expires_at = 0.0
+        self.refreshing = False
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stale_hits": 0, "refreshes": 0, "errors": 0}
+
+    def get(self):
+        '''Return the discovery document, fetching it if there isn't one yet'''
+        if self.value is not None:
+            if time.monotonic() < self.expires_at:
+                self.stats["hits"] += 1
+            else:
+                self.stats["stale_hits"] += 1
+                self._refresh_in_background()
+            return self.value
+
+        with self.lock:
+            if self.value is None:
+                self.stats["misses"] += 1
+                self._fetch()
+        return self.value
+
+    def _fetch(self):
+        response = get_http_session().get(self.url, timeout=HTTP_TIMEOUT)
+        response.raise_for_status()
+        self.value = response.json()
+        self.expires_at = time.monotonic() + _cache_max_age(response.headers.get("Cache-Control"))
+
+    def _refresh_in_background(self):
+        with self.lock:
+            if self.refreshing:
+                return
+            self.refreshing = True
+        threading.Thread(target=self._background_refresh, daemon=True).start()
+
+    def _background_refresh(self):
+        try:
+            self._fetch()
+            self.stats["refreshes"] += 1
+        except Exception as e:
+            self.stats["errors"] += 1
+            # keep serving the old copy and try again later
+            self.expires_at = time.monotonic() + PROVIDER_CFG_MIN_TTL
+            logger.info("Failed to refresh Google provider configuration: %s", e)
+        finally:
+            self.refreshing = False
+
+
+google_provider_cfg_cache = ProviderConfigCache(GOOGLE_DISCOVERY_URL)
+
+
 def get_google_provider_cfg():
     '''Get provider configuration from Google'''
     try:
-        return requests.get(GOOGLE_DISCOVERY_URL, timeout=30).json()
+        return google_provider_cfg_cache.get()
     except Exception as e:
+        google_provider_cfg_cache.stats["errors"] += 1
+        logger.info("Failed to retrieve Google provider configuration: %s", e)
         return ("Failed to retrieve Google provider configuration: %s", e)
@@ -0,0 +1,227 @@
+'''Compact index of the valid words, used to check guesses server-side.
+
+A WordIndex is built in memory from the word lists. `flask compile-words`
+saves one as a word file, which MappedWordIndex memory-maps read-only instead,
+so loading it is nearly free and every gunicorn worker shares the same pages.
+The word file also holds what the app would otherwise build from the words
+when they load: the ConstraintIndex bitsets and the word list asset.
+
+Word file layout, little-endian, every section padded to 8 bytes:
+    header      WORD_FILE_HEADER: magic, format version, bits per character,
+                record size, number of words, size of the characters section,
+                digest of the source files' contents, digest of their sizes and
+                mtimes, positions and bytes per bitset, sizes of the asset's
+                JSON, gzip and brotli bodies, the asset's ETag, and the CRC-32
+                of everything after the header
+    characters  the character set as UTF-8, one per line
+    records     the packed words, sorted, `record size` bytes each
+    bitsets     ConstraintIndex bitsets, bit i for the i-th record: one per
+                (position, character), then one per (character, copies)
+    asset       the WordListAsset's JSON, gzip and brotli bodies'''
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import zlib
+from array import array
+from bisect import bisect_left
+
+WORD_FILE_MAGIC = b"WORDIDX\0"
+WORD_FILE_VERSION = 2
+# padded to 96 bytes, a multiple of 8 like every section
+WORD_FILE_HEADER = struct.Struct("<8sHBBII16s16sBxxxIIII16sI4x")
+ASSET_SECTIONS = ("json", "gzip", "br")
+
+
+class WordIndex:
+    '''Sorted array of words packed into integers.
+
+    Every character gets a 5 bit code (its position in the character set + 1,
+    0 is never used) so a 5 letter word fits in 25 bits. The packed words are
+    kept in a sorted array('Q') and looked up with a binary search, which is a
+    lot smaller than a list or set of str objects.'''
+
+    BITS_PER_CHAR = 5
+    # 64 bit array items / 5 bits per character
+    MAX_WORD_LENGTH = 12
+
+    def __init__(self, characters, words):
+        if len(characters) >= 2 ** self.BITS_PER_CHAR:
+            raise ValueError(f"WordIndex supports at most {2 ** self.BITS_PER_CHAR - 1} characters")
+        self.characters = tuple(characters)
+        self.codes = {char: i + 1 for i, char in enumerate(self.characters)}
+
+        packed = set()
+        for word in words:
+            key = self.pack(word)
+            if key is not None:
+                packed.add(key)
+        self.keys = array("Q", sorted(packed))
+
+    def pack(self, word):
+        '''Pack a word into an integer. Returns None if it can't be in the index'''
+        if not word or len(word) > self.MAX_WORD_LENGTH:
+            return None
+        key = 0
+        for char in word:
+            code = self.codes.get(char)
+            if code is None:
+                return None
+            key = (key << self.BITS_PER_CHAR) | code
+        return key
+
+    def unpack(self, key):
+        '''Turn a packed integer back into a word'''
+        mask = 2 ** self.BITS_PER_CHAR - 1
+        chars = []
+        while key:
+            chars.append(self.characters[(key & mask) - 1])
+            key >>= self.BITS_PER_CHAR
+        return "".join(reversed(chars))
+
+    def __contains__(self, word):
+        key = self.pack(word)
+        if key is None:
+            return False
+        i = bisect_left(self.keys, key)
+        return i < len(self.keys) and self.keys[i] == key
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __iter__(self):
+        for key in self.keys:
+            yield self.unpack(key)
+
+
+class MappedWordIndex(WordIndex):
+    '''WordIndex read from a word file through a read-only mmap.
+
+    The records are looked up in place with the same binary search, and the
+    bitsets and asset bodies are read when asked for, so nothing but the header
+    is parsed. Raises ValueError if the file isn't a valid word file.'''
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._read()
+        except (ValueError, struct.error, UnicodeDecodeError) as e:
+            self.mmap.close()
+            raise ValueError(f"{path} isn't a usable word file: {e}") from e
+
+    def _read(self):
+        (
+            magic, version, bits_per_char, record_size, n_words, characters_size,
+            self.source_digest, self.source_stamp, self.n_positions, self.bitset_size,
+            json_size, gzip_size, brotli_size, asset_etag, crc,
+        ) = WORD_FILE_HEADER.unpack_from(self.mmap)
+        if magic != WORD_FILE_MAGIC:
+            raise ValueError("wrong magic number")
+        if version != WORD_FILE_VERSION or bits_per_char != self.BITS_PER_CHAR:
+            raise ValueError(f"format version {version} with {bits_per_char} bit characters")
+        if record_size not in (4, 8):
+            raise ValueError(f"records of {record_size} bytes")
+        # the records are cast to native integers in place, there is no copy to byteswap
+        if sys.byteorder != "little":
+            raise ValueError("word files are little-endian and this machine isn't")
+
+        header_size = WORD_FILE_HEADER.size
+        characters = self.mmap[header_size:header_size + characters_size]
+        n_characters = characters.count(b"\n") + 1 if characters else 0
+        start = header_size + _padded(characters_size)
+        end = start + n_words * record_size
+        self.bitsets_start = _padded(end)
+        offset = self.bitsets_start + 2 * self.n_positions * n_characters * self.bitset_size
+        self.asset_sections = {}
+        for name, size in zip(ASSET_SECTIONS, (json_size, gzip_size, brotli_size)):
+            self.asset_sections[name] = (offset, offset + size)
+            offset = _padded(offset + size)
+        if len(self.mmap) < offset:
+            raise ValueError("file is truncated")
+        # no memoryview is kept until the file checks out, mmap.close() refuses while one exists
+        with memoryview(self.mmap) as view:
+            if zlib.crc32(view[header_size:]) != crc:
+                raise ValueError("checksum mismatch")
+        self.characters = tuple(characters.decode("utf-8").split("\n")) if characters else ()
+        self.codes = {char: i + 1 for i, char in enumerate(self.characters)}
+        self.asset_etag = asset_etag.decode("ascii")
+        self.keys = memoryview(self.mmap)[start:end].cast("I" if record_size == 4 else "Q")
+
+    def position_bits(self, position, letter):
+        '''Bitset of the words with letter at position, see ConstraintIndex'''
+        code = self.codes.get(letter)
+        if code is None or not 0 <= position < self.n_positions:
+            return 0
+        return self._bitset(position * len(self.characters) + code - 1)
+
+    def copies_bits(self, letter, copies):
+        '''Bitset of the words with at least `copies` copies of letter, see ConstraintIndex'''
+        code = self.codes.get(letter)
+        if code is None or not 1 <= copies <= self.n_positions:
+            return 0
+        return self._bitset((len(self.characters) + code - 1) * self.n_positions + copies - 1)
+
+    def _bitset(self, i):
+        start = self.bitsets_start + i * self.bitset_size
+        return int.from_bytes(self.mmap[start:start + self.bitset_size], "little")
+
+    def asset_body(self, name):
+        '''One of the word list asset's bodies ("json", "gzip" or "br"), as bytes'''
+        start, end = self.asset_sections[name]
+        return self.mmap[start:end]
+
+
+def _padded(size):
+    '''size rounded up to a multiple of 8, so the records are aligned'''
+    return (size + 7) // 8 * 8
+
+
+def _pad(data):
+    return data.ljust(_padded(len(data)), b"\0")
+
+
+def write_word_file(path, index, constraint_index, asset, source_digest, source_stamp):
+    '''Save a WordIndex as a word file, with the ConstraintIndex and WordListAsset built
+    from its words. `source_digest` and `source_stamp` are 16 bytes each identifying
+    the word lists it was built from by content and by size and mtime. Written to a
+    temporary file and renamed, so a worker never maps half a file'''
+    max_key = index.keys[-1] if len(index.keys) else 0
+    record_size = 4 if max_key < 2 ** 32 else 8
+    characters = "\n".join(index.characters).encode("utf-8")
+    records = array("I" if record_size == 4 else "Q", index.keys)
+    if records.itemsize != record_size:
+        raise ValueError(f"array items aren't {record_size} bytes on this platform")
+    if sys.byteorder != "little":
+        records.byteswap()
+
+    n_positions = max((len(word) for word in index), default=0)
+    bitset_size = _padded((len(index) + 7) // 8)
+    bitsets = bytearray()
+    for position in range(n_positions):
+        for letter in index.characters:
+            bitsets += constraint_index.position_bits(position, letter).to_bytes(bitset_size, "little")
+    for letter in index.characters:
+        for copies in range(1, n_positions + 1):
+            bitsets += constraint_index.copies_bits(letter, copies).to_bytes(bitset_size, "little")
+    bodies = (asset.body, asset.gzip_body, asset.brotli_body or b"")
+
+    body = b"".join([_pad(characters), _pad(records.tobytes()), bitsets] + [_pad(data) for data in bodies])
+    header = WORD_FILE_HEADER.pack(
+        WORD_FILE_MAGIC, WORD_FILE_VERSION, index.BITS_PER_CHAR, record_size,
+        len(records), len(characters), source_digest, source_stamp, n_positions, bitset_size,
+        *(len(data) for data in bodies), asset.etag.encode("ascii"), zlib.crc32(body),
+    )
+
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".bin.tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(header)
+            f.write(body)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
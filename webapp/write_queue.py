@@ -0,0 +1,186 @@
+'''Write-behind queue that saves rows from a single writer thread per worker.
+
+Requests hand the values they worked out to submit() instead of committing
+themselves. The writer thread waits WRITE_QUEUE_INTERVAL_MS for more writes to
+arrive, folds queued writes to the same row into one, and saves the batch in a
+single transaction. A burst of guesses then costs each gunicorn worker one
+SQLite write lock and one sync per batch rather than one per request.
+
+Until a write is committed, pending_values() hands its values to readers in the
+same worker, so a player's next request sees the board they just played. The
+queue is bounded: past max_size, submit() waits for the writer to catch up and
+raises WriteQueueFull once `timeout` runs out.'''
+import atexit
+import os
+import threading
+import time
+from collections import deque
+
+from utils import logger
+
+
+class WriteQueueFull(Exception):
+    '''The queue stayed full for the whole timeout, or is shutting down'''
+
+
+class QueuedWrite:
+    '''Column values to save to one row, the values the row must still have for them
+    to apply, and callables to run in the same transaction once they do'''
+
+    def __init__(self, key, conditions, values, after=None):
+        self.key = key
+        self.conditions = dict(conditions)
+        self.values = dict(values)
+        self.after = [after] if after else []
+        # None until the writer is done with it, then whether it was committed
+        self.saved = None
+        # whether saving it raised, rather than the row no longer matching conditions
+        self.failed = False
+        self.done = threading.Event()
+
+    def merge(self, values, after=None):
+        '''Fold a later write to the same row into this one'''
+        self.values.update(values)
+        if after:
+            self.after.append(after)
+
+    def wait(self, timeout=None):
+        '''Whether the write was committed, after waiting up to timeout seconds for
+        the writer. None if it's still waiting to be written'''
+        if not self.done.wait(timeout):
+            return None
+        return self.saved
+
+
+class WriteQueue:
+    '''Bounded queue of QueuedWrites and the thread that saves them.
+
+    `apply(writes)` saves a batch in one transaction from the writer thread. It
+    sets each write's `saved`, runs the `after` callables of those that were,
+    and sets `failed` on a write that raised without giving up on the others.
+    It raises if the transaction as a whole fails. The thread is started by
+    the first submit(), so each forked gunicorn worker gets its own.'''
+
+    def __init__(self, apply, max_size=1000, interval=0.005, max_batch=200, timeout=5.0):
+        self.apply = apply
+        self.max_size = max_size
+        self.interval = interval
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self.stats = {
+            "queued": 0, "merged": 0, "batches": 0, "saved": 0,
+            "conflicts": 0, "failed": 0, "full": 0, "depth": 0,
+        }
+        self._reset()
+        # a forked worker doesn't get the parent's thread, or a usable lock
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self.condition = threading.Condition()
+        self.queue = deque()
+        self.queued = {}   # key -> the write in the queue that later writes to the row merge into
+        self.pending = {}  # key -> the row's latest write that isn't committed yet
+        self.thread = None
+        self.closing = False
+
+    def submit(self, key, conditions, values, after=None):
+        '''Queue a write to a row, merged into the one already queued for it if there is one.
+
+        `conditions` are the values the caller read the row with. If the row has an
+        uncommitted write that doesn't match them, another request got there first
+        and this returns None. Otherwise it returns the QueuedWrite to wait on.
+        Raises WriteQueueFull if the queue stays full for `timeout` seconds'''
+        deadline = time.monotonic() + self.timeout
+        with self.condition:
+            while True:
+                if self.closing:
+                    raise WriteQueueFull("the write queue is shutting down")
+                latest = self.pending.get(key)
+                if latest is not None and any(latest.values.get(column, value) != value for column, value in conditions.items()):
+                    return None
+                write = self.queued.get(key)
+                if write is not None:
+                    write.merge(values, after)
+                    self.stats["merged"] += 1
+                    return write
+                if len(self.queue) < self.max_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.stats["full"] += 1
+                    raise WriteQueueFull(f"{len(self.queue)} writes are waiting to be saved")
+                self.condition.wait(remaining)
+
+            write = QueuedWrite(key, conditions, values, after)
+            self.queue.append(write)
+            self.queued[key] = write
+            self.pending[key] = write
+            self.stats["queued"] += 1
+            self.stats["depth"] = len(self.queue)
+            self._start()
+            self.condition.notify_all()
+            return write
+
+    def pending_values(self, key):
+        '''Values of a row's latest uncommitted write, or None if it has none'''
+        if not self.pending:  # nothing queued, skip the lock
+            return None
+        with self.condition:
+            write = self.pending.get(key)
+            return dict(write.values) if write is not None else None
+
+    def close(self, timeout=None):
+        '''Save what's still queued and stop the writer thread'''
+        with self.condition:
+            self.closing = True
+            self.condition.notify_all()
+            thread = self.thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="write-queue", daemon=True)
+            self.thread.start()
+            # a worker that shuts down saves what it has queued before it exits
+            atexit.register(self.close, self.timeout)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.queue and not self.closing:
+                    self.condition.wait()
+                if not self.queue:
+                    return
+            if not self.closing:
+                # let more writes join this transaction
+                time.sleep(self.interval)
+            with self.condition:
+                batch = [self.queue.popleft() for _ in range(min(len(self.queue), self.max_batch))]
+                for write in batch:
+                    del self.queued[write.key]
+                self.stats["depth"] = len(self.queue)
+                # room for requests waiting on a full queue
+                self.condition.notify_all()
+            self._save(batch)
+
+    def _save(self, batch):
+        try:
+            self.apply(batch)
+        except Exception:
+            logger.exception("Saving %d queued writes failed", len(batch))
+            for write in batch:
+                write.saved = False
+                write.failed = True
+        saved = sum(1 for write in batch if write.saved)
+        failed = sum(1 for write in batch if write.failed)
+        self.stats["saved"] += saved
+        self.stats["failed"] += failed
+        self.stats["conflicts"] += len(batch) - saved - failed
+        self.stats["batches"] += 1
+        with self.condition:
+            for write in batch:
+                if self.pending.get(write.key) is write:
+                    del self.pending[write.key]
+        for write in batch:
+            write.done.set()
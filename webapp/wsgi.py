@@ -0,0 +1,6 @@
+'''WSGI entry point, used by gunicorn.conf.py. Equivalent to `gunicorn "app:create_app()"`
+plus loading the word lists before the first request'''
+from app import create_app, warm_up
+
+app = create_app()
+warm_up()